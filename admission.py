@@ -0,0 +1,171 @@
+"""Admission control for the expensive endpoints.
+
+Each gthread worker has only a few threads, and a request holds its thread
+for as long as it runs or waits. Without a limit, a burst of PDF downloads
+or results emails can take every thread, and the cheap pages and the health
+check queue up behind them. ``AdmissionControl.limit`` wraps such a view
+with two checks:
+
+- a token bucket per client (the client IP, or the results session when
+  ``key='session'``) that answers 429 once the client exceeds ``rate``
+  requests per second beyond a ``burst``;
+- a concurrency budget per route: ``concurrency`` requests run the view at
+  once, ``queue`` more may wait up to ``queue_timeout`` seconds for a
+  slot, and everything beyond that gets 503 straight away;
+- a budget shared by all limited routes: at most ``max_threads`` of their
+  requests, running or queued, hold a thread at once. Keep it below
+  gunicorn's ``threads`` so the other routes always find one.
+
+Both raise ``Rejected``, which carries the status and a Retry-After hint;
+the app turns it into the response. Rejections are cheap, so an overloaded
+route frees its threads quickly.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request, session
+
+
+class Rejected(Exception):
+    """Raised when a request is not admitted; carries the response status and Retry-After seconds."""
+
+    def __init__(self, route, status, retry_after, reason):
+        super().__init__(f'{route}: {reason}')
+        self.route = route
+        self.status = status
+        self.retry_after = max(1, math.ceil(retry_after))
+        self.reason = reason
+
+
+class RateLimiter:
+    """Token buckets per client key, refilled at ``rate`` tokens per second up to ``burst``."""
+
+    def __init__(self, rate, burst, max_clients=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        # key -> (tokens, last refill); least recently seen first
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key):
+        """Take a token for ``key``; return 0 if admitted, else seconds until the next token."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_clients:
+                # Forgetting an idle client only hands it a full bucket again
+                self._buckets.popitem(last=False)
+        return wait
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class ConcurrencyBudget:
+    """At most ``limit`` holders at once, with a bounded queue of waiters."""
+
+    def __init__(self, limit, queue=0, queue_timeout=1.0):
+        self.limit = limit
+        self.queue = queue
+        self.queue_timeout = queue_timeout
+        self._condition = threading.Condition()
+        self.active = 0
+        self.waiting = 0
+
+    def acquire(self):
+        """Take a slot; return False if the queue is full or the wait times out."""
+        with self._condition:
+            if self.active < self.limit:
+                self.active += 1
+                return True
+            if self.waiting >= self.queue:
+                return False
+            self.waiting += 1
+            try:
+                admitted = self._condition.wait_for(lambda: self.active < self.limit, self.queue_timeout)
+            finally:
+                self.waiting -= 1
+            if admitted:
+                self.active += 1
+            return admitted
+
+    def release(self):
+        with self._condition:
+            self.active -= 1
+            self._condition.notify()
+
+
+class AdmissionControl:
+    """Per-route concurrency budgets and per-client rate limits for Flask views."""
+
+    def __init__(self, enabled=True, key='ip', trusted_proxies=0, max_clients=10000, max_threads=None):
+        self.enabled = enabled
+        self.key = key
+        self.trusted_proxies = trusted_proxies
+        self.max_clients = max_clients
+        self.max_threads = max_threads
+        # Threads held by all limited routes together; full means 503 at once
+        self.shared = ConcurrencyBudget(max_threads) if max_threads else None
+        # route -> (ConcurrencyBudget or None, RateLimiter or None)
+        self.routes = {}
+
+    def client_key(self):
+        """The key a request's rate limit is counted against."""
+        if self.key == 'session' and session.get('results_token'):
+            return 'session:' + session['results_token']
+        # X-Forwarded-For entries added by our own proxies are trusted; the one before them is the client
+        forwarded = [address.strip() for address in request.headers.get('X-Forwarded-For', '').split(',')]
+        chain = [address for address in forwarded if address] + [request.remote_addr or '']
+        return 'ip:' + chain[max(len(chain) - 1 - self.trusted_proxies, 0)]
+
+    def check_rate(self, route):
+        """Raise ``Rejected`` (429) if the current client is over ``route``'s rate limit."""
+        limiter = self.routes[route][1]
+        if not self.enabled or limiter is None:
+            return
+        wait = limiter.take(self.client_key())
+        if wait:
+            raise Rejected(route, 429, wait, 'rate_limited')
+
+    def limit(self, route, concurrency=None, queue=0, queue_timeout=1.0, rate=None, burst=1):
+        """Decorate a view with a concurrency budget and/or a per-client rate limit.
+
+        ``rate`` is in requests per second; None or 0 disables a check.
+        """
+        budget = ConcurrencyBudget(concurrency, queue, queue_timeout) if concurrency else None
+        limiter = RateLimiter(rate, max(burst, 1), self.max_clients) if rate else None
+        self.routes[route] = (budget, limiter)
+
+        def decorator(view):
+            @wraps(view)
+            def wrapped(*args, **kwargs):
+                self.check_rate(route)
+                if not self.enabled:
+                    return view(*args, **kwargs)
+                if self.shared is not None and not self.shared.acquire():
+                    raise Rejected(route, 503, queue_timeout, 'overloaded')
+                try:
+                    if budget is None:
+                        return view(*args, **kwargs)
+                    if not budget.acquire():
+                        raise Rejected(route, 503, budget.queue_timeout, 'overloaded')
+                    try:
+                        return view(*args, **kwargs)
+                    finally:
+                        budget.release()
+                finally:
+                    if self.shared is not None:
+                        self.shared.release()
+            return wrapped
+        return decorator
@@ -1,18 +1,46 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, send_file, session
-from flask_sqlalchemy import SQLAlchemy
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, send_file, session, make_response, stream_with_context
 from flask_wtf import FlaskForm
 from wtforms import SelectMultipleField, widgets
 from wtforms.validators import ValidationError, DataRequired
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
-import pdfkit
-from flask_mail import Mail, Message
+import io
+import json
+import hashlib
+import hmac
+import click
+from sqlalchemy import select
 import tempfile
 from functools import wraps
+from itertools import chain
 import re
-import ssl
 import logging
-from logging.handlers import RotatingFileHandler
+from choices import (
+    LOVE_ACTIVITIES, LOVE_TOPICS, SKILLS_NATURAL, SKILLS_COMPLIMENTS,
+    WORLD_PROBLEMS, WORLD_IMPACT, NATURAL_ABILITIES, INNATE_STRENGTHS, CATEGORY_FIELDS
+)
+from models import db, Assessment, EmailJob, configure_sqlite, new_result_token
+import migrations
+from pdf_cache import PDFCache
+from pdf_renderer import PDFRenderer, RenderBusy
+from pdf_backends import load_backend
+from email_queue import EmailQueue
+from group_commit import GroupCommitter
+import stats
+import metrics
+import db_routing
+import log_pipeline
+import ingest
+import pdf_export
+import export
+import archive
+from results_store import ResultStore
+from page_cache import PageCache
+from smtp_pool import SMTPPool
+from admission import AdmissionControl, Rejected
+import assets
+import body_limit
+from statements import batch_statements
 
 app = Flask(__name__)
 
@@ -20,30 +48,198 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-key-change-this')
 
 # Email configuration
-app.config['MAIL_SERVER'] = 'smtp.gmail.com'
-app.config['MAIL_PORT'] = 587
-app.config['MAIL_USE_TLS'] = True
-app.config['MAIL_USE_SSL'] = False
+app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
+app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT', 587))
+app.config['MAIL_USE_TLS'] = os.environ.get('MAIL_USE_TLS', 'true').lower() == 'true'
+app.config['MAIL_USE_SSL'] = os.environ.get('MAIL_USE_SSL', 'false').lower() == 'true'
 app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME')
 app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')
 app.config['MAIL_DEFAULT_SENDER'] = os.environ.get('MAIL_DEFAULT_SENDER')
-app.config['MAIL_DEBUG'] = True  # Enable debug logging
-
-# Add SSL context configuration
-ssl_context = ssl.create_default_context()
-ssl_context.check_hostname = False
-ssl_context.verify_mode = ssl.CERT_NONE
+# Logs every SMTP exchange; for debugging delivery only
+app.config['MAIL_DEBUG'] = os.environ.get('MAIL_DEBUG', 'false').lower() == 'true'
+# Messages sent over one SMTP connection before it is reopened
+app.config['MAIL_MAX_EMAILS'] = int(os.environ.get('MAIL_MAX_EMAILS', 100))
+# Open SMTP connections kept per worker process, and for how long they are reused
+app.config['MAIL_POOL_SIZE'] = int(os.environ.get('MAIL_POOL_SIZE', 2))
+app.config['MAIL_POOL_MAX_IDLE_SECONDS'] = float(os.environ.get('MAIL_POOL_MAX_IDLE_SECONDS', 60))
+
+# Keys accepted by the JSON API (comma-separated); the API is disabled when unset
+app.config['API_KEYS'] = [key.strip() for key in os.environ.get('API_KEYS', '').split(',') if key.strip()]
+app.config['INGEST_CHUNK_SIZE'] = int(os.environ.get('INGEST_CHUNK_SIZE', 500))
+app.config['INGEST_MAX_ITEMS'] = int(os.environ.get('INGEST_MAX_ITEMS', 10000))
+# Request bodies are capped before anything parses them, chunked ones included (see body_limit.py);
+# a bulk upload is the largest legitimate body, and one assessment with every option picked is
+# about 1.1 KB of JSON
+app.config['INGEST_MAX_BYTES'] = int(os.environ.get('INGEST_MAX_BYTES', app.config['INGEST_MAX_ITEMS'] * 2048))
+app.config['MAX_CONTENT_LENGTH'] = app.config['INGEST_MAX_BYTES']
+# Rows fetched per round trip by the streaming export
+app.config['EXPORT_YIELD_PER'] = int(os.environ.get('EXPORT_YIELD_PER', 1000))
+
+# Server-side results
+app.config['RESULTS_CACHE_ITEMS'] = int(os.environ.get('RESULTS_CACHE_ITEMS', 1024))
+
+# "People like you" on the results page, from an in-memory similarity index
+app.config['SIMILARITY_INDEX'] = os.environ.get('SIMILARITY_INDEX', 'true').lower() == 'true'
+app.config['SIMILARITY_SNAPSHOT'] = os.environ.get(
+    'SIMILARITY_SNAPSHOT', os.path.join(app.instance_path, 'similarity.npz'))
+app.config['SIMILARITY_REFRESH_SECONDS'] = float(os.environ.get('SIMILARITY_REFRESH_SECONDS', 2))
+
+# Assessments older than this many days move from the assessment table into compressed
+# archive segments when `flask archive-assessments` runs
+app.config['ARCHIVE_AFTER_DAYS'] = float(os.environ.get('ARCHIVE_AFTER_DAYS', 180))
+app.config['ARCHIVE_SEGMENT_ROWS'] = int(os.environ.get('ARCHIVE_SEGMENT_ROWS', 50000))
+
+# Render the landing and assessment pages once per process
+app.config['PAGE_CACHE'] = os.environ.get('PAGE_CACHE', 'true').lower() == 'true'
+
+# Background email delivery
+app.config['EMAIL_WORKERS'] = int(os.environ.get('EMAIL_WORKERS', 2))
+app.config['EMAIL_MAX_ATTEMPTS'] = int(os.environ.get('EMAIL_MAX_ATTEMPTS', 5))
+app.config['EMAIL_BACKOFF_SECONDS'] = float(os.environ.get('EMAIL_BACKOFF_SECONDS', 5))
 
 # Database Configuration
-database_url = os.environ.get('SQLALCHEMY_DATABASE_URI', 'sqlite:///purpose_finder.db')
-if database_url.startswith('postgres://'):
-    database_url = database_url.replace('postgres://', 'postgresql://', 1)
+def database_uri(name, default=None):
+    url = os.environ.get(name, default)
+    if url and url.startswith('postgres://'):
+        url = url.replace('postgres://', 'postgresql://', 1)
+    return url
+
+database_url = database_uri('SQLALCHEMY_DATABASE_URI', 'sqlite:///purpose_finder.db')
 
 app.config['SQLALCHEMY_DATABASE_URI'] = database_url
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# SQLite durability: FULL fsyncs every commit, NORMAL only at WAL checkpoints
+app.config['SQLITE_SYNCHRONOUS'] = os.environ.get('SQLITE_SYNCHRONOUS', 'FULL').upper()
+
+# Group commit: batch assessment inserts from concurrent requests into one transaction
+app.config['GROUP_COMMIT'] = os.environ.get('GROUP_COMMIT', 'false').lower() == 'true'
+app.config['GROUP_COMMIT_MAX_BATCH'] = int(os.environ.get('GROUP_COMMIT_MAX_BATCH', 64))
+app.config['GROUP_COMMIT_MAX_WAIT_MS'] = float(os.environ.get('GROUP_COMMIT_MAX_WAIT_MS', 5))
+# Seconds a submission waits for the writer before saving its row itself
+app.config['GROUP_COMMIT_TIMEOUT'] = float(os.environ.get('GROUP_COMMIT_TIMEOUT', 10))
+
+# Connection pools per worker process, sized from gunicorn's workers and threads (gunicorn_config.py
+# reads the same variables); DB_MAX_CONNECTIONS caps the total over all workers (0: no cap)
+app.config['WEB_CONCURRENCY'] = int(os.environ.get('WEB_CONCURRENCY', 2))
+app.config['GUNICORN_THREADS'] = int(os.environ.get('GUNICORN_THREADS', 4))
+app.config['DB_MAX_CONNECTIONS'] = int(os.environ.get('DB_MAX_CONNECTIONS', 0))
+app.config['DB_POOL_TIMEOUT'] = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+app.config['DB_POOL_RECYCLE'] = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+# PostgreSQL only; SQLite waits for locks up to its busy timeout instead
+app.config['DB_STATEMENT_TIMEOUT_MS'] = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 30000))
+# Optional read replica for results lookups, analytics and exports
+app.config['SQLALCHEMY_REPLICA_URI'] = database_uri('SQLALCHEMY_REPLICA_URI')
+
+def database_engine_options(url, background_threads=0):
+    size = db_routing.pool_size(
+        app.config['WEB_CONCURRENCY'], app.config['GUNICORN_THREADS'], background_threads,
+        max_connections=app.config['DB_MAX_CONNECTIONS'])
+    return db_routing.engine_options(
+        url, size,
+        pool_timeout=app.config['DB_POOL_TIMEOUT'],
+        pool_recycle=app.config['DB_POOL_RECYCLE'],
+        statement_timeout_ms=app.config['DB_STATEMENT_TIMEOUT_MS']
+    )
+
+# Request threads plus the email workers and the group-commit writer use the primary
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = database_engine_options(
+    database_url, app.config['EMAIL_WORKERS'] + int(app.config['GROUP_COMMIT']))
+if app.config['SQLALCHEMY_REPLICA_URI']:
+    # Only request threads read from the replica
+    app.config['SQLALCHEMY_BINDS'] = {
+        db_routing.REPLICA_BIND: dict(
+            url=app.config['SQLALCHEMY_REPLICA_URI'],
+            **database_engine_options(app.config['SQLALCHEMY_REPLICA_URI'])
+        )
+    }
 
-db = SQLAlchemy(app)
-mail = Mail(app)
+# PDF cache configuration
+app.config['PDF_CACHE_DIR'] = os.environ.get(
+    'PDF_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'purpose_finder_pdf_cache'))
+app.config['PDF_CACHE_MEMORY_ITEMS'] = int(os.environ.get('PDF_CACHE_MEMORY_ITEMS', 128))
+app.config['PDF_CACHE_DISK_BYTES'] = int(os.environ.get('PDF_CACHE_DISK_BYTES', 256 * 1024 * 1024))
+
+# PDF rendering: backend ('wkhtmltopdf', 'native' or module:attribute) and limits per worker process
+app.config['PDF_BACKEND'] = os.environ.get('PDF_BACKEND', 'wkhtmltopdf')
+app.config['PDF_MAX_CONCURRENT_RENDERS'] = int(os.environ.get('PDF_MAX_CONCURRENT_RENDERS', 2))
+# In the ASGI mode waiting renders hold no threads, so more can overlap
+app.config['ASYNC_PDF_MAX_CONCURRENT_RENDERS'] = int(os.environ.get('ASYNC_PDF_MAX_CONCURRENT_RENDERS', 16))
+app.config['ASYNC_EMAIL_CONCURRENCY'] = int(os.environ.get('ASYNC_EMAIL_CONCURRENCY', 100))
+app.config['PDF_RENDER_QUEUE_TIMEOUT'] = float(os.environ.get('PDF_RENDER_QUEUE_TIMEOUT', 10))
+
+# Admission control for the expensive routes, per worker process: concurrent requests and
+# queued waiters per route, and per-client rate limits. ADMISSION_MAX_THREADS caps the threads
+# those routes hold together; it stays under gunicorn's threads so the cheap pages and
+# /healthz always find one (gunicorn_config.on_starting checks this)
+app.config['ADMISSION_CONTROL'] = os.environ.get('ADMISSION_CONTROL', 'true').lower() == 'true'
+app.config['ADMISSION_MAX_THREADS'] = int(os.environ.get(
+    'ADMISSION_MAX_THREADS', max(app.config['GUNICORN_THREADS'] - 1, 1)))
+app.config['ADMISSION_QUEUE_TIMEOUT'] = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', 1))
+app.config['PDF_ROUTE_CONCURRENCY'] = int(os.environ.get('PDF_ROUTE_CONCURRENCY', 2))
+app.config['PDF_ROUTE_QUEUE'] = int(os.environ.get('PDF_ROUTE_QUEUE', 1))
+app.config['PDF_RATE_PER_MINUTE'] = float(os.environ.get('PDF_RATE_PER_MINUTE', 12))
+app.config['PDF_RATE_BURST'] = int(os.environ.get('PDF_RATE_BURST', 6))
+app.config['EMAIL_ROUTE_CONCURRENCY'] = int(os.environ.get('EMAIL_ROUTE_CONCURRENCY', 1))
+app.config['EMAIL_ROUTE_QUEUE'] = int(os.environ.get('EMAIL_ROUTE_QUEUE', 1))
+app.config['EMAIL_RATE_PER_MINUTE'] = float(os.environ.get('EMAIL_RATE_PER_MINUTE', 6))
+app.config['EMAIL_RATE_BURST'] = int(os.environ.get('EMAIL_RATE_BURST', 3))
+# Rate limits count per client IP ('ip') or per results session, falling back to the IP ('session')
+app.config['RATE_LIMIT_KEY'] = os.environ.get('RATE_LIMIT_KEY', 'ip')
+# Proxies in front of the app whose X-Forwarded-For entries are trusted (1 on Render)
+app.config['RATE_LIMIT_TRUSTED_PROXIES'] = int(os.environ.get('RATE_LIMIT_TRUSTED_PROXIES', 0))
+
+# Logging: records go through a queue to one writer thread per process (see log_pipeline.py).
+# LOG_FILE is shared by all workers; set it empty to log to stderr only
+app.config['LOG_LEVEL'] = os.environ.get('LOG_LEVEL', 'INFO').upper()
+app.config['LOG_FORMAT'] = os.environ.get('LOG_FORMAT', 'json').lower()
+app.config['LOG_FILE'] = os.environ.get('LOG_FILE', os.path.join(os.path.dirname(__file__), 'logs', 'ikigai_app.log'))
+app.config['LOG_MAX_BYTES'] = int(os.environ.get('LOG_MAX_BYTES', 10 * 1024 * 1024))
+app.config['LOG_BACKUP_COUNT'] = int(os.environ.get('LOG_BACKUP_COUNT', 5))
+# Records waiting for the writer; beyond this they are dropped (and counted) rather than block a request
+app.config['LOG_QUEUE_SIZE'] = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+# Fraction of DEBUG and INFO records kept, and of requests whose access line is kept;
+# errors, 5xx responses and requests slower than LOG_SLOW_REQUEST_MS are always logged
+app.config['LOG_SAMPLE_DEBUG'] = float(os.environ.get('LOG_SAMPLE_DEBUG', 0.1))
+app.config['LOG_SAMPLE_INFO'] = float(os.environ.get('LOG_SAMPLE_INFO', 1.0))
+app.config['LOG_SAMPLE_REQUESTS'] = float(os.environ.get('LOG_SAMPLE_REQUESTS', 0.1))
+app.config['LOG_SLOW_REQUEST_MS'] = float(os.environ.get('LOG_SLOW_REQUEST_MS', 1000))
+
+db.init_app(app)
+db_routing.init_app(app, db)
+metrics.init_app(app)
+body_limit.init_app(app)
+log_pipeline.init_app(app, slow_request_ms=app.config['LOG_SLOW_REQUEST_MS'])
+asset_manifest = assets.init_app(app)
+page_cache = PageCache(enabled=app.config['PAGE_CACHE'])
+with app.app_context():
+    configure_sqlite(db.engine, synchronous=app.config['SQLITE_SYNCHRONOUS'])
+group_committer = GroupCommitter(
+    app, db, Assessment,
+    max_batch=app.config['GROUP_COMMIT_MAX_BATCH'],
+    max_wait=app.config['GROUP_COMMIT_MAX_WAIT_MS'] / 1000,
+    timeout=app.config['GROUP_COMMIT_TIMEOUT']
+) if app.config['GROUP_COMMIT'] else None
+pdf_cache = PDFCache(
+    app.config['PDF_CACHE_DIR'],
+    memory_items=app.config['PDF_CACHE_MEMORY_ITEMS'],
+    disk_max_bytes=app.config['PDF_CACHE_DISK_BYTES'],
+    namespace=app.config['PDF_BACKEND']
+)
+pdf_renderer = PDFRenderer(
+    load_backend(
+        app.config['PDF_BACKEND'],
+        render_html=lambda results: render_template('pdf_template.html', results=results)
+    ),
+    max_concurrent=app.config['PDF_MAX_CONCURRENT_RENDERS'],
+    queue_timeout=app.config['PDF_RENDER_QUEUE_TIMEOUT'],
+    max_concurrent_async=app.config['ASYNC_PDF_MAX_CONCURRENT_RENDERS']
+)
+admission = AdmissionControl(
+    enabled=app.config['ADMISSION_CONTROL'],
+    key=app.config['RATE_LIMIT_KEY'],
+    trusted_proxies=app.config['RATE_LIMIT_TRUSTED_PROXIES'],
+    max_threads=app.config['ADMISSION_MAX_THREADS']
+)
 
 # Custom validator for minimum selections
 def at_least_one_required(form, field):
@@ -55,79 +251,6 @@ class MultiCheckboxField(SelectMultipleField):
     widget = widgets.ListWidget(prefix_label=False)
     option_widget = widgets.CheckboxInput()
 
-# Assessment options
-LOVE_ACTIVITIES = [
-    ('creative_expression', 'Creative Expression'),
-    ('physical_activity', 'Physical Activity'),
-    ('learning_discovery', 'Learning & Discovery'),
-    ('helping_others', 'Helping Others'),
-    ('nature_outdoors', 'Nature & Outdoors'),
-    ('tech_innovation', 'Technology & Innovation')
-]
-
-LOVE_TOPICS = [
-    ('arts_culture', 'Arts & Culture'),
-    ('social_connection', 'Social Connection'),
-    ('problem_solving', 'Problem Solving'),
-    ('music_sound', 'Music & Sound'),
-    ('writing_communication', 'Writing & Communication'),
-    ('personal_growth', 'Personal Growth')
-]
-
-SKILLS_NATURAL = [
-    ('leadership', 'Leadership'),
-    ('analysis', 'Analysis'),
-    ('communication', 'Communication'),
-    ('creativity', 'Creativity'),
-    ('technical', 'Technical Skills'),
-    ('organization', 'Organization')
-]
-
-SKILLS_COMPLIMENTS = [
-    ('problem_solving', 'Problem Solving'),
-    ('teaching', 'Teaching'),
-    ('empathy', 'Empathy'),
-    ('strategic_thinking', 'Strategic Thinking'),
-    ('adaptability', 'Adaptability'),
-    ('innovation', 'Innovation')
-]
-
-WORLD_PROBLEMS = [
-    ('environmental', 'Environmental Protection'),
-    ('education', 'Education Access'),
-    ('healthcare', 'Healthcare Innovation'),
-    ('social_justice', 'Social Justice'),
-    ('mental_health', 'Mental Health Support'),
-    ('tech_access', 'Technology Access')
-]
-
-WORLD_IMPACT = [
-    ('food_security', 'Food Security'),
-    ('economic_equality', 'Economic Equality'),
-    ('clean_energy', 'Clean Energy'),
-    ('community_building', 'Community Building'),
-    ('digital_privacy', 'Digital Privacy'),
-    ('sustainable_living', 'Sustainable Living')
-]
-
-NATURAL_ABILITIES = [
-    ('tech_development', 'Technology Development'),
-    ('healthcare_services', 'Healthcare Services'),
-    ('education_training', 'Education & Training'),
-    ('business_consulting', 'Business Consulting'),
-    ('creative_services', 'Creative Services'),
-    ('research_analysis', 'Research & Analysis')
-]
-
-INNATE_STRENGTHS = [
-    ('project_management', 'Project Management'),
-    ('social_services', 'Social Services'),
-    ('environmental_work', 'Environmental Work'),
-    ('content_creation', 'Content Creation'),
-    ('financial_services', 'Financial Services'),
-    ('entrepreneurship', 'Entrepreneurship')
-]
-
 # Form Class
 class AssessmentForm(FlaskForm):
     # What You Love
@@ -166,168 +289,84 @@ class AssessmentForm(FlaskForm):
         choices=INNATE_STRENGTHS,
         validators=[at_least_one_required])
 
-# Database Models
-class Assessment(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
-    love_activities = db.Column(db.Text)
-    love_topics = db.Column(db.Text)
-    skills_natural = db.Column(db.Text)
-    skills_compliments = db.Column(db.Text)
-    world_problems = db.Column(db.Text)
-    world_impact = db.Column(db.Text)
-    natural_abilities = db.Column(db.Text)
-    innate_strengths = db.Column(db.Text)
-
-# Initialize database before first request
-@app.before_first_request
-def init_db():
-    with app.app_context():
-        # Drop all tables to handle renamed columns
-        db.drop_all()
-        # Create all tables with new schema
-        db.create_all()
+# Schema setup happens before serving (flask migrate / gunicorn on_starting), not here
+@app.before_request
+def start_background_workers():
+    # Pick up any email jobs left over from previous workers; a no-op once running
+    email_queue.start()
+
+@app.route('/healthz')
+def healthz():
+    """Liveness check; touches neither the database nor the session."""
+    return 'ok', 200, {'Content-Type': 'text/plain', 'Cache-Control': 'no-store'}
 
 @app.route('/')
 def index():
-    form = AssessmentForm()
-    return render_template('index.html', form=form)
+    return page_cache.render('index', lambda: render_template('index.html', form=AssessmentForm()))
 
 @app.route('/assessment', methods=['GET', 'POST'])
 def assessment():
-    form = AssessmentForm()
+    if request.method != 'POST':
+        # The empty form is the same for everyone apart from its CSRF token
+        return page_cache.render('assessment', lambda: render_template('assessment.html', form=AssessmentForm()))
     
-    if request.method == 'POST':
-        if form.validate_on_submit():
-            try:
-                # Get selected values
-                love_activities = form.love_activities.data if form.love_activities.data else []
-                love_topics = form.love_topics.data if form.love_topics.data else []
-                skills_natural = form.skills_natural.data if form.skills_natural.data else []
-                skills_compliments = form.skills_compliments.data if form.skills_compliments.data else []
-                world_problems = form.world_problems.data if form.world_problems.data else []
-                world_impact = form.world_impact.data if form.world_impact.data else []
-                natural_abilities = form.natural_abilities.data if form.natural_abilities.data else []
-                innate_strengths = form.innate_strengths.data if form.innate_strengths.data else []
-                
-                # Create new assessment
-                assessment = Assessment(
-                    love_activities=','.join(love_activities),
-                    love_topics=','.join(love_topics),
-                    skills_natural=','.join(skills_natural),
-                    skills_compliments=','.join(skills_compliments),
-                    world_problems=','.join(world_problems),
-                    world_impact=','.join(world_impact),
-                    natural_abilities=','.join(natural_abilities),
-                    innate_strengths=','.join(innate_strengths)
-                )
-                
-                # Save to database
+    form = AssessmentForm()
+    if form.validate_on_submit():
+        try:
+            # Get selected values
+            love_activities = form.love_activities.data if form.love_activities.data else []
+            love_topics = form.love_topics.data if form.love_topics.data else []
+            skills_natural = form.skills_natural.data if form.skills_natural.data else []
+            skills_compliments = form.skills_compliments.data if form.skills_compliments.data else []
+            world_problems = form.world_problems.data if form.world_problems.data else []
+            world_impact = form.world_impact.data if form.world_impact.data else []
+            natural_abilities = form.natural_abilities.data if form.natural_abilities.data else []
+            innate_strengths = form.innate_strengths.data if form.innate_strengths.data else []
+            
+            # Create new assessment, storing each category as a bitmask
+            assessment = Assessment.from_selections({
+                'love_activities': love_activities,
+                'love_topics': love_topics,
+                'skills_natural': skills_natural,
+                'skills_compliments': skills_compliments,
+                'world_problems': world_problems,
+                'world_impact': world_impact,
+                'natural_abilities': natural_abilities,
+                'innate_strengths': innate_strengths
+            }, token=new_result_token(), timestamp=datetime.utcnow())
+            
+            if group_committer is not None:
+                # Blocks until the batch holding this row has committed
+                group_committer.submit(assessment)
+            else:
+                # Save to database, updating the analytics counters in the same transaction
                 db.session.add(assessment)
+                stats.record_assessment(assessment.masks)
                 db.session.commit()
-                
-                # Get display values for results
-                love_activities_display = [dict(LOVE_ACTIVITIES).get(x, '') for x in love_activities]
-                love_topics_display = [dict(LOVE_TOPICS).get(x, '') for x in love_topics]
-                skills_natural_display = [dict(SKILLS_NATURAL).get(x, '') for x in skills_natural]
-                skills_compliments_display = [dict(SKILLS_COMPLIMENTS).get(x, '') for x in skills_compliments]
-                world_problems_display = [dict(WORLD_PROBLEMS).get(x, '') for x in world_problems]
-                world_impact_display = [dict(WORLD_IMPACT).get(x, '') for x in world_impact]
-                natural_abilities_display = [dict(NATURAL_ABILITIES).get(x, '') for x in natural_abilities]
-                innate_strengths_display = [dict(INNATE_STRENGTHS).get(x, '') for x in innate_strengths]
-                
-                # Process results
-                results = {
-                    'love_activities': love_activities_display,
-                    'love_topics': love_topics_display,
-                    'skills_natural': skills_natural_display,
-                    'skills_compliments': skills_compliments_display,
-                    'world_problems': world_problems_display,
-                    'world_impact': world_impact_display,
-                    'natural_abilities': natural_abilities_display,
-                    'innate_strengths': innate_strengths_display,
-                    'timestamp': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
-                    'passion_emotion': '',  
-                    'mission_emotion': '',
-                    'profession_emotion': '',
-                    'vocation_emotion': ''
-                }
-                
-                # Generate purpose statement
-                results['purpose_statement'] = generate_purpose_statement(
-                    love_activities_display,
-                    love_topics_display,
-                    skills_natural_display,
-                    skills_compliments_display,
-                    world_problems_display,
-                    world_impact_display,
-                    natural_abilities_display,
-                    innate_strengths_display
-                )
-                
-                session['assessment_results'] = results
-                
-                return render_template('results.html', results=results)
-                
-            except Exception as e:
-                db.session.rollback()
-                print(f'Error details: {str(e)}')  
-                flash(f'Error saving assessment: {str(e)}', 'error')
-                return render_template('assessment.html', form=form)
-        else:
-            # Form validation failed
-            for field, errors in form.errors.items():
-                for error in errors:
-                    flash(f'{getattr(form, field).label.text}: {error}', 'error')
+            
+            remember_similar(assessment.id, assessment.masks)
+            
+            # Keep results server-side; the session only carries the share token
+            result_store.remember(assessment)
+            session.pop('assessment_results', None)
+            session['results_token'] = assessment.token
+            
+            return redirect(url_for('results', token=assessment.token), code=303)
+            
+        except Exception as e:
+            db.session.rollback()
+            app.logger.exception('Error saving assessment')
+            flash(f'Error saving assessment: {str(e)}', 'error')
             return render_template('assessment.html', form=form)
-    
-    # GET request - show empty form
-    return render_template('assessment.html', form=form)
-
-def generate_purpose_statement(
-    love_activities,
-    love_topics,
-    skills_natural,
-    skills_compliments,
-    world_problems,
-    world_impact,
-    natural_abilities,
-    innate_strengths
-):
-    """Generate a personalized purpose statement based on assessment choices."""
-    
-    # Ensure all inputs are lists and not None
-    love_activities = love_activities if isinstance(love_activities, list) and love_activities else ['your interests']
-    skills_natural = skills_natural if isinstance(skills_natural, list) and skills_natural else ['your abilities']
-    world_problems = world_problems if isinstance(world_problems, list) and world_problems else ['global challenges']
-    natural_abilities = natural_abilities if isinstance(natural_abilities, list) and natural_abilities else ['your work']
-    
-    # Create personalized statement components
-    passion = f"Your passion lies in {' and '.join(love_activities[:2])}"
-    mission = f"You have natural talents in {' and '.join(skills_natural[:2])}"
-    vision = f"You're driven to address {' and '.join(world_problems[:2])}"
-    profession = f"You can create value through {' and '.join(natural_abilities[:2])}"
-    
-    # Combine into final statement
-    purpose_statement = f"""Your Ikigai reveals a unique and meaningful path: {passion}. 
-    {mission}, while {vision.lower()}. 
-    {profession}, bringing together your talents and the world's needs.
-    
-    This powerful combination suggests you could thrive in roles that combine your love for {love_activities[0].lower()} 
-    with your natural {skills_natural[0].lower()}, 
-    while addressing {world_problems[0].lower()} 
-    through {natural_abilities[0].lower()}.
-    
-    Consider exploring career paths or projects that allow you to:
-    1. Use your passion for {love_activities[0].lower()} to inspire and engage others
-    2. Apply your {skills_natural[0].lower()} to solve real-world challenges
-    3. Make a difference in {world_problems[0].lower()}
-    4. Create value through {natural_abilities[0].lower()}"""
-    
-    return purpose_statement
-
-def generate_pdf(results):
-    """Generate a PDF file from the results."""
+    else:
+        # Form validation failed
+        for field, errors in form.errors.items():
+            for error in errors:
+                flash(f'{getattr(form, field).label.text}: {error}', 'error')
+        return render_template('assessment.html', form=form)
+
+def build_safe_results(results):
+    """Normalize a results dict into the string-only form used by PDFs and emails."""
     # Ensure all values are converted to strings and have default values
     safe_results = {
         'love_activities': results.get('love_activities', []),
@@ -350,241 +389,497 @@ def generate_pdf(results):
         if isinstance(value, list):
             safe_results[key] = ', '.join(value) if value else 'None selected'
     
-    # Create a temporary HTML file with the results
-    with tempfile.NamedTemporaryFile(suffix='.html', delete=False) as f:
-        html_content = render_template('pdf_template.html', results=safe_results)
-        f.write(html_content.encode('utf-8'))
-        temp_html = f.name
-
-    # Generate PDF from the HTML
-    pdf_file = tempfile.NamedTemporaryFile(suffix='.pdf', delete=False)
-    pdfkit.from_file(temp_html, pdf_file.name)
+    return safe_results
+
+@metrics.timed('generate_pdf')
+def generate_pdf(results):
+    """Generate a PDF from the results and return its bytes."""
+    safe_results = build_safe_results(results)
+    return pdf_renderer.render(safe_results)
+
+def get_results_pdf(results):
+    """Return PDF bytes for the results, rendering only on a cache miss."""
+    safe_results = build_safe_results(results)
+    return pdf_cache.get_or_render(safe_results, generate_pdf)
+
+def build_results_message(email, results, pdf_data=None):
+    """Build the results email, with the PDF attached, for the given address."""
+    from flask_mail import Message
+    safe_results = build_safe_results(results)
+    
+    # Create message
+    msg = Message(
+        'Your Ikigai Purpose Discovery Results',
+        recipients=[email],
+        sender=app.config['MAIL_DEFAULT_SENDER']
+    )
+    msg.body = f"""
+    Thank you for completing the Ikigai Purpose Discovery assessment!
+    
+    Purpose Statement:
+    {safe_results['purpose_statement']}
     
-    # Clean up the temporary HTML file
-    os.unlink(temp_html)
+    Key Insights:
+    - Love Activities: {safe_results['love_activities']}
+    - Love Topics: {safe_results['love_topics']}
+    - Natural Skills: {safe_results['skills_natural']}
+    - Complimented Skills: {safe_results['skills_compliments']}
+    - World Problems: {safe_results['world_problems']}
+    - Impact Areas: {safe_results['world_impact']}
+    - Natural Abilities: {safe_results['natural_abilities']}
+    - Innate Strengths: {safe_results['innate_strengths']}
     
-    return pdf_file.name
+    Emotional Dimensions:
+    - Passion Emotion: {safe_results['passion_emotion']}
+    - Mission Emotion: {safe_results['mission_emotion']}
+    - Profession Emotion: {safe_results['profession_emotion']}
+    - Vocation Emotion: {safe_results['vocation_emotion']}
+    
+    Please find your personalized results attached to this email.
+    
+    Best regards,
+    The Ikigai Purpose Discovery Team
+    """
+    
+    # Generate PDF unless the caller already has it
+    if pdf_data is None:
+        pdf_data = get_results_pdf(safe_results)
+    
+    # Attach PDF
+    msg.attach(
+        filename='ikigai_results.pdf', 
+        content_type='application/pdf', 
+        data=pdf_data
+    )
+    
+    return msg
+
+_mail_pool = None
+
+def get_mail_pool():
+    """The SMTP connection pool, created on first use so startup does not import Flask-Mail."""
+    global _mail_pool
+    if _mail_pool is None:
+        from flask_mail import Mail
+        _mail_pool = SMTPPool(
+            Mail(app),
+            size=app.config['MAIL_POOL_SIZE'],
+            max_idle=app.config['MAIL_POOL_MAX_IDLE_SECONDS']
+        )
+    return _mail_pool
+
+def send_message(msg):
+    """Send a prepared message over a pooled SMTP connection."""
+    with metrics.timed('mail.send'):
+        get_mail_pool().send(msg)
 
 def send_results_email(email, results):
-    """Send results to the specified email address."""
+    """Send results to the specified email address immediately."""
     try:
-        # Ensure all values are converted to strings and have default values
-        safe_results = {
-            'love_activities': results.get('love_activities', []),
-            'love_topics': results.get('love_topics', []),
-            'skills_natural': results.get('skills_natural', []),
-            'skills_compliments': results.get('skills_compliments', []),
-            'world_problems': results.get('world_problems', []),
-            'world_impact': results.get('world_impact', []),
-            'natural_abilities': results.get('natural_abilities', []),
-            'innate_strengths': results.get('innate_strengths', []),
-            'purpose_statement': results.get('purpose_statement', 'No purpose statement generated.'),
-            'passion_emotion': results.get('passion_emotion', 'Undefined'),
-            'mission_emotion': results.get('mission_emotion', 'Undefined'),
-            'profession_emotion': results.get('profession_emotion', 'Undefined'),
-            'vocation_emotion': results.get('vocation_emotion', 'Undefined')
-        }
-        
-        # Convert lists to comma-separated strings for better readability
-        for key, value in safe_results.items():
-            if isinstance(value, list):
-                safe_results[key] = ', '.join(value) if value else 'None selected'
-        
-        # Create message
-        msg = Message(
-            'Your Ikigai Purpose Discovery Results',
-            recipients=[email],
-            sender=app.config['MAIL_DEFAULT_SENDER']
-        )
-        msg.body = f"""
-        Thank you for completing the Ikigai Purpose Discovery assessment!
-        
-        Purpose Statement:
-        {safe_results['purpose_statement']}
-        
-        Key Insights:
-        - Love Activities: {safe_results['love_activities']}
-        - Love Topics: {safe_results['love_topics']}
-        - Natural Skills: {safe_results['skills_natural']}
-        - Complimented Skills: {safe_results['skills_compliments']}
-        - World Problems: {safe_results['world_problems']}
-        - Impact Areas: {safe_results['world_impact']}
-        - Natural Abilities: {safe_results['natural_abilities']}
-        - Innate Strengths: {safe_results['innate_strengths']}
-        
-        Emotional Dimensions:
-        - Passion Emotion: {safe_results['passion_emotion']}
-        - Mission Emotion: {safe_results['mission_emotion']}
-        - Profession Emotion: {safe_results['profession_emotion']}
-        - Vocation Emotion: {safe_results['vocation_emotion']}
-        
-        Please find your personalized results attached to this email.
-        
-        Best regards,
-        The Ikigai Purpose Discovery Team
-        """
-        
-        # Generate PDF
-        pdf_path = generate_pdf(safe_results)
-        
-        # Attach PDF
-        with open(pdf_path, 'rb') as f:
-            msg.attach(
-                filename='ikigai_results.pdf', 
-                content_type='application/pdf', 
-                data=f.read()
-            )
+        msg = build_results_message(email, results)
         
         # Send email with enhanced error handling
         try:
-            mail.send(msg)
-            print(f"Email sent successfully to {email}")
-            
-            # Clean up PDF file
-            os.unlink(pdf_path)
-            
+            send_message(msg)
+            app.logger.info('Results email sent')
             return True
-        except Exception as send_error:
-            print(f"Detailed email sending error: {send_error}")
-            # Log the full error traceback
-            import traceback
-            traceback.print_exc()
+        except Exception:
+            app.logger.exception('Error sending results email')
             return False
     
-    except Exception as e:
-        print(f"Error preparing email: {e}")
-        # Log the full error traceback
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        app.logger.exception('Error preparing email')
         return False
 
+email_queue = EmailQueue(app, db, EmailJob, build_results_message, send_message)
+
+def template_version(*names):
+    """Short hash of template sources, so cached pages change when templates do."""
+    digest = hashlib.sha1()
+    for name in names:
+        source, _, _ = app.jinja_loader.get_source(app.jinja_env, name)
+        digest.update(source.encode('utf-8'))
+    return digest.hexdigest()[:12]
+
+result_store = ResultStore(
+    max_items=app.config['RESULTS_CACHE_ITEMS'],
+    # Built asset URLs are part of the page too
+    version=template_version('base.html', 'results.html') + json.dumps(asset_manifest, sort_keys=True)
+)
+
+_similarity_index = None
+
+def get_similarity_index():
+    """The similarity index, created on first use so startup does not import NumPy."""
+    global _similarity_index
+    if _similarity_index is None:
+        from similarity import SimilarityIndex
+        _similarity_index = SimilarityIndex(
+            snapshot_path=app.config['SIMILARITY_SNAPSHOT'],
+            refresh_interval=app.config['SIMILARITY_REFRESH_SECONDS']
+        )
+    return _similarity_index
+
+def remember_similar(assessment_id, masks):
+    """Make a saved assessment searchable, if this process has an index yet."""
+    if _similarity_index is not None:
+        _similarity_index.add(assessment_id, masks)
+
+def find_people_like_you(entry):
+    """Summary of the profiles most similar to ``entry``, or None."""
+    if not app.config['SIMILARITY_INDEX']:
+        return None
+    try:
+        return get_similarity_index().people_like_you(entry.id, entry.masks)
+    except Exception:
+        # The section is optional; never fail the results page over it
+        app.logger.exception('Similarity lookup failed')
+        return None
+
+def current_results():
+    """Stored results for the share token in the request or the session, or None."""
+    token = request.args.get('token') or session.get('results_token')
+    return result_store.get(token)
+
+@app.route('/results', defaults={'token': None})
+@app.route('/results/<token>')
+def results(token):
+    """Show stored results; the URL can be shared and is HTTP-cacheable."""
+    if token is None:
+        token = session.get('results_token')
+        if not token:
+            flash('Please complete the assessment to see your results.', 'error')
+            return redirect(url_for('assessment'))
+        return redirect(url_for('results', token=token))
+    
+    entry = result_store.get(token)
+    if entry is None:
+        return render_template('index.html'), 404
+    
+    response = make_response()
+    # Pages carrying flashed messages are one-offs and must not be revalidated
+    if '_flashes' not in session:
+        response.set_etag(entry.etag)
+        response.last_modified = entry.last_modified
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        response.make_conditional(request)
+        if response.status_code == 304:
+            return response
+    
+    # The "people like you" section is not part of the ETag; a revalidated page may show an older one
+    response.set_data(render_template('results.html', results=entry.results, token=entry.token,
+                                      people_like_you=find_people_like_you(entry)))
+    return response
+
+def pdf_download_response(pdf_data):
+    """Response that downloads the results PDF."""
+    return send_file(
+        io.BytesIO(pdf_data), 
+        mimetype='application/pdf', 
+        as_attachment=True, 
+        download_name='ikigai_results.pdf'
+    )
+
+def render_busy_response():
+    """503 asking the client to retry once a render slot may be free."""
+    response = make_response('The PDF service is busy. Please try again in a moment.', 503)
+    response.headers['Retry-After'] = str(int(app.config['PDF_RENDER_QUEUE_TIMEOUT']))
+    return response
+
+@app.errorhandler(Rejected)
+def admission_rejected(e):
+    """Fast 429/503 for a request turned away by admission control."""
+    if e.status == 429:
+        message = 'Too many requests. Please wait a moment and try again.'
+    else:
+        message = 'The server is busy. Please try again in a moment.'
+    if request.is_json:
+        response = jsonify(success=False, message=message)
+    else:
+        response = make_response(message)
+    response.status_code = e.status
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
 @app.route('/download_pdf')
+@admission.limit(
+    'download_pdf',
+    concurrency=app.config['PDF_ROUTE_CONCURRENCY'],
+    queue=app.config['PDF_ROUTE_QUEUE'],
+    queue_timeout=app.config['ADMISSION_QUEUE_TIMEOUT'],
+    rate=app.config['PDF_RATE_PER_MINUTE'] / 60,
+    burst=app.config['PDF_RATE_BURST']
+)
 def download_pdf():
     """Generate and download PDF of results."""
     try:
-        # Retrieve results from the session
-        results = session.get('assessment_results', {})
-        
-        # Ensure all values are converted to strings and have default values
-        safe_results = {
-            'love_activities': results.get('love_activities', []),
-            'love_topics': results.get('love_topics', []),
-            'skills_natural': results.get('skills_natural', []),
-            'skills_compliments': results.get('skills_compliments', []),
-            'world_problems': results.get('world_problems', []),
-            'world_impact': results.get('world_impact', []),
-            'natural_abilities': results.get('natural_abilities', []),
-            'innate_strengths': results.get('innate_strengths', []),
-            'purpose_statement': results.get('purpose_statement', 'No purpose statement generated.'),
-            'passion_emotion': results.get('passion_emotion', 'Undefined'),
-            'mission_emotion': results.get('mission_emotion', 'Undefined'),
-            'profession_emotion': results.get('profession_emotion', 'Undefined'),
-            'vocation_emotion': results.get('vocation_emotion', 'Undefined')
-        }
+        entry = current_results()
+        if entry is None:
+            return redirect(url_for('results'))
         
-        # Convert lists to comma-separated strings for better readability
-        for key, value in safe_results.items():
-            if isinstance(value, list):
-                safe_results[key] = ', '.join(value) if value else 'None selected'
+        safe_results = build_safe_results(entry.results)
         
         # Generate PDF
-        pdf_path = generate_pdf(safe_results)
+        pdf_data = get_results_pdf(safe_results)
         
         # Send the PDF file
-        return send_file(
-            pdf_path, 
-            mimetype='application/pdf', 
-            as_attachment=True, 
-            download_name='ikigai_results.pdf'
-        )
-    except Exception as e:
-        print(f"Error generating PDF: {e}")
+        return pdf_download_response(pdf_data)
+    except RenderBusy:
+        return render_busy_response()
+    except Exception:
+        app.logger.exception('Error generating PDF')
         flash('Error generating PDF. Please try again.', 'error')
         return redirect(url_for('results'))
 
 @app.route('/email_results', methods=['POST'])
+@admission.limit(
+    'email_results',
+    concurrency=app.config['EMAIL_ROUTE_CONCURRENCY'],
+    queue=app.config['EMAIL_ROUTE_QUEUE'],
+    queue_timeout=app.config['ADMISSION_QUEUE_TIMEOUT'],
+    rate=app.config['EMAIL_RATE_PER_MINUTE'] / 60,
+    burst=app.config['EMAIL_RATE_BURST']
+)
 def email_results():
-    """Email results to the specified address."""
+    """Queue an email of the results to the specified address."""
+    # Get email (and optionally the share token) from the JSON body or form;
+    # outside the try so an oversized body still gets its 413
+    data = request.get_json(silent=True) or request.form
     try:
-        # Retrieve results from the session
-        results = session.get('assessment_results', {})
+        email = data.get('email')
         
-        # Get email from form
-        email = request.form.get('email')
+        # Retrieve the stored results
+        entry = result_store.get(data.get('token') or session.get('results_token'))
+        if entry is None:
+            return jsonify(success=False, message='No results to send. Please take the assessment first.'), 400
         
         # Validate email
         if not email or not re.match(r"[^@]+@[^@]+\.[^@]+", email):
-            flash('Invalid email address', 'error')
-            return redirect(url_for('results'))
-        
-        # Ensure all values are converted to strings and have default values
-        safe_results = {
-            'love_activities': results.get('love_activities', []),
-            'love_topics': results.get('love_topics', []),
-            'skills_natural': results.get('skills_natural', []),
-            'skills_compliments': results.get('skills_compliments', []),
-            'world_problems': results.get('world_problems', []),
-            'world_impact': results.get('world_impact', []),
-            'natural_abilities': results.get('natural_abilities', []),
-            'innate_strengths': results.get('innate_strengths', []),
-            'purpose_statement': results.get('purpose_statement', 'No purpose statement generated.'),
-            'passion_emotion': results.get('passion_emotion', 'Undefined'),
-            'mission_emotion': results.get('mission_emotion', 'Undefined'),
-            'profession_emotion': results.get('profession_emotion', 'Undefined'),
-            'vocation_emotion': results.get('vocation_emotion', 'Undefined')
-        }
+            return jsonify(success=False, message='Invalid email address'), 400
         
-        # Convert lists to comma-separated strings for better readability
-        for key, value in safe_results.items():
-            if isinstance(value, list):
-                safe_results[key] = ', '.join(value) if value else 'None selected'
+        safe_results = build_safe_results(entry.results)
         
-        # Send email
-        if send_results_email(email, safe_results):
-            flash('Results sent to your email successfully!', 'success')
-        else:
-            flash('Failed to send email. Please try again.', 'error')
-        
-        return redirect(url_for('results'))
+        # Hand off to the background delivery workers
+        job_id = email_queue.enqueue(email, safe_results)
+        status_url = url_for('email_status', job_id=job_id)
+        response = jsonify(success=True, job_id=job_id, status='queued', status_url=status_url)
+        response.status_code = 202
+        response.headers['Location'] = status_url
+        return response
     
-    except Exception as e:
-        print(f"Error emailing results: {e}")
-        flash('An unexpected error occurred. Please try again.', 'error')
-        return redirect(url_for('results'))
-
-# Configure logging
-def setup_logging():
-    # Create logs directory if it doesn't exist
-    log_dir = os.path.join(os.path.dirname(__file__), 'logs')
-    os.makedirs(log_dir, exist_ok=True)
+    except Exception:
+        db.session.rollback()
+        app.logger.exception('Error emailing results')
+        return jsonify(success=False, message='An unexpected error occurred. Please try again.'), 500
+
+@app.route('/email_results/<job_id>')
+def email_status(job_id):
+    """Report the delivery progress of a queued results email."""
+    report = email_queue.status(job_id)
+    if report is None:
+        return jsonify(success=False, message='Unknown email job'), 404
+    return jsonify(report)
+
+def require_api_key(view):
+    """Only allow requests that present one of the configured API keys."""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        keys = app.config['API_KEYS']
+        if not keys:
+            return jsonify(success=False, message='API access is not configured.'), 403
+        presented = request.headers.get('X-API-Key', '')
+        auth = request.headers.get('Authorization', '')
+        if auth.startswith('Bearer '):
+            presented = auth[len('Bearer '):]
+        if not any(hmac.compare_digest(presented.encode(), key.encode()) for key in keys):
+            return jsonify(success=False, message='Invalid or missing API key.'), 401
+        return view(*args, **kwargs)
+    return wrapped
+
+@app.route('/api/assessments', methods=['POST'])
+@require_api_key
+def api_ingest_assessments():
+    """Bulk-create assessments from a JSON array or an NDJSON stream."""
+    limit = app.config['MAX_CONTENT_LENGTH']
+    if request.content_length is None:
+        # body_limit gives chunked bodies a length, so this body has no end we could trust
+        return jsonify(success=False, message='Send a Content-Length or a chunked body.'), 411
+    # Read one byte past the cap in case the declared length is wrong
+    body = request.stream.read(limit + 1) if request.content_length <= limit else b''
+    if request.content_length > limit or len(body) > limit:
+        return jsonify(success=False, message=f'Request body exceeds {limit} bytes; '
+                                              f"send at most {app.config['INGEST_MAX_ITEMS']} assessments per upload."), 413
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        items = ingest.parse_ndjson(io.BytesIO(body))
+    else:
+        try:
+            items = json.loads(body) if request.is_json else None
+        except ValueError:
+            items = None
+        if not isinstance(items, list):
+            return jsonify(success=False, message='Expected a JSON array of assessments or an NDJSON body.'), 400
     
-    # Configure logging to file
-    log_file = os.path.join(log_dir, 'ikigai_app.log')
-    file_handler = RotatingFileHandler(
-        log_file, 
-        maxBytes=1024 * 1024 * 10,  # 10 MB
-        backupCount=5
-    )
-    file_handler.setLevel(logging.DEBUG)
-    file_formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    reports, inserted, failed = ingest.ingest(
+        items,
+        chunk_size=app.config['INGEST_CHUNK_SIZE'],
+        max_items=app.config['INGEST_MAX_ITEMS'],
+        on_saved=remember_similar
     )
-    file_handler.setFormatter(file_formatter)
-    
-    # Configure console logging
-    console_handler = logging.StreamHandler()
-    console_handler.setLevel(logging.INFO)
-    console_formatter = logging.Formatter('%(levelname)s: %(message)s')
-    console_handler.setFormatter(console_formatter)
+    for report in reports:
+        if 'token' in report:
+            report['results_url'] = url_for('results', token=report['token'], _external=True)
+    return jsonify(success=failed == 0, inserted=inserted, failed=failed, results=reports)
+
+def timestamp_arg(name):
+    """Parse an optional ISO 8601 query argument; raises ValueError."""
+    value = request.args.get(name)
+    return ingest.parse_timestamp(value) if value else None
+
+@app.route('/export')
+@require_api_key
+def export_assessments():
+    """Stream assessments, optionally limited to [since, until), as NDJSON or CSV."""
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in export.FORMATS:
+        return jsonify(success=False, message=f"format must be one of: {', '.join(export.FORMATS)}"), 400
+    try:
+        since, until = timestamp_arg('since'), timestamp_arg('until')
+    except ValueError:
+        return jsonify(success=False, message='since and until must be ISO 8601 dates or times.'), 400
+    compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
     
-    # Get the root logger and add handlers
-    logger = logging.getLogger()
-    logger.setLevel(logging.DEBUG)
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    chunks = export.export(since, until, fmt, compress, batch_size=app.config['EXPORT_YIELD_PER'])
+    # The generator keeps the app context, and so the db session, while the body streams
+    response = app.response_class(
+        stream_with_context(chunks),
+        mimetype='application/gzip' if compress else export.FORMATS[fmt]
+    )
+    filename = f'assessments.{fmt}' + ('.gz' if compress else '')
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+@app.route('/stats')
+def option_stats():
+    """Option frequencies and pairwise co-occurrence across all assessments."""
+    return jsonify(stats.snapshot())
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Create or upgrade the database schema."""
+    applied = migrations.upgrade()
+    if applied:
+        click.echo(f"Applied migrations {', '.join(map(str, applied))}; "
+                   f'schema is at version {migrations.LATEST}', err=True)
+    else:
+        click.echo(f'Schema is up to date (version {migrations.LATEST})', err=True)
+
+@app.cli.command('rebuild-stats')
+@db_routing.without_statement_timeout()
+def rebuild_stats_command():
+    """Recompute the analytics counters from the assessment table."""
+    total = stats.rebuild()
+    click.echo(f'Rebuilt option statistics from {total} assessments', err=True)
+
+@app.cli.command('regenerate-statements')
+@click.option('--output', type=click.File('w'), default='-', help='NDJSON file to write (default: stdout)')
+@click.option('--chunk-size', default=10000, show_default=True, help='Rows per batch')
+@db_routing.without_statement_timeout()
+def regenerate_statements_command(output, chunk_size):
+    """Regenerate purpose statements for every stored assessment as NDJSON."""
+    columns = [Assessment.id] + [getattr(Assessment, f'{field}_mask') for field in CATEGORY_FIELDS]
+    query = select(*columns).order_by(Assessment.id).execution_options(yield_per=chunk_size)
+    # Hot rows in chunks, then archived rows a segment at a time
+    chunks = chain(
+        db.session.execute(query).partitions(),
+        (list(zip(segment.ids.tolist(), *segment.masks.tolist())) for segment in archive.segments(db.session))
+    )
+    count = 0
+    for chunk in chunks:
+        texts = batch_statements([row[1:] for row in chunk])
+        for row, statement in zip(chunk, texts):
+            output.write(json.dumps({'id': row[0], 'purpose_statement': statement}) + '\n')
+        count += len(chunk)
+    click.echo(f'Regenerated statements for {count} assessments', err=True)
+
+@app.cli.command('export-pdfs')
+@click.option('--since', type=click.DateTime(), help='Only assessments taken at or after this time (UTC)')
+@click.option('--until', type=click.DateTime(), help='Only assessments taken before this time (UTC)')
+@click.option('--output', '-o', type=click.File('wb'), default='assessments.zip', show_default=True,
+              help="ZIP file to write ('-' for stdout)")
+@click.option('--workers', type=int, help='Render processes (default: CPU count)')
+@db_routing.without_statement_timeout()
+def export_pdfs_command(since, until, output, workers):
+    """Export result PDFs for stored assessments as a ZIP archive."""
+    pdf_export.export_pdfs(output, since=since, until=until, workers=workers)
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Hash, minify and precompress static files into static/dist."""
+    manifest = assets.build(app.static_folder)
+    click.echo(f'Built {len(manifest)} assets into {os.path.join(app.static_folder, assets.OUTPUT_DIR)}', err=True)
+
+@app.cli.command('export-assessments')
+@click.option('--format', 'fmt', type=click.Choice(list(export.FORMATS)), default='ndjson', show_default=True)
+@click.option('--since', type=click.DateTime(), help='Only assessments taken at or after this time (UTC)')
+@click.option('--until', type=click.DateTime(), help='Only assessments taken before this time (UTC)')
+@click.option('--gzip', 'compress', is_flag=True, help='Gzip the output')
+@click.option('--output', '-o', type=click.File('wb'), default='-', show_default=True,
+              help="File to write ('-' for stdout)")
+@db_routing.without_statement_timeout()
+def export_assessments_command(fmt, since, until, compress, output):
+    """Stream all assessments as NDJSON or CSV."""
+    for chunk in export.export(since, until, fmt, compress, batch_size=app.config['EXPORT_YIELD_PER']):
+        output.write(chunk)
+
+@app.cli.command('archive-assessments')
+@click.option('--older-than-days', type=float, help='Archive assessments older than this (default: ARCHIVE_AFTER_DAYS)')
+@click.option('--segment-rows', type=int, help='Assessments per archive segment (default: ARCHIVE_SEGMENT_ROWS)')
+@click.option('--no-compact', is_flag=True, help='Do not merge small archive segments afterwards')
+@db_routing.without_statement_timeout()
+def archive_assessments_command(older_than_days, segment_rows, no_compact):
+    """Move old assessments into compressed archive segments, then merge small segments."""
+    if older_than_days is None:
+        older_than_days = app.config['ARCHIVE_AFTER_DAYS']
+    segment_rows = segment_rows or app.config['ARCHIVE_SEGMENT_ROWS']
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    moved = archive.archive_before(cutoff, segment_rows)
+    merged = 0 if no_compact else archive.compact(segment_rows)
+    click.echo(f'Archived {moved} assessments taken before {cutoff:%Y-%m-%d %H:%M} UTC; '
+               f'merged away {merged} small segments', err=True)
+
+@app.cli.command('build-similarity-index')
+@db_routing.without_statement_timeout()
+def build_similarity_index_command():
+    """Rebuild the similarity index snapshot from the assessment table."""
+    from similarity import SimilarityIndex
+    index = SimilarityIndex()
+    index.refresh()
+    index.snapshot_path = app.config['SIMILARITY_SNAPSHOT']
+    index.save_snapshot()
+    click.echo(f'Indexed {len(index)} assessments into {index.snapshot_path}', err=True)
 
-# Call logging setup before running the app
-setup_logging()
+def setup_logging():
+    """Send this process's logs through the background writer (once per worker, after fork)."""
+    from flask.logging import default_handler
+    # Flask's own handler writes to stderr from the request thread; the root handler covers it
+    app.logger.removeHandler(default_handler)
+    log_pipeline.configure(
+        level=app.config['LOG_LEVEL'],
+        log_file=app.config['LOG_FILE'] or None,
+        max_bytes=app.config['LOG_MAX_BYTES'],
+        backup_count=app.config['LOG_BACKUP_COUNT'],
+        queue_size=app.config['LOG_QUEUE_SIZE'],
+        fmt=app.config['LOG_FORMAT'],
+        sample_rates={
+            logging.DEBUG: app.config['LOG_SAMPLE_DEBUG'],
+            logging.INFO: app.config['LOG_SAMPLE_INFO'],
+            log_pipeline.access_logger.name: app.config['LOG_SAMPLE_REQUESTS'],
+        }
+    )
 
 if __name__ == '__main__':
+    setup_logging()
+    with app.app_context():
+        migrations.upgrade()
     app.run(host='0.0.0.0', port=8084)
@@ -0,0 +1,328 @@
+"""Hot/cold partitioning of stored assessments.
+
+Every submission inserts into the ``assessment`` table and its indexes.
+``archive_before`` moves assessments older than a cut-off out of it into
+``archive_segment`` rows. A segment holds up to ``segment_rows``
+assessments in timestamp order, stored column by column: ids and
+timestamps delta-encoded as int64, and the eight category masks as one
+byte each, all zlib-compressed (``np.savez_compressed``). That comes to a
+few bytes a row, against a hundred or more for a hot row and its index
+entries. Share tokens move to the narrow ``archived_token`` table, so
+results links keep working.
+
+Segments are append-only. Each run leaves one partly filled segment
+behind, so ``compact`` replaces runs of adjacent small segments with one
+merged segment. Each batch moves in one transaction (insert the segment
+and its tokens, delete the rows), so every assessment is either hot or
+archived, never both or neither.
+
+Readers combine both tiers: exports merge ``iter_rows`` into the hot rows
+in timestamp order; ``count``, ``find`` (results lookups), ``vectors`` (the
+similarity index) and ``pair_counts`` (the analytics counters) cover the
+rest. Segments are read through ``db_routing.reads`` unless a session is
+passed. NumPy is imported by the functions that need it, so importing
+this module (app.py does) only loads it once there is an archive.
+"""
+import heapq
+import io
+import logging
+from collections import deque, namedtuple
+from datetime import datetime, timedelta
+from itertools import count as counter
+
+from sqlalchemy import delete, func, insert, select, update
+
+import db_routing
+from choices import BITS_PER_CATEGORY, CATEGORY_FIELDS
+from models import ArchivedToken, ArchiveSegment, Assessment, db
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+# Ids per DELETE, well under SQLite's bound parameter limit
+_DELETE_CHUNK = 500
+
+_COLUMNS = [Assessment.id, Assessment.timestamp, Assessment.token] + [
+    getattr(Assessment, f'{field}_mask') for field in CATEGORY_FIELDS
+]
+
+# ids and micros are int64 arrays of n rows; masks is an (8, n) uint8 array
+Columns = namedtuple('Columns', 'ids micros masks')
+
+def _micros(timestamp):
+    return (timestamp - _EPOCH) // _MICROSECOND
+
+def _timestamp(micros):
+    return _EPOCH + timedelta(microseconds=int(micros))
+
+def encode(columns):
+    """Compress ``Columns`` into a segment payload."""
+    import numpy as np
+    buffer = io.BytesIO()
+    np.savez_compressed(
+        buffer,
+        version=np.int64(FORMAT_VERSION),
+        id_deltas=np.diff(columns.ids, prepend=0),
+        micro_deltas=np.diff(columns.micros, prepend=0),
+        masks=np.ascontiguousarray(columns.masks, dtype=np.uint8)
+    )
+    return buffer.getvalue()
+
+def decode(data):
+    """The ``Columns`` of a segment payload."""
+    import numpy as np
+    with np.load(io.BytesIO(data), allow_pickle=False) as payload:
+        version = int(payload['version'])
+        if version != FORMAT_VERSION:
+            raise ValueError(f'Unsupported archive segment format {version}')
+        return Columns(np.cumsum(payload['id_deltas']), np.cumsum(payload['micro_deltas']), payload['masks'])
+
+def _new_segment(columns):
+    return ArchiveSegment(
+        row_count=len(columns.ids),
+        min_id=int(columns.ids.min()),
+        max_id=int(columns.ids.max()),
+        min_timestamp=_timestamp(columns.micros.min()),
+        max_timestamp=_timestamp(columns.micros.max()),
+        data=encode(columns)
+    )
+
+def archive_before(cutoff, segment_rows=50000):
+    """Move assessments taken before ``cutoff`` into new segments; return how many moved.
+
+    The assessment with the highest id always stays hot. SQLite hands out
+    ``MAX(id) + 1`` for new rows (the table has no AUTOINCREMENT), so
+    archiving it would let a new assessment reuse an archived id.
+    """
+    import numpy as np
+    newest = select(func.max(Assessment.id)).scalar_subquery()
+    query = (select(*_COLUMNS).where(Assessment.timestamp < cutoff, Assessment.id < newest)
+             .order_by(Assessment.timestamp, Assessment.id).limit(segment_rows))
+    moved = 0
+    while True:
+        rows = db.session.execute(query).all()
+        if not rows:
+            return moved
+        ids = [row[0] for row in rows]
+        columns = Columns(
+            np.array(ids, dtype=np.int64),
+            np.fromiter((_micros(row[1]) for row in rows), np.int64, len(rows)),
+            np.array([row[3:] for row in rows], dtype=np.uint8).T
+        )
+        try:
+            segment = _new_segment(columns)
+            db.session.add(segment)
+            db.session.flush()
+            tokens = [{'token': row[2], 'assessment_id': row[0], 'segment_id': segment.id} for row in rows if row[2]]
+            if tokens:
+                db.session.execute(insert(ArchivedToken), tokens)
+            for start in range(0, len(ids), _DELETE_CHUNK):
+                db.session.execute(
+                    delete(Assessment).where(Assessment.id.in_(ids[start:start + _DELETE_CHUNK]))
+                    .execution_options(synchronize_session=False)
+                )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        moved += len(rows)
+        logger.info('Archived %d assessments into segment %d (%d bytes)', len(rows), segment.id, len(segment.data))
+
+def compact(segment_rows=50000):
+    """Merge runs of adjacent small segments into segments of up to ``segment_rows``.
+
+    Returns how many segments were merged away.
+    """
+    import numpy as np
+    segments = db.session.execute(
+        select(ArchiveSegment.id, ArchiveSegment.row_count)
+        .order_by(ArchiveSegment.min_timestamp, ArchiveSegment.id)
+    ).all()
+    runs, run, size = [], [], 0
+    for segment_id, row_count in segments:
+        if run and size + row_count > segment_rows:
+            runs.append(run)
+            run, size = [], 0
+        run.append(segment_id)
+        size += row_count
+    runs.append(run)
+
+    removed = 0
+    for run in runs:
+        if len(run) < 2:
+            continue
+        try:
+            parts = [decode(data) for data in db.session.execute(
+                select(ArchiveSegment.data).where(ArchiveSegment.id.in_(run))).scalars()]
+            ids = np.concatenate([part.ids for part in parts])
+            micros = np.concatenate([part.micros for part in parts])
+            order = np.lexsort((ids, micros))
+            merged = _new_segment(Columns(
+                ids[order], micros[order], np.concatenate([part.masks for part in parts], axis=1)[:, order]))
+            db.session.add(merged)
+            db.session.flush()
+            db.session.execute(
+                update(ArchivedToken).where(ArchivedToken.segment_id.in_(run)).values(segment_id=merged.id)
+                .execution_options(synchronize_session=False)
+            )
+            db.session.execute(
+                delete(ArchiveSegment).where(ArchiveSegment.id.in_(run))
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        removed += len(run) - 1
+        logger.info('Merged archive segments %s into segment %d', run, merged.id)
+    return removed
+
+def consistent_reads(session):
+    """Make ``session`` read the hot table and the archive from one snapshot.
+
+    Needed on PostgreSQL, where each statement otherwise sees the latest
+    commits, so an archive run committing between the hot query and the
+    segment list would show its rows twice. A no-op once the session's
+    transaction has begun, and on other databases.
+    """
+    if session.get_bind().dialect.name == 'postgresql' and not session.in_transaction():
+        session.connection(execution_options={'isolation_level': 'REPEATABLE READ'})
+
+def _segment_list(session, since=None, until=None, after_id=None):
+    query = select(
+        ArchiveSegment.id, ArchiveSegment.row_count, ArchiveSegment.min_timestamp, ArchiveSegment.max_timestamp
+    ).order_by(ArchiveSegment.min_timestamp, ArchiveSegment.id)
+    if since is not None:
+        query = query.where(ArchiveSegment.max_timestamp >= since)
+    if until is not None:
+        query = query.where(ArchiveSegment.min_timestamp < until)
+    if after_id is not None:
+        query = query.where(ArchiveSegment.max_id > after_id)
+    return session.execute(query).all()
+
+def _load(session, segment_id):
+    return decode(session.execute(select(ArchiveSegment.data).where(ArchiveSegment.id == segment_id)).scalar_one())
+
+def segments(session=None, after_id=None):
+    """Yield the ``Columns`` of every segment (with ids above ``after_id``), one at a time."""
+    session = session or db_routing.reads
+    for segment in _segment_list(session, after_id=after_id):
+        yield _load(session, segment.id)
+
+def _in_range(columns, since, until):
+    import numpy as np
+    keep = np.ones(len(columns.ids), dtype=bool)
+    if since is not None:
+        keep &= columns.micros >= _micros(since)
+    if until is not None:
+        keep &= columns.micros < _micros(until)
+    return keep
+
+def _rows(columns, since, until):
+    keep = _in_range(columns, since, until)
+    timestamps = columns.micros[keep].astype('datetime64[us]').tolist()
+    return zip(columns.ids[keep].tolist(), timestamps, *columns.masks[:, keep].tolist())
+
+def iter_rows(since=None, until=None, session=None):
+    """Yield archived ``(id, timestamp, *masks)`` in [since, until), in timestamp then id order.
+
+    Segments may overlap in time (a late upload with an old timestamp), so
+    their rows are merged. A segment is only opened once the merge reaches
+    its first timestamp, which keeps just the overlapping ones in memory.
+    """
+    session = session or db_routing.reads
+    pending = deque(_segment_list(session, since, until))
+    heap = []
+    sequence = counter()
+
+    def advance(rows):
+        row = next(rows, None)
+        if row is not None:
+            heapq.heappush(heap, (row[1], row[0], next(sequence), row, rows))
+
+    while pending or heap:
+        while pending and (not heap or pending[0].min_timestamp <= heap[0][0]):
+            advance(_rows(_load(session, pending.popleft().id), since, until))
+        if heap:
+            row, rows = heapq.heappop(heap)[3:]
+            yield row
+            advance(rows)
+
+def _order(row):
+    # Rows without a timestamp can only be hot ones; they sort first, as in SQLite
+    return (row[1] or datetime.min, row[0])
+
+def merge(hot_rows, archived_rows):
+    """Interleave two ``(id, timestamp, ...)`` streams that are each in timestamp then id order."""
+    return heapq.merge(hot_rows, archived_rows, key=_order)
+
+def count(since=None, until=None, session=None):
+    """Number of archived assessments taken in [since, until)."""
+    session = session or db_routing.reads
+    total = 0
+    for segment in _segment_list(session, since, until):
+        if (since is None or segment.min_timestamp >= since) and (until is None or segment.max_timestamp < until):
+            total += segment.row_count
+        else:
+            total += int(_in_range(_load(session, segment.id), since, until).sum())
+    return total
+
+def find(token=None, assessment_id=None, session=None):
+    """The archived assessment with ``token`` or ``assessment_id``, as a transient Assessment, or None."""
+    import numpy as np
+    session = session or db_routing.reads
+    if token is not None:
+        entry = session.execute(
+            select(ArchivedToken.assessment_id, ArchivedToken.segment_id).where(ArchivedToken.token == token)
+        ).first()
+        if entry is None:
+            return None
+        assessment_id, candidates = entry[0], [entry[1]]
+    else:
+        candidates = session.execute(select(ArchiveSegment.id).where(
+            ArchiveSegment.min_id <= assessment_id, ArchiveSegment.max_id >= assessment_id)).scalars().all()
+    for segment_id in candidates:
+        columns = _load(session, segment_id)
+        hits = np.flatnonzero(columns.ids == assessment_id)
+        if len(hits):
+            position = hits[0]
+            return Assessment(
+                id=assessment_id, token=token, timestamp=_timestamp(columns.micros[position]),
+                **{f'{field}_mask': int(mask) for field, mask in zip(CATEGORY_FIELDS, columns.masks[:, position])}
+            )
+    return None
+
+def vectors(after_id=0, session=None):
+    """Yield ``(ids, packed)`` arrays of archived rows with ids above ``after_id``, a segment at a time.
+
+    ``packed`` holds each row's answers as one 48-bit integer (see ``choices.pack_masks``).
+    """
+    import numpy as np
+    shifts = (np.arange(len(CATEGORY_FIELDS), dtype=np.int64) * BITS_PER_CATEGORY)[:, None]
+    for columns in segments(session, after_id=after_id):
+        keep = columns.ids > after_id
+        yield columns.ids[keep], (columns.masks[:, keep].astype(np.int64) << shifts).sum(axis=0)
+
+def pair_counts(pairs, session=None):
+    """Count archived assessments per combination of masks, for each pair of categories.
+
+    Returns the number of archived assessments and, for each ``(c1, c2)`` in
+    ``pairs``, a list of ``(mask1, mask2, count)`` with a non-zero count.
+    """
+    import numpy as np
+    width = 1 << BITS_PER_CATEGORY
+    totals = {pair: np.zeros(width * width, dtype=np.int64) for pair in pairs}
+    rows = 0
+    for columns in segments(session):
+        rows += len(columns.ids)
+        masks = columns.masks.astype(np.int64)
+        for c1, c2 in pairs:
+            totals[c1, c2] += np.bincount(masks[c1] * width + masks[c2], minlength=width * width)
+    groups = {}
+    for pair, counts in totals.items():
+        cells = np.flatnonzero(counts)
+        groups[pair] = [(int(cell) // width, int(cell) % width, int(counts[cell])) for cell in cells]
+    return rows, groups
@@ -0,0 +1,288 @@
+"""ASGI entry point for the optional async serving mode.
+
+    pip install -r requirements-async.txt
+    gunicorn -c gunicorn_config.py -k uvicorn.workers.UvicornWorker asgi:application
+
+In the default WSGI mode every slow PDF render holds one of the worker's
+threads. Here ``/download_pdf`` is served on the event loop instead: the
+share token lookup runs in a thread, but the render itself is awaited
+(wkhtmltopdf runs as an asyncio subprocess), so thousands of downloads
+can wait on renders at once without holding threads. Every other route
+goes to the unchanged Flask app, which runs in the loop's thread pool
+(``sync_to_async``) and streams its response back chunk by chunk. Results
+emails are delivered by tasks on the same loop with aiosmtplib instead of
+the email worker threads.
+"""
+import asyncio
+import contextvars
+import io
+import logging
+import sys
+import tempfile
+
+import aiosmtplib
+from asgiref.sync import sync_to_async
+from flask import flash, redirect, url_for
+from flask_mail import sanitize_address
+
+from admission import Rejected
+import app as app_module
+import body_limit
+import db_routing
+import metrics
+import migrations
+from models import db
+from pdf_cache import cache_key
+from pdf_renderer import RenderBusy
+
+logger = logging.getLogger(__name__)
+
+flask_app = app_module.app
+
+
+# Cache key -> task of the render in flight, so concurrent misses render once
+_renders = {}
+
+
+async def _render_and_cache(key, safe_results):
+    with metrics.timed('generate_pdf'):
+        pdf_data = await app_module.pdf_renderer.render_async(safe_results)
+    await asyncio.to_thread(app_module.pdf_cache.put, key, pdf_data)
+    return pdf_data
+
+
+async def get_results_pdf_async(safe_results):
+    """Async counterpart of ``app.get_results_pdf``."""
+    cache = app_module.pdf_cache
+    key = cache_key(safe_results, cache.namespace)
+    pdf_data = await asyncio.to_thread(cache.get, key)
+    if pdf_data is not None:
+        return pdf_data
+
+    render = _renders.get(key)
+    if render is None:
+        render = asyncio.ensure_future(_render_and_cache(key, safe_results))
+        _renders[key] = render
+        render.add_done_callback(lambda _: _renders.pop(key, None))
+    # One caller giving up must not cancel the render for the others
+    return await asyncio.shield(render)
+
+
+async def build_results_message_async(email, results):
+    """Async counterpart of ``app.build_results_message``."""
+    pdf_data = await get_results_pdf_async(app_module.build_safe_results(results))
+    return app_module.build_results_message(email, results, pdf_data=pdf_data)
+
+
+async def send_message_async(msg):
+    """Send a prepared Flask-Mail message with aiosmtplib."""
+    config = flask_app.config
+    with metrics.timed('mail.send'):
+        await aiosmtplib.send(
+            msg.as_bytes(),
+            sender=sanitize_address(msg.sender),
+            recipients=[sanitize_address(address) for address in msg.send_to],
+            hostname=config['MAIL_SERVER'],
+            port=config['MAIL_PORT'],
+            username=config['MAIL_USERNAME'],
+            password=config['MAIL_PASSWORD'],
+            use_tls=config['MAIL_USE_SSL'],
+            start_tls=config['MAIL_USE_TLS']
+        )
+
+
+def _lookup_results():
+    try:
+        return app_module.current_results()
+    finally:
+        # Return the connections to the pools before the request waits on a render
+        db.session.close()
+        db_routing.reads.close()
+
+
+async def download_pdf():
+    """Async variant of ``app.download_pdf``."""
+    try:
+        # Waiting downloads hold no threads here, so only the per-client rate limit applies
+        app_module.admission.check_rate('download_pdf')
+        entry = await asyncio.to_thread(_lookup_results)
+        if entry is None:
+            return redirect(url_for('results'))
+        pdf_data = await get_results_pdf_async(app_module.build_safe_results(entry.results))
+        return app_module.pdf_download_response(pdf_data)
+    except Rejected as e:
+        return app_module.admission_rejected(e)
+    except RenderBusy:
+        return app_module.render_busy_response()
+    except Exception:
+        logger.exception('Error generating PDF')
+        flash('Error generating PDF. Please try again.', 'error')
+        return redirect(url_for('results'))
+
+
+ASYNC_ROUTES = {
+    ('GET', '/download_pdf'): download_pdf,
+}
+
+
+def build_environ(scope, body=b''):
+    """Minimal WSGI environ for an ASGI HTTP scope, so Flask can open the request.
+
+    ``body`` is the request body as bytes or a file positioned at its start.
+    """
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body) if isinstance(body, bytes) else body,
+        # The whole body has been received, so it can be read to the end without a Content-Length
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+        else:
+            key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+async def _serve_async(view, scope, send):
+    environ = build_environ(scope)
+    # The request context carries the session and request.args into the view
+    with flask_app.request_context(environ):
+        response = flask_app.preprocess_request()
+        if response is None:
+            response = await view()
+        response = flask_app.process_response(flask_app.make_response(response))
+
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+
+        body = b''.join(response(environ, start_response))
+    await send({'type': 'http.response.start', 'status': started['status'], 'headers': started['headers']})
+    await send({'type': 'http.response.body', 'body': b'' if scope['method'] == 'HEAD' else body})
+
+
+async def _read_body(receive, limit):
+    """Receive at most ``limit + 1`` bytes of the body; return ``(file, length)``.
+
+    Large bodies spill to disk. A length above ``limit`` means the body was
+    too large and was cut short; the rest is never read.
+    """
+    body = tempfile.SpooledTemporaryFile(max_size=body_limit.SPOOL_BYTES)
+    length = 0
+    while length <= limit:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunk = message.get('body', b'')[:limit + 1 - length]
+        body.write(chunk)
+        length += len(chunk)
+        if not message.get('more_body'):
+            break
+    body.seek(0)
+    return body, length
+
+
+def _start_wsgi(environ):
+    """Call the Flask app and fetch the first chunk of its response (runs in a pool thread)."""
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        if exc_info and started:
+            raise exc_info[1].with_traceback(exc_info[2])
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+
+    iterable = flask_app.wsgi_app(environ, start_response)
+    iterator = iter(iterable)
+    return started, iterable, iterator, next(iterator, None)
+
+
+def _run_in_context(context, fn, *args):
+    return context.run(fn, *args)
+
+
+# Each step runs in the loop's thread pool; the Flask app is thread safe
+_in_thread = sync_to_async(_run_in_context, thread_sensitive=False)
+
+
+async def wsgi_application(scope, receive, send):
+    """Serve an HTTP request with the Flask app, streaming its response."""
+    # Every step shares one context: streamed responses push Flask's request
+    # context in the first step and pop it in the last
+    context = contextvars.copy_context()
+    body, length = await _read_body(receive, flask_app.config['MAX_CONTENT_LENGTH'])
+    with body:
+        environ = build_environ(scope, body)
+        # As for chunked bodies under gunicorn (body_limit.py): a length past the cap gets a 413
+        if environ.pop('HTTP_TRANSFER_ENCODING', None) or 'CONTENT_LENGTH' not in environ:
+            environ['CONTENT_LENGTH'] = str(length)
+        iterable = None
+        try:
+            started, iterable, iterator, chunk = await _in_thread(context, _start_wsgi, environ)
+            await send({'type': 'http.response.start', 'status': started['status'], 'headers': started['headers']})
+            while chunk is not None:
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk = await _in_thread(context, next, iterator, None)
+            await send({'type': 'http.response.body'})
+        finally:
+            if hasattr(iterable, 'close'):
+                await _in_thread(context, iterable.close)
+
+
+def _migrate():
+    with flask_app.app_context():
+        migrations.upgrade()
+
+
+async def _lifespan(receive, send):
+    delivery = None
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # Normally already done by flask migrate or gunicorn on_starting; then this is one SELECT
+            await asyncio.to_thread(_migrate)
+            # Takes the place of the email worker threads in this process
+            delivery = asyncio.create_task(app_module.email_queue.run_async(
+                build_results_message_async, send_message_async,
+                concurrency=flask_app.config['ASYNC_EMAIL_CONCURRENCY']))
+            # Let it register with the queue before any request could start worker threads
+            await asyncio.sleep(0)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if delivery is not None:
+                delivery.cancel()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if scope['type'] == 'http':
+        method = 'GET' if scope['method'] == 'HEAD' else scope['method']
+        view = ASYNC_ROUTES.get((method, scope['path']))
+        if view is not None:
+            return await _serve_async(view, scope, send)
+    return await wsgi_application(scope, receive, send)
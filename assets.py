@@ -0,0 +1,137 @@
+"""Build step and serving for the files under ``static/``.
+
+``flask build-assets`` minifies every CSS and JS file, names it after a
+hash of its content (``static/dist/css/style.<hash>.css``), writes
+gzip and brotli copies next to it and records the mapping in
+``static/dist/manifest.json``. Templates link files through
+``asset_url``, which uses the manifest when it exists and falls back to
+the plain ``/static/`` URL otherwise. Built files are served from
+``/assets/`` in the best encoding the client accepts, with a one-year
+immutable Cache-Control: a changed file gets a new name.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+
+from flask import abort, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:  # brotli copies are skipped; gzip is always written
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_DIR = 'dist'
+MANIFEST = 'manifest.json'
+MAX_AGE = 365 * 24 * 3600
+
+# Preferred first
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+_CSS_STRING = r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\''
+_CSS_STRINGS = re.compile(f'({_CSS_STRING})')
+_CSS_COMMENTS = re.compile(f'({_CSS_STRING})|/\\*.*?\\*/', re.DOTALL)
+
+def minify_css(text):
+    """Drop comments and insignificant whitespace, leaving strings alone."""
+    text = _CSS_COMMENTS.sub(lambda m: m.group(1) or '', text)
+    parts = _CSS_STRINGS.split(text)
+    # Odd items are the quoted strings
+    for i in range(0, len(parts), 2):
+        chunk = re.sub(r'\s+', ' ', parts[i])
+        chunk = re.sub(r' ?([{};,>]) ?', r'\1', chunk)
+        # Only after ':'; a space before one can mean a descendant pseudo-class
+        chunk = re.sub(r': ', ':', chunk)
+        parts[i] = chunk.replace(';}', '}')
+    return ''.join(parts).strip()
+
+def minify_js(text):
+    """Trim indentation, blank lines and whole-line comments.
+
+    Line breaks are kept, so automatic semicolon insertion is unaffected.
+    """
+    lines = (line.strip() for line in text.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//'))
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def build(static_dir):
+    """Build every CSS/JS file under ``static_dir``; return the manifest."""
+    output_dir = os.path.join(static_dir, OUTPUT_DIR)
+    if brotli is None:
+        logger.warning('brotli is not installed; writing gzip copies only')
+
+    manifest = {}
+    for root, dirs, files in os.walk(static_dir):
+        if os.path.abspath(root) == os.path.abspath(static_dir) and OUTPUT_DIR in dirs:
+            dirs.remove(OUTPUT_DIR)
+        for name in sorted(files):
+            stem, ext = os.path.splitext(name)
+            if ext not in MINIFIERS:
+                continue
+            source = os.path.join(root, name)
+            with open(source, encoding='utf-8') as f:
+                data = MINIFIERS[ext](f.read()).encode('utf-8')
+
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            relative = os.path.relpath(source, static_dir).replace(os.sep, '/')
+            built = '/'.join(filter(None, [os.path.dirname(relative), f'{stem}.{digest}{ext}']))
+            target = os.path.join(output_dir, built)
+            _write(target, data)
+            # mtime=0 keeps the output identical between builds
+            _write(target + '.gz', gzip.compress(data, 9, mtime=0))
+            if brotli is not None:
+                _write(target + '.br', brotli.compress(data, quality=11))
+            manifest[relative] = built
+
+    _write(os.path.join(output_dir, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return manifest
+
+def load_manifest(static_dir):
+    """The manifest written by ``build``, or an empty one if assets are not built."""
+    try:
+        with open(os.path.join(static_dir, OUTPUT_DIR, MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def init_app(app):
+    """Register ``asset_url`` for templates and the ``/assets/`` route; return the manifest."""
+    output_dir = os.path.join(app.static_folder, OUTPUT_DIR)
+    manifest = load_manifest(app.static_folder)
+    built = set(manifest.values())
+
+    @app.template_global()
+    def asset_url(filename):
+        if filename in manifest:
+            return url_for('send_asset', filename=manifest[filename])
+        return url_for('static', filename=filename)
+
+    @app.route('/assets/<path:filename>')
+    def send_asset(filename):
+        if filename not in built:
+            abort(404)
+        encoding, suffix = next(
+            ((name, suffix) for name, suffix in ENCODINGS
+             if name in request.accept_encodings and os.path.exists(os.path.join(output_dir, filename + suffix))),
+            (None, ''))
+        response = send_from_directory(output_dir, filename + suffix,
+                                       mimetype=mimetypes.guess_type(filename)[0], max_age=MAX_AGE)
+        if encoding is not None:
+            response.content_encoding = encoding
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    return manifest
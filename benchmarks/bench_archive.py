@@ -0,0 +1,177 @@
+"""Measure archiving old assessments and check that nothing changes for readers.
+
+Fills a scratch SQLite database with --rows random assessments spread over
+the last two years. It exports them, rebuilds the analytics counters and
+builds the similarity index, then archives everything older than --days.
+It reports the time taken, the database size before and after (after
+VACUUM), and the export time with and without an archive. It then checks:
+
+- full and date-range exports are byte-for-byte identical;
+- the rebuilt counters are identical;
+- archived share tokens still resolve to the same results;
+- a freshly built similarity index finds the same neighbours.
+
+Finally it uploads back-dated rows and archives again, which leaves a small
+segment, and checks that compaction merges it and the export still matches.
+It then archives everything, saves one more assessment and checks that its
+id is above every archived id.
+
+Usage:
+    python benchmarks/bench_archive.py [--rows 200000] [--days 180]
+"""
+import argparse
+import hashlib
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+SCRATCH = tempfile.mkdtemp(prefix='pf_bench_')
+DATABASE = os.path.join(SCRATCH, 'archive.db')
+os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{DATABASE}'
+os.environ['SIMILARITY_INDEX'] = 'false'
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from sqlalchemy import func, insert, select, text  # noqa: E402
+
+import archive  # noqa: E402
+import export  # noqa: E402
+import migrations  # noqa: E402
+import stats  # noqa: E402
+from app import app  # noqa: E402
+from choices import CATEGORY_FIELDS  # noqa: E402
+from models import ArchiveSegment, Assessment, OptionStat, db, new_result_token  # noqa: E402
+from results_store import ResultStore  # noqa: E402
+from similarity import SimilarityIndex  # noqa: E402
+
+NOW = datetime.utcnow().replace(microsecond=0)
+
+
+def fill(count, rng, start, span, chunk=50000):
+    while count > 0:
+        n = min(chunk, count)
+        rows = [{
+            'timestamp': start + timedelta(seconds=rng.randrange(int(span.total_seconds()))),
+            'token': new_result_token(),
+            **{f'{field}_mask': rng.randint(1, 63) for field in CATEGORY_FIELDS}
+        } for _ in range(n)]
+        db.session.execute(insert(Assessment), rows)
+        db.session.commit()
+        count -= n
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - started, result
+
+
+def export_digest(since=None, until=None):
+    digest = hashlib.sha256()
+    for chunk in export.export(since, until, 'ndjson'):
+        digest.update(chunk)
+    db.session.remove()
+    return digest.hexdigest()
+
+
+def counters():
+    stats.rebuild()
+    return sorted(db.session.query(OptionStat.a, OptionStat.b, OptionStat.count).all())
+
+
+def neighbours(queries):
+    index = SimilarityIndex(refresh_interval=3600)
+    index.refresh()
+    return len(index), [[n.id for n in index.query(masks, 10)] for masks in queries]
+
+
+def database_size():
+    db.session.remove()
+    with db.engine.connect() as conn:
+        conn.execute(text('PRAGMA wal_checkpoint(TRUNCATE)'))
+        conn.exec_driver_sql('VACUUM')
+    return os.path.getsize(DATABASE) / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--days', type=float, default=180)
+    parser.add_argument('--segment-rows', type=int, default=50000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    cutoff = NOW - timedelta(days=args.days)
+    window = (NOW - timedelta(days=400), NOW - timedelta(days=100))
+    queries = [[rng.randint(1, 63) for _ in CATEGORY_FIELDS] for _ in range(20)]
+    problems = []
+
+    def check(ok, message):
+        print(f"{'ok  ' if ok else 'FAIL'} {message}")
+        if not ok:
+            problems.append(message)
+
+    with app.app_context():
+        migrations.upgrade()
+        fill(args.rows, rng, NOW - timedelta(days=730), timedelta(days=730))
+        old_tokens = db.session.execute(
+            select(Assessment.token).where(Assessment.timestamp < cutoff).limit(200)).scalars().all()
+        before_results = {token: ResultStore().get(token).results for token in old_tokens}
+
+        hot_export, full = timed(export_digest)
+        ranged = export_digest(*window)
+        before_counters = counters()
+        before_neighbours = neighbours(queries)
+        size_before = database_size()
+
+        took, moved = timed(archive.archive_before, cutoff, args.segment_rows)
+        segments = db.session.query(func.count(ArchiveSegment.id)).scalar()
+        archived_bytes = db.session.query(func.sum(func.length(ArchiveSegment.data))).scalar() or 0
+        hot = db.session.query(func.count(Assessment.id)).scalar()
+        size_after = database_size()
+        print(f'archived {moved} of {args.rows} rows into {segments} segments in {took:.2f}s '
+              f'({archived_bytes / max(moved, 1):.1f} bytes a row); {hot} rows stay hot')
+        print(f'database {size_before:.1f} MB -> {size_after:.1f} MB after VACUUM')
+
+        mixed_export, digest = timed(export_digest)
+        print(f'full export {hot_export:.2f}s before, {mixed_export:.2f}s with the archive')
+        check(digest == full, 'the full export is unchanged')
+        check(export_digest(*window) == ranged, 'a date-range export across the cut-off is unchanged')
+        check(export.count() == args.rows, 'export.count covers both tiers')
+        check(counters() == before_counters, 'rebuilt counters are unchanged')
+
+        store = ResultStore()
+        lookup, found = timed(lambda: {token: store.get(token) for token in old_tokens})
+        check(all(found[token] is not None and found[token].results == before_results[token]
+                  for token in old_tokens), 'archived share tokens resolve to the same results')
+        print(f'archived results lookup {lookup / len(old_tokens) * 1000:.1f} ms each (uncached)')
+        check(neighbours(queries) == before_neighbours, 'a rebuilt similarity index finds the same neighbours')
+
+        # A late upload of old assessments leaves a small segment for compaction to merge
+        fill(1000, rng, NOW - timedelta(days=700), timedelta(days=100))
+        expected = export_digest()
+        archive.archive_before(cutoff, args.segment_rows)
+        merged = archive.compact(args.segment_rows)
+        print(f'compaction merged away {merged} segments')
+        check(merged > 0, 'compaction merged the small segment')
+        check(export_digest() == expected, 'the export is unchanged after archiving late uploads and compacting')
+
+        # Archiving everything must not let a new assessment reuse an archived id
+        archive.archive_before(NOW + timedelta(days=1), args.segment_rows)
+        fill(1, rng, NOW, timedelta(seconds=1))
+        newest = db.session.query(func.max(Assessment.id)).scalar()
+        archived = db.session.query(func.max(ArchiveSegment.max_id)).scalar()
+        ids = [row[0] for row in export.iter_rows()]
+        db.session.remove()
+        check(newest > archived, f'new assessments get ids above the archive (new {newest}, archived up to {archived})')
+        check(len(ids) == len(set(ids)) == args.rows + 1001, 'no id is both hot and archived')
+
+    print(f'scratch: {SCRATCH}')
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Compare the sync (gthread) and async (ASGI) serving modes under many concurrent clients.
+
+Starts the app under gunicorn with gunicorn_config.py twice: once as is
+and once with ``-k uvicorn.workers.UvicornWorker asgi:application``. Both
+runs use the fake PDF backend (fake_pdf.py) with a slow render and render
+limits high enough that only the serving mode limits concurrency. Then
+--clients concurrent clients each download PDFs for freshly uploaded
+assessments, so every download is a cache miss.
+
+Needs requirements-async.txt and benchmarks/requirements.txt.
+
+Usage:
+    python benchmarks/bench_async.py [--clients 500] [--requests 2000] [--pdf-seconds 0.5]
+"""
+import argparse
+import random
+import threading
+import time
+
+import requests
+
+from loadtest import Recorder, Server, print_report, random_selection
+
+API_KEY = 'bench'
+MODES = {
+    'sync (gthread)': {'args': [], 'target': 'app:app'},
+    'async (ASGI)': {'args': ['-k', 'uvicorn.workers.UvicornWorker'], 'target': 'asgi:application'},
+}
+
+
+def upload(base_url, count, rng, chunk=1000):
+    """Create ``count`` assessments through the bulk API and return their tokens."""
+    tokens = []
+    while len(tokens) < count:
+        items = [random_selection(rng) for _ in range(min(chunk, count - len(tokens)))]
+        response = requests.post(base_url + '/api/assessments', json=items,
+                                 headers={'X-API-Key': API_KEY}, timeout=120)
+        response.raise_for_status()
+        tokens.extend(row['token'] for row in response.json()['results'] if 'token' in row)
+    return tokens
+
+
+def run(base_url, clients, tokens):
+    recorder = Recorder()
+    lock = threading.Lock()
+
+    def client_loop():
+        session = requests.Session()
+        while True:
+            with lock:
+                if not tokens:
+                    return
+                token = tokens.pop()
+            started = time.perf_counter()
+            try:
+                status = session.get(f'{base_url}/download_pdf?token={token}', timeout=300).status_code
+            except requests.RequestException:
+                status = 'error'
+            recorder.record('GET /download_pdf', time.perf_counter() - started, status, status == 200)
+
+    threads = [threading.Thread(target=client_loop, daemon=True) for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder.report(time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=500)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--pdf-seconds', type=float, default=0.5, help='fake render time per PDF')
+    args = parser.parse_args()
+
+    env = {
+        'API_KEYS': API_KEY,
+        'FAKE_PDF_SECONDS': str(args.pdf_seconds),
+        'PDF_MAX_CONCURRENT_RENDERS': '1000',
+        'ASYNC_PDF_MAX_CONCURRENT_RENDERS': '1000',
+        'PDF_RENDER_QUEUE_TIMEOUT': '300',
+        # Measure the serving modes themselves, not the load shedding in front of them
+        'ADMISSION_CONTROL': 'false',
+    }
+    for mode, options in MODES.items():
+        with Server(env=env, args=options['args'], target=options['target']) as server:
+            tokens = upload(server.url, args.requests, random.Random(7))
+            report = run(server.url, args.clients, tokens)
+        print(f'\n{mode}, {args.clients} clients:')
+        print_report(report)
+
+
+if __name__ == '__main__':
+    main()
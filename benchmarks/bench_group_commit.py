@@ -0,0 +1,88 @@
+"""Compare assessment submissions per second with and without group commit.
+
+Posts the assessment form from --threads concurrent clients against a
+scratch SQLite database (WAL, synchronous=FULL), first with one commit per
+request and then with group commit enabled.
+
+Usage:
+    python benchmarks/bench_group_commit.py [--threads 16] [--requests 2000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from werkzeug.datastructures import MultiDict
+
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix='pf_bench_'), 'group_commit.db')
+os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{DB_PATH}'
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import app as app_module  # noqa: E402
+from choices import CATEGORIES  # noqa: E402
+from group_commit import GroupCommitter  # noqa: E402
+from models import Assessment, db  # noqa: E402
+
+app = app_module.app
+
+
+def random_form(rng):
+    return MultiDict([(field, key) for field, choices in CATEGORIES
+                      for key in rng.sample([key for key, _ in choices], rng.randint(1, 3))])
+
+
+def run(threads, requests):
+    per_thread = requests // threads
+    errors = []
+
+    def client_loop(seed):
+        rng = random.Random(seed)
+        client = app.test_client()
+        for _ in range(per_thread):
+            response = client.post('/assessment', data=random_form(rng))
+            if response.status_code != 303:
+                errors.append(f'HTTP {response.status_code}')
+
+    workers = [threading.Thread(target=client_loop, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    if errors:
+        raise SystemExit(f'{len(errors)} submissions failed, e.g. {errors[0]}')
+    return per_thread * threads / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=5)
+    args = parser.parse_args()
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        db.create_all()
+    app.test_client().get('/')
+
+    print(f"{'mode':<20}{'submissions/s':>15}")
+    app_module.group_committer = None
+    print(f"{'per-request commit':<20}{run(args.threads, args.requests):>15.1f}")
+
+    committer = GroupCommitter(app, db, Assessment, max_batch=args.max_batch,
+                               max_wait=args.max_wait_ms / 1000)
+    app_module.group_committer = committer
+    print(f"{'group commit':<20}{run(args.threads, args.requests):>15.1f}")
+    batch_stats = committer.stats()
+    print(f"average batch: {batch_stats['rows'] / max(batch_stats['batches'], 1):.1f} rows")
+    print(f'database: {DB_PATH}')
+
+
+if __name__ == '__main__':
+    main()
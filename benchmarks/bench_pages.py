@@ -0,0 +1,77 @@
+"""Compare GET / and GET /assessment with and without the page cache, and asset sizes.
+
+Times page requests through the Flask test client with PAGE_CACHE on and
+off, then builds the static assets into a scratch directory and prints
+the bytes a browser downloads for each file: original, minified, gzip
+and brotli.
+
+Usage:
+    python benchmarks/bench_pages.py [--requests 1000]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix='pf_bench_'), 'pages.db')
+os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{DB_PATH}'
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import assets  # noqa: E402
+from app import app, page_cache  # noqa: E402
+from models import db  # noqa: E402
+
+PAGES = ['/', '/assessment']
+
+
+def time_requests(client, path, count):
+    client.get(path)
+    started = time.perf_counter()
+    for _ in range(count):
+        response = client.get(path)
+        assert response.status_code == 200
+    return (time.perf_counter() - started) / count * 1000
+
+
+def asset_sizes():
+    workdir = tempfile.mkdtemp(prefix='pf_assets_')
+    try:
+        static_dir = os.path.join(workdir, 'static')
+        shutil.copytree(app.static_folder, static_dir, ignore=shutil.ignore_patterns(assets.OUTPUT_DIR))
+        manifest = assets.build(static_dir)
+        for source, built in sorted(manifest.items()):
+            path = os.path.join(static_dir, assets.OUTPUT_DIR, built)
+            sizes = [os.path.getsize(os.path.join(static_dir, source)), os.path.getsize(path)]
+            sizes += [os.path.getsize(path + suffix) if os.path.exists(path + suffix) else 0
+                      for suffix in ('.gz', '.br')]
+            yield source, sizes
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=1000)
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+    client = app.test_client()
+
+    print(f"{'page':<14}{'uncached ms':>12}{'cached ms':>12}")
+    for path in PAGES:
+        page_cache.enabled = False
+        uncached = time_requests(client, path, args.requests)
+        page_cache.enabled = True
+        cached = time_requests(client, path, args.requests)
+        print(f'{path:<14}{uncached:>12.3f}{cached:>12.3f}')
+
+    print(f"\n{'asset':<16}{'original':>10}{'minified':>10}{'gzip':>8}{'brotli':>8}")
+    for source, sizes in asset_sizes():
+        print(f'{source:<16}' + ''.join(f'{size:>{width}}' for size, width in zip(sizes, (10, 10, 8, 8))))
+
+
+if __name__ == '__main__':
+    main()
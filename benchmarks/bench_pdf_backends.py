@@ -0,0 +1,70 @@
+"""Compare renders per second for the PDF backends.
+
+Usage:
+    python benchmarks/bench_pdf_backends.py [--seconds 5] [--backend native ...]
+
+Backends whose dependencies are missing (for example no wkhtmltopdf
+binary on PATH) are reported and skipped.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from app import app, build_safe_results  # noqa: E402
+from flask import render_template  # noqa: E402
+from pdf_backends import BACKENDS, load_backend  # noqa: E402
+from statements import generate_purpose_statement  # noqa: E402
+
+SAMPLE = {
+    'love_activities': ['Creative Expression', 'Learning & Discovery'],
+    'love_topics': ['Arts & Culture', 'Personal Growth'],
+    'skills_natural': ['Leadership', 'Communication'],
+    'skills_compliments': ['Teaching', 'Empathy'],
+    'world_problems': ['Education Access', 'Mental Health Support'],
+    'world_impact': ['Community Building'],
+    'natural_abilities': ['Education & Training', 'Research & Analysis'],
+    'innate_strengths': ['Social Services', 'Content Creation'],
+}
+
+
+def bench(backend, safe_results, seconds):
+    # Warm up once so one-off start-up costs are not counted
+    backend.render(safe_results)
+    count = 0
+    size = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        size = len(backend.render(safe_results))
+        count += 1
+    elapsed = time.perf_counter() - started
+    return count / elapsed, elapsed / count * 1000, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=5.0, help='time budget per backend')
+    parser.add_argument('--backend', action='append', help='backend(s) to run (default: all)')
+    args = parser.parse_args()
+
+    results = dict(SAMPLE)
+    results['purpose_statement'] = generate_purpose_statement(*SAMPLE.values())
+    safe_results = build_safe_results(results)
+
+    print(f"{'backend':<14}{'renders/s':>12}{'ms/render':>12}{'bytes':>10}")
+    with app.test_request_context():
+        for name in args.backend or sorted(BACKENDS):
+            try:
+                backend = load_backend(
+                    name, render_html=lambda r: render_template('pdf_template.html', results=r))
+                rate, ms, size = bench(backend, safe_results, args.seconds)
+            except Exception as e:
+                print(f'{name:<14}skipped: {e}')
+                continue
+            print(f'{name:<14}{rate:>12.1f}{ms:>12.2f}{size:>10}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Measure SimilarityIndex build, snapshot and top-10 query times at up to a million profiles.
+
+Fills a scratch SQLite database with random assessments in steps up to
+--rows (default 1,000,000). At each step it builds the index from the
+table, saves the snapshot and loads it into a fresh index, then times
+--queries top-10 queries per metric. A plain Python scan over the same
+vectors (popcount per row, then ``heapq.nsmallest``) is the baseline.
+
+Usage:
+    python benchmarks/bench_similarity.py [--rows 1000000] [--queries 200]
+"""
+import argparse
+import heapq
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+SCRATCH = tempfile.mkdtemp(prefix='pf_bench_')
+os.environ['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(SCRATCH, 'similarity.db')}"
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from sqlalchemy import insert, select  # noqa: E402
+
+from app import app  # noqa: E402
+from choices import CATEGORY_FIELDS, pack_masks  # noqa: E402
+from models import Assessment, db  # noqa: E402
+from similarity import METRICS, SimilarityIndex  # noqa: E402
+
+MASKS = [getattr(Assessment, f'{field}_mask') for field in CATEGORY_FIELDS]
+
+
+def fill(count, rng, chunk=50000):
+    while count > 0:
+        n = min(chunk, count)
+        rows = [{f'{field}_mask': rng.randint(1, 63) for field in CATEGORY_FIELDS} for _ in range(n)]
+        db.session.execute(insert(Assessment), rows)
+        db.session.commit()
+        count -= n
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - started, result
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+def naive_top10(vectors, query):
+    # Jaccard over Python ints, the obvious implementation
+    def distance(item):
+        packed = item[1]
+        union = bin(packed | query).count('1')
+        return 1 - (bin(packed & query).count('1') / union if union else 0)
+    return heapq.nsmallest(10, vectors, key=distance)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    steps = [n for n in (10000, 100000) if n < args.rows] + [args.rows]
+    queries = [[rng.randint(1, 63) for _ in CATEGORY_FIELDS] for _ in range(args.queries)]
+    snapshot = os.path.join(SCRATCH, 'similarity.npz')
+
+    with app.app_context():
+        db.create_all()
+        filled = 0
+        for target in steps:
+            fill(target - filled, rng)
+            filled = target
+
+            index = SimilarityIndex(refresh_interval=3600)
+            build, _ = timed(index.refresh)
+            index.snapshot_path = snapshot
+            save, _ = timed(index.save_snapshot)
+            loaded = SimilarityIndex(snapshot_path=snapshot, refresh_interval=3600)
+            load, _ = timed(loaded.refresh)
+            assert len(loaded) == filled
+            print(f'{filled:>10} rows: build {build:.2f}s, snapshot save {save * 1000:.0f} ms, '
+                  f'load {load * 1000:.0f} ms ({os.path.getsize(snapshot) / 1e6:.1f} MB)')
+
+            for metric in METRICS:
+                samples = [timed(loaded.query, masks, 10, metric)[0] * 1000 for masks in queries]
+                print(f'{"":>16}{metric:<9} p50 {statistics.median(samples):7.2f} ms  '
+                      f'p99 {percentile(samples, 0.99):7.2f} ms')
+
+            vectors = [(row.id, pack_masks(row[1:])) for row in db.session.execute(select(Assessment.id, *MASKS))]
+            samples = [timed(naive_top10, vectors, pack_masks(masks))[0] * 1000 for masks in queries[:5]]
+            print(f'{"":>16}{"python":<9} p50 {statistics.median(samples):7.2f} ms')
+
+    print(f'scratch: {SCRATCH}')
+
+
+if __name__ == '__main__':
+    main()
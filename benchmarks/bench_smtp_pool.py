@@ -0,0 +1,91 @@
+"""Compare messages per second with one SMTP connection per message and with SMTPPool.
+
+Starts the local SMTP sink (smtp_sink.py) with --handshake-ms added to
+every new connection, standing in for the TCP, STARTTLS and AUTH round
+trips to a real provider. Then --threads senders deliver --messages
+results-sized messages, first through Flask-Mail's ``Mail.send`` (a new
+connection each time, as before) and then through ``SMTPPool``.
+
+Needs benchmarks/requirements.txt.
+
+Usage:
+    python benchmarks/bench_smtp_pool.py [--messages 500] [--threads 2] [--handshake-ms 100]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from flask import Flask  # noqa: E402
+from flask_mail import Mail, Message  # noqa: E402
+
+from loadtest import free_port  # noqa: E402
+from smtp_pool import SMTPPool  # noqa: E402
+from smtp_sink import SMTPSink  # noqa: E402
+
+# Roughly the size of a results email with its PDF attached
+ATTACHMENT = os.urandom(60 * 1024)
+
+
+def make_app(port):
+    app = Flask(__name__)
+    app.config.update(MAIL_SERVER='127.0.0.1', MAIL_PORT=port, MAIL_USE_TLS=False,
+                      MAIL_USE_SSL=False, MAIL_DEFAULT_SENDER='bench@example.com', MAIL_MAX_EMAILS=100)
+    return app
+
+
+def message(i):
+    msg = Message(f'Results {i}', recipients=[f'user{i}@example.com'], body='Your results are attached.')
+    msg.attach('ikigai_results.pdf', 'application/pdf', ATTACHMENT)
+    return msg
+
+
+def run(app, send, messages, threads):
+    counter = iter(range(messages))
+    lock = threading.Lock()
+
+    def sender():
+        with app.app_context():
+            while True:
+                with lock:
+                    i = next(counter, None)
+                if i is None:
+                    return
+                send(message(i))
+
+    workers = [threading.Thread(target=sender) for _ in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--threads', type=int, default=2, help='concurrent senders, like EMAIL_WORKERS')
+    parser.add_argument('--handshake-ms', type=float, default=100, help='simulated cost of opening a connection')
+    args = parser.parse_args()
+
+    print(f"{'transport':<24}{'msgs/s':>10}{'connections':>13}")
+    for name in ('connection per message', 'SMTPPool'):
+        with SMTPSink(port=free_port(), handshake_delay=args.handshake_ms / 1000) as sink:
+            app = make_app(sink.port)
+            mail = Mail(app)
+            if name == 'SMTPPool':
+                pool = SMTPPool(mail, size=args.threads)
+                elapsed = run(app, pool.send, args.messages, args.threads)
+                pool.close()
+            else:
+                elapsed = run(app, mail.send, args.messages, args.threads)
+            assert sink.received == args.messages, f'sink received {sink.received} of {args.messages}'
+            print(f'{name:<24}{args.messages / elapsed:>10.1f}{sink.sessions:>13}')
+
+
+if __name__ == '__main__':
+    main()
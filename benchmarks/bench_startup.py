@@ -0,0 +1,115 @@
+"""Measure cold-start time: app import and gunicorn time-to-first-response.
+
+For each of --runs runs, times ``import app`` in a fresh interpreter, then
+starts gunicorn with gunicorn_config.py and times the span from launch to
+the first successful GET /. Both a fresh database (migrations run in
+on_starting) and an already migrated one are measured. Medians are
+reported; --baseline/--save-baseline work as in loadtest.py.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 5]
+        [--baseline benchmarks/baselines/startup.json | --save-baseline FILE]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+from loadtest import REPO_DIR, free_port
+
+IMPORT_SNIPPET = 'import time; t = time.perf_counter(); import app; print(time.perf_counter() - t)'
+
+
+def environment(workdir):
+    env = dict(os.environ)
+    env.update({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(workdir, 'startup.db')}",
+        'PDF_CACHE_DIR': os.path.join(workdir, 'pdf_cache'),
+        'PROMETHEUS_MULTIPROC_DIR': os.path.join(workdir, 'metrics'),
+        # Keep logs and the similarity snapshot out of the checkout, as loadtest.py does
+        'LOG_FILE': os.path.join(workdir, 'ikigai_app.log'),
+        'SIMILARITY_SNAPSHOT': os.path.join(workdir, 'similarity.npz'),
+    })
+    os.makedirs(env['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+    return env
+
+
+def time_import(env):
+    output = subprocess.run([sys.executable, '-c', IMPORT_SNIPPET], cwd=REPO_DIR, env=env,
+                            check=True, capture_output=True, text=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def time_first_response(env, timeout=60):
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn_config.py', '--bind', f'127.0.0.1:{port}', 'app:app'],
+        cwd=REPO_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise RuntimeError('gunicorn exited during startup')
+            try:
+                if requests.get(f'http://127.0.0.1:{port}/', timeout=5).status_code == 200:
+                    return time.perf_counter() - started
+            except requests.RequestException:
+                pass
+            time.sleep(0.01)
+        raise RuntimeError(f'no response within {timeout}s')
+    finally:
+        process.terminate()
+        # A worker still booting can miss the TERM (gunicorn installs its handlers late); the
+        # master then kills it after graceful_timeout (30s)
+        process.wait(60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--baseline', help='compare against this JSON baseline')
+    parser.add_argument('--save-baseline', help='write this run to a JSON baseline file')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed regression (fraction)')
+    args = parser.parse_args()
+
+    samples = {'import_s': [], 'first_response_fresh_db_s': [], 'first_response_migrated_db_s': []}
+    for _ in range(args.runs):
+        workdir = tempfile.mkdtemp(prefix='pf_startup_')
+        try:
+            env = environment(workdir)
+            samples['import_s'].append(time_import(env))
+            samples['first_response_fresh_db_s'].append(time_first_response(env))
+            samples['first_response_migrated_db_s'].append(time_first_response(env))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {name: statistics.median(values) for name, values in samples.items()}
+    for name, value in report.items():
+        print(f'{name:<32}{value * 1000:>9.1f} ms')
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+        print(f'baseline written to {args.save_baseline}')
+    elif args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        problems = [f'{name}: {report[name] * 1000:.1f} ms > baseline {value * 1000:.1f} ms'
+                    for name, value in baseline.items() if report[name] > value * (1 + args.tolerance)]
+        for problem in problems:
+            print(f'REGRESSION {problem}')
+        if problems:
+            sys.exit(1)
+        print('no regressions against the baseline')
+
+
+if __name__ == '__main__':
+    main()
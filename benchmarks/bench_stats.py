@@ -0,0 +1,78 @@
+"""Show that /stats reads stay flat as the assessment table grows.
+
+Fills a scratch SQLite database with random assessments in steps up to
+--rows (default 1,000,000), rebuilds the counters at each step and times
+GET /stats.
+
+Usage:
+    python benchmarks/bench_stats.py [--rows 1000000] [--reads 200]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix='pf_bench_'), 'stats.db')
+os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{DB_PATH}'
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from sqlalchemy import insert  # noqa: E402
+
+import stats  # noqa: E402
+from app import app  # noqa: E402
+from choices import CATEGORY_FIELDS  # noqa: E402
+from models import Assessment, db  # noqa: E402
+
+
+def random_mask(rng):
+    # At least one option per category, like the form requires
+    return rng.randint(1, 63)
+
+
+def fill(count, rng, chunk=50000):
+    while count > 0:
+        n = min(chunk, count)
+        rows = [{f'{field}_mask': random_mask(rng) for field in CATEGORY_FIELDS} for _ in range(n)]
+        db.session.execute(insert(Assessment), rows)
+        db.session.commit()
+        count -= n
+
+
+def time_reads(client, reads):
+    client.get('/stats')
+    started = time.perf_counter()
+    for _ in range(reads):
+        response = client.get('/stats')
+        assert response.status_code == 200
+    return (time.perf_counter() - started) / reads * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--reads', type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    steps = [n for n in (1000, 10000, 100000, 1000000) if n < args.rows] + [args.rows]
+    client = app.test_client()
+
+    print(f"{'rows':>10}{'rebuild s':>12}{'ms/read':>10}")
+    with app.app_context():
+        db.create_all()
+        filled = 0
+        for target in steps:
+            fill(target - filled, rng)
+            filled = target
+            started = time.perf_counter()
+            stats.rebuild()
+            rebuild_seconds = time.perf_counter() - started
+            print(f'{filled:>10}{rebuild_seconds:>12.2f}{time_reads(client, args.reads):>10.2f}')
+
+    print(f'database: {DB_PATH}')
+
+
+if __name__ == '__main__':
+    main()
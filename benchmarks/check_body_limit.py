@@ -0,0 +1,100 @@
+"""Check that request bodies over INGEST_MAX_BYTES are refused, chunked ones included.
+
+Starts the app under gunicorn, once in the default mode and once under the
+ASGI worker, with a 2000-byte cap. It sends bulk uploads as JSON and NDJSON,
+with and without a Content-Length (requests sends a generator body
+chunked), and checks that:
+
+- bodies over the cap get 413 and nothing from them is saved;
+- bodies under the cap are saved as usual;
+- a chunked form post over the cap gets 413 too.
+
+Needs requirements-async.txt and benchmarks/requirements.txt.
+Exits with status 1 if any check fails.
+
+Usage:
+    python benchmarks/check_body_limit.py
+"""
+import argparse
+import json
+import random
+import sys
+
+import requests
+
+from loadtest import Server, random_selection
+
+API_KEY = 'body-limit-check'
+HEADERS = {'X-API-Key': API_KEY}
+LIMIT = 2000
+MODES = {
+    'gunicorn (gthread)': {'args': [], 'target': 'app:app'},
+    'gunicorn (ASGI)': {'args': ['-k', 'uvicorn.workers.UvicornWorker'], 'target': 'asgi:application'},
+}
+
+
+def chunked(data, size=100):
+    """Yield ``data`` in pieces so requests sends it with Transfer-Encoding: chunked."""
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def bodies(rng):
+    small = [random_selection(rng)]
+    large = [random_selection(rng) for _ in range(20)]
+    return {
+        'json': (json.dumps(small).encode(), json.dumps(large).encode(), 'application/json'),
+        'ndjson': (b''.join(json.dumps(item).encode() + b'\n' for item in small),
+                   b''.join(json.dumps(item).encode() + b'\n' for item in large),
+                   'application/x-ndjson'),
+    }
+
+
+def saved(url):
+    response = requests.get(url + '/export?format=ndjson', headers=HEADERS, timeout=30)
+    response.raise_for_status()
+    return len(response.content.splitlines())
+
+
+def main():
+    argparse.ArgumentParser(description=__doc__.splitlines()[0]).parse_args()
+    rng = random.Random(42)
+    problems = []
+
+    def check(ok, message):
+        print(f"{'ok  ' if ok else 'FAIL'} {message}")
+        if not ok:
+            problems.append(message)
+
+    env = {'API_KEYS': API_KEY, 'INGEST_MAX_BYTES': str(LIMIT)}
+    for mode, config in MODES.items():
+        print(f'{mode}:')
+        with Server(env=env, args=config['args'], target=config['target']) as server:
+            url = server.url + '/api/assessments'
+            expected = 0
+            for fmt, (small, large, mimetype) in bodies(rng).items():
+                headers = {**HEADERS, 'Content-Type': mimetype}
+                for how, body in (('with a Content-Length', large), ('chunked', chunked(large))):
+                    status = requests.post(url, data=body, headers=headers, timeout=30).status_code
+                    check(status == 413, f'a {len(large)}-byte {fmt} body sent {how} gets 413 (got {status})')
+                for how, body in (('with a Content-Length', small), ('chunked', chunked(small))):
+                    response = requests.post(url, data=body, headers=headers, timeout=30)
+                    inserted = response.json().get('inserted') if response.status_code == 200 else None
+                    check(inserted == 1, f'a {len(small)}-byte {fmt} body sent {how} is saved '
+                                         f'(got {response.status_code}, inserted {inserted})')
+                    expected += 1
+            count = saved(server.url)
+            check(count == expected, f'only the bodies under the cap were saved ({count}, expected {expected})')
+
+            form = b'email=' + b'x' * (LIMIT * 2)
+            status = requests.post(server.url + '/email_results', data=chunked(form), timeout=30,
+                                   headers={'Content-Type': 'application/x-www-form-urlencoded'}).status_code
+            check(status == 413, f'a chunked form post over the cap gets 413 (got {status})')
+
+    if problems:
+        sys.exit(1)
+    print('request bodies are capped')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""Check that the queries over stored assessments are served from an index.
+
+Runs the app against a scratch SQLite database, records the statements
+behind each lookup below, and asks SQLite for their plans with
+``EXPLAIN QUERY PLAN``. A plan that scans a whole table, or sorts rows the
+index already keeps in order, fails the check:
+
+- results pages by share token (``ix_assessment_token``), and by an
+  archived token (the unique index on ``archived_token.token``);
+- ``/export`` over a timestamp range (``ix_assessment_timestamp``, already
+  in export order);
+- the similarity index catching up on new rows (the ``id`` primary key).
+
+The category masks are not indexed: nothing filters on a single mask, and
+a bitwise predicate could not use a B-tree index anyway.
+
+Exits with status 1 if any check fails.
+
+Usage:
+    python benchmarks/check_query_plans.py
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+
+SCRATCH = tempfile.mkdtemp(prefix='pf_plans_')
+DATABASE = os.path.join(SCRATCH, 'assessments.db')
+API_KEY = 'query-plan-check'
+os.environ.update(
+    SQLALCHEMY_DATABASE_URI=f'sqlite:///{DATABASE}',
+    SIMILARITY_SNAPSHOT=os.path.join(SCRATCH, 'similarity.npz'),
+    API_KEYS=API_KEY,
+    EMAIL_WORKERS='0',
+)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from sqlalchemy import event  # noqa: E402
+
+import app as app_module  # noqa: E402
+import migrations  # noqa: E402
+from choices import CATEGORIES  # noqa: E402
+from models import db  # noqa: E402
+
+app = app_module.app
+HEADERS = {'X-API-Key': API_KEY}
+ROWS = 200
+
+
+class StatementLog:
+    """SELECT statements, with their parameters, run since the last ``take``."""
+
+    def __init__(self, engine):
+        self.statements = []
+        event.listen(engine, 'before_cursor_execute', self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            self.statements.append((statement, parameters))
+
+    def take(self):
+        taken, self.statements = self.statements, []
+        return taken
+
+
+def reading(statements, table):
+    return [(statement, parameters) for statement, parameters in statements if f'FROM {table}' in statement]
+
+
+def plan(statement, parameters):
+    """The detail lines of SQLite's plan for ``statement``."""
+    with sqlite3.connect(DATABASE) as conn:
+        return [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + statement, parameters)]
+
+
+def uses_index(details, table):
+    # SEARCH reads a range of an index; SCAN reads every row of the table
+    steps = [d for d in details if d.split()[1:2] == [table]]
+    return bool(steps) and all(d.startswith('SEARCH') for d in steps)
+
+
+def upload(client, count):
+    items = [{field: [choices[i % len(choices)][0]] for field, choices in CATEGORIES} for i in range(count)]
+    response = client.post('/api/assessments', json=items, headers=HEADERS)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return [result['token'] for result in response.get_json()['results']]
+
+
+def main():
+    argparse.ArgumentParser(description=__doc__.splitlines()[0]).parse_args()
+    problems = []
+
+    def check(ok, message):
+        print(f"{'ok  ' if ok else 'FAIL'} {message}")
+        if not ok:
+            problems.append(message)
+
+    def check_plans(statements, table, what, ordered=False):
+        statements = reading(statements, table)
+        check(bool(statements), f'{what} queries {table}')
+        for statement, parameters in statements:
+            details = plan(statement, parameters)
+            check(uses_index(details, table), f'{what} searches an index of {table}: {"; ".join(details)}')
+            if ordered:
+                check(not any('TEMP B-TREE' in d for d in details), f'{what} needs no sort')
+
+    with app.app_context():
+        migrations.upgrade()
+        log = StatementLog(db.engine)
+    client = app.test_client()
+    tokens = upload(client, ROWS)
+    with sqlite3.connect(DATABASE) as conn:
+        # Give the planner table statistics, as a long-lived database would have
+        conn.execute('ANALYZE')
+    log.take()
+
+    app_module.result_store._cache.clear()
+    response = client.get(f'/results/{tokens[0]}')
+    check(response.status_code == 200, 'a results page is found by its token')
+    check_plans(log.take(), 'assessment', 'a results lookup')
+
+    # A token missing from the hot table is looked up among the archived ones
+    response = client.get('/results/' + 'x' * 32)
+    check(response.status_code == 404, 'an unknown token gets 404')
+    check_plans(log.take(), 'archived_token', 'an archived token lookup')
+
+    response = client.get('/export?format=ndjson&since=2000-01-01&until=2000-01-02', headers=HEADERS)
+    check(response.status_code == 200, '/export accepts a timestamp range')
+    check_plans(log.take(), 'assessment', 'a ranged /export', ordered=True)
+
+    with app.app_context():
+        index = app_module.get_similarity_index()
+        index.refresh(force=True)
+        upload(client, 1)
+        log.take()
+        index.refresh(force=True)
+    check_plans(log.take(), 'assessment', 'a similarity catch-up', ordered=True)
+
+    print(f'scratch: {SCRATCH}')
+    if problems:
+        sys.exit(1)
+    print('lookups are served from indexes')
+
+
+if __name__ == '__main__':
+    main()
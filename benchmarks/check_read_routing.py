@@ -0,0 +1,145 @@
+"""Check that read-only work goes to the replica and writes go to the primary.
+
+Runs the app against two scratch SQLite databases, a primary and a
+"replica". The replica is a copy of the primary taken after the first
+upload, so it lags one upload behind, like a real replica would. Every
+statement is recorded with the engine that ran it, and the script checks:
+
+- uploads (POST /api/assessments) write only to the primary;
+- results pages, /stats and /export read from the replica and see its
+  (older) data;
+- a results page saved after the copy is still found by falling back to the
+  primary.
+
+Exits with status 1 if any check fails.
+
+Usage:
+    python benchmarks/check_read_routing.py
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+
+SCRATCH = tempfile.mkdtemp(prefix='pf_routing_')
+PRIMARY = os.path.join(SCRATCH, 'primary.db')
+REPLICA = os.path.join(SCRATCH, 'replica.db')
+API_KEY = 'routing-check'
+os.environ.update(
+    SQLALCHEMY_DATABASE_URI=f'sqlite:///{PRIMARY}',
+    SQLALCHEMY_REPLICA_URI=f'sqlite:///{REPLICA}',
+    API_KEYS=API_KEY,
+    SIMILARITY_INDEX='false',
+    EMAIL_WORKERS='0',
+)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from sqlalchemy import event  # noqa: E402
+
+import app as app_module  # noqa: E402
+import db_routing  # noqa: E402
+import migrations  # noqa: E402
+from choices import CATEGORIES  # noqa: E402
+from models import db  # noqa: E402
+
+app = app_module.app
+HEADERS = {'X-API-Key': API_KEY}
+
+
+class StatementLog:
+    """Statements run on each engine since the last ``take``."""
+
+    def __init__(self, engines):
+        self.statements = {name: [] for name in engines}
+        for name, engine in engines.items():
+            event.listen(engine, 'before_cursor_execute', self._recorder(name))
+
+    def _recorder(self, name):
+        def record(conn, cursor, statement, parameters, context, executemany):
+            self.statements[name].append(statement.split(None, 1)[0].upper() + ' ' + statement)
+        return record
+
+    def take(self):
+        taken = {name: list(statements) for name, statements in self.statements.items()}
+        for statements in self.statements.values():
+            statements.clear()
+        return taken
+
+
+def touches(statements, verb, table):
+    return any(s.startswith(verb) and table in s for s in statements)
+
+
+def upload(client):
+    item = {field: [choices[0][0]] for field, choices in CATEGORIES}
+    response = client.post('/api/assessments', json=[item], headers=HEADERS)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return response.get_json()['results'][0]['token']
+
+
+def replicate():
+    # The backup API copies a consistent snapshot, WAL included
+    with sqlite3.connect(PRIMARY) as source, sqlite3.connect(REPLICA) as target:
+        source.backup(target)
+
+
+def main():
+    argparse.ArgumentParser(description=__doc__.splitlines()[0]).parse_args()
+    problems = []
+
+    def check(ok, message):
+        print(f"{'ok  ' if ok else 'FAIL'} {message}")
+        if not ok:
+            problems.append(message)
+
+    with app.app_context():
+        migrations.upgrade()
+        engines = {'primary': db.engine, 'replica': db.engines[db_routing.REPLICA_BIND]}
+    check(db_routing.routed, 'SQLALCHEMY_REPLICA_URI binds the read session to the replica')
+
+    client = app.test_client()
+    log = StatementLog(engines)
+
+    replicated_token = upload(client)
+    statements = log.take()
+    check(touches(statements['primary'], 'INSERT', 'assessment'), 'uploads insert into the primary')
+    check(not statements['replica'], 'uploads run nothing on the replica')
+
+    replicate()
+    lagging_token = upload(client)
+    log.take()
+
+    app_module.result_store._cache.clear()
+    response = client.get(f'/results/{replicated_token}')
+    statements = log.take()
+    check(response.status_code == 200, 'a replicated results page is found')
+    check(touches(statements['replica'], 'SELECT', 'assessment'), 'results lookups read from the replica')
+    check(not touches(statements['primary'], 'SELECT', 'assessment'), 'and not from the primary')
+
+    response = client.get(f'/results/{lagging_token}')
+    statements = log.take()
+    check(response.status_code == 200, 'a results page not yet on the replica falls back to the primary')
+    check(touches(statements['primary'], 'SELECT', 'assessment'), 'the fallback reads from the primary')
+
+    response = client.get('/stats')
+    statements = log.take()
+    check(touches(statements['replica'], 'SELECT', 'option_stat'), '/stats reads from the replica')
+    check(not touches(statements['primary'], 'SELECT', 'option_stat'), 'and not from the primary')
+    check(response.get_json()['total'] == 1, '/stats reports the replica\'s count (1, the primary has 2)')
+
+    response = client.get('/export?format=ndjson', headers=HEADERS)
+    lines = response.get_data(as_text=True).splitlines()
+    statements = log.take()
+    check(touches(statements['replica'], 'SELECT', 'assessment'), '/export reads from the replica')
+    check(not touches(statements['primary'], 'SELECT', 'assessment'), 'and not from the primary')
+    check(len(lines) == 1, f'/export streams the replica\'s rows (got {len(lines)}, expected 1)')
+
+    print(f'scratch: {SCRATCH}')
+    if problems:
+        sys.exit(1)
+    print('reads are routed to the replica')
+
+
+if __name__ == '__main__':
+    main()
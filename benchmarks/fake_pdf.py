@@ -0,0 +1,52 @@
+"""Stand-in PDF backend for load tests.
+
+Select it with ``PDF_BACKEND=fake_pdf:FakePDFBackend`` (with ``benchmarks/``
+on ``PYTHONPATH``). It still renders pdf_template.html so template costs
+are measured, then sleeps for ``FAKE_PDF_SECONDS`` (default 0.2, roughly a
+wkhtmltopdf run; awaited in the ASGI mode) instead of starting a process,
+and returns a small valid PDF padded to ``FAKE_PDF_BYTES``.
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from pdf_backends import PDFBackend  # noqa: E402
+
+_PDF = (
+    b'%PDF-1.4\n'
+    b'1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj\n'
+    b'2 0 obj<</Type/Pages/Kids[3 0 R]/Count 1>>endobj\n'
+    b'3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 595 842]>>endobj\n'
+    b'trailer<</Root 1 0 R>>\n'
+)
+
+
+class FakePDFBackend(PDFBackend):
+    """Sleeps like a PDF renderer would and returns a fixed document."""
+
+    name = 'fake'
+
+    def __init__(self, render_html=None, seconds=None, size=None):
+        super().__init__(render_html)
+        self.seconds = float(os.environ.get('FAKE_PDF_SECONDS', 0.2) if seconds is None else seconds)
+        self.size = int(os.environ.get('FAKE_PDF_BYTES', 30000) if size is None else size)
+
+    def _document(self):
+        padding = max(self.size - len(_PDF) - len(b'%%EOF\n'), 0)
+        return _PDF + b'%' + b'0' * max(padding - 2, 0) + b'\n%%EOF\n'
+
+    def render(self, safe_results):
+        if self.render_html is not None:
+            self.render_html(safe_results)
+        time.sleep(self.seconds)
+        return self._document()
+
+    async def render_async(self, safe_results):
+        # Like an awaited wkhtmltopdf subprocess: the wait holds no thread
+        if self.render_html is not None:
+            self.render_html(safe_results)
+        await asyncio.sleep(self.seconds)
+        return self._document()
@@ -0,0 +1,339 @@
+"""Drive mixed traffic against the app under gunicorn and report latency per route.
+
+Starts gunicorn with gunicorn_config.py on a scratch SQLite database, a
+local SMTP sink (smtp_sink.py) and the fake PDF backend (fake_pdf.py), then
+runs --users virtual users for --duration seconds. Each user walks the
+site: GET /, GET /assessment, POST /assessment with the form's CSRF token,
+GET /download_pdf and POST /email_results for its own results. Throughput
+and p50/p95/p99 latency are reported per route, along with the share of
+requests the concurrency budgets shed (429/503). Shed requests are
+answered at once, so they are left out of the latencies and the
+throughput.
+
+With --baseline FILE, the run is compared to a stored baseline and the
+script exits with status 1 when a route's p95 or the overall throughput
+regresses by more than --tolerance, or a route's shed rate rises by more
+than --shed-tolerance. --save-baseline writes the run as the new baseline
+instead.
+
+Usage:
+    python benchmarks/loadtest.py [--users 4] [--duration 30]
+        [--baseline benchmarks/baselines/loadtest.json | --save-baseline FILE]
+"""
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import requests
+
+from smtp_sink import SMTPSink
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from choices import CATEGORIES  # noqa: E402
+
+CSRF_RE = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+
+# Relative weights of the user actions; each needs the results of the assessment step
+DEFAULT_MIX = {'index': 3, 'assessment': 2, 'download_pdf': 2, 'email_results': 1}
+
+# Admission control turns requests away from these routes when they are over budget
+SHED_STATUSES = {'GET /download_pdf': (429, 503), 'POST /email_results': (429, 503)}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(p / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class Server:
+    """gunicorn running the app with local stand-ins; use as a context manager."""
+
+    def __init__(self, env=None, args=(), workdir=None, target='app:app'):
+        self.workdir = workdir or tempfile.mkdtemp(prefix='pf_load_')
+        self.port = free_port()
+        self.url = f'http://127.0.0.1:{self.port}'
+        self.sink = SMTPSink(port=free_port())
+        self.env = dict(os.environ)
+        self.env.update({
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(self.workdir, 'load.db')}",
+            'PDF_CACHE_DIR': os.path.join(self.workdir, 'pdf_cache'),
+            # Keep logs and the similarity snapshot out of the checkout
+            'LOG_FILE': os.path.join(self.workdir, 'ikigai_app.log'),
+            'SIMILARITY_SNAPSHOT': os.path.join(self.workdir, 'similarity.npz'),
+            'PROMETHEUS_MULTIPROC_DIR': os.path.join(self.workdir, 'metrics'),
+            'PDF_BACKEND': 'fake_pdf:FakePDFBackend',
+            'MAIL_SERVER': '127.0.0.1',
+            'MAIL_PORT': str(self.sink.port),
+            'MAIL_USE_TLS': 'false',
+            'MAIL_USE_SSL': 'false',
+            'MAIL_DEFAULT_SENDER': 'loadtest@example.com',
+            'PYTHONPATH': os.pathsep.join(filter(None, [BENCH_DIR, os.environ.get('PYTHONPATH')])),
+        })
+        self.env.update(env or {})
+        self.args = list(args)
+        self.target = target
+        self._process = None
+
+    def start(self, timeout=60):
+        os.makedirs(self.env['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+        self.sink.start()
+        self._process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn_config.py',
+             '--bind', f'127.0.0.1:{self.port}', *self.args, self.target],
+            cwd=REPO_DIR, env=self.env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self._process.poll() is not None:
+                raise RuntimeError('gunicorn exited during startup')
+            try:
+                requests.get(self.url + '/', timeout=1)
+                return self
+            except requests.RequestException:
+                time.sleep(0.2)
+        self.stop()
+        raise RuntimeError(f'gunicorn did not answer within {timeout}s')
+
+    def stop(self):
+        if self._process is not None:
+            self._process.terminate()
+            self._process.wait(30)
+            self._process = None
+        self.sink.stop()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class Recorder:
+    """Thread-safe latency and status collection per route."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.requests = defaultdict(int)
+        self.shed = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+
+    def record(self, route, seconds, status, ok, shed=False):
+        with self._lock:
+            self.requests[route] += 1
+            self.statuses[route][status] += 1
+            if shed:
+                # Turned away without running the view; its latency says nothing about the route
+                self.shed[route] += 1
+            else:
+                self.latencies[route].append(seconds)
+            if not ok:
+                self.errors[route] += 1
+
+    def report(self, elapsed):
+        routes = {}
+        with self._lock:
+            for route, requests_made in sorted(self.requests.items()):
+                values = sorted(self.latencies[route])
+                routes[route] = {
+                    'requests': requests_made,
+                    'errors': self.errors[route],
+                    'shed': self.shed[route],
+                    'shed_rate': self.shed[route] / requests_made,
+                    'statuses': {str(k): v for k, v in sorted(self.statuses[route].items(), key=lambda item: str(item[0]))},
+                    'rps': len(values) / elapsed,
+                    'p50_ms': percentile(values, 50) * 1000,
+                    'p95_ms': percentile(values, 95) * 1000,
+                    'p99_ms': percentile(values, 99) * 1000,
+                }
+        total = sum(route['requests'] for route in routes.values())
+        served = total - sum(route['shed'] for route in routes.values())
+        return {'elapsed_s': elapsed, 'requests': total, 'rps': served / elapsed, 'routes': routes}
+
+
+def random_selection(rng):
+    return {field: rng.sample([key for key, _ in choices], rng.randint(1, 3)) for field, choices in CATEGORIES}
+
+
+class VirtualUser:
+    """One browser session walking through the site."""
+
+    def __init__(self, base_url, recorder, rng, mix, shed_statuses=None):
+        self.base_url = base_url
+        self.recorder = recorder
+        self.rng = rng
+        self.actions = list(mix)
+        self.weights = [mix[action] for action in self.actions]
+        self.shed_statuses = shed_statuses or {}
+        self.session = requests.Session()
+        self.token = None
+        self.last_response = None
+
+    def _request(self, route, method, path, expected, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=60,
+                                            allow_redirects=False, **kwargs)
+            status = response.status_code
+        except requests.RequestException:
+            response, status = None, 'error'
+        shed = status in self.shed_statuses.get(route, ())
+        self.recorder.record(route, time.perf_counter() - started, status, status == expected or shed, shed)
+        self.last_response = response
+        return response if status == expected else None
+
+    def index(self):
+        self._request('GET /', 'GET', '/', 200)
+
+    def healthz(self):
+        self._request('GET /healthz', 'GET', '/healthz', 200)
+
+    def assessment(self):
+        page = self._request('GET /assessment', 'GET', '/assessment', 200)
+        match = CSRF_RE.search(page.text) if page is not None else None
+        if match is None:
+            return
+        data = [('csrf_token', match.group(1))]
+        for field, keys in random_selection(self.rng).items():
+            data.extend((field, key) for key in keys)
+        response = self._request('POST /assessment', 'POST', '/assessment', 303, data=data)
+        if response is not None:
+            self.token = response.headers['Location'].rsplit('/', 1)[-1]
+
+    def download_pdf(self):
+        self._request('GET /download_pdf', 'GET', f'/download_pdf?token={self.token}', 200)
+
+    def email_results(self):
+        self._request('POST /email_results', 'POST', '/email_results', 202,
+                      json={'email': 'user@example.com', 'token': self.token})
+
+    def step(self):
+        if self.token is None:
+            return self.assessment()
+        action = self.rng.choices(self.actions, self.weights)[0]
+        getattr(self, action)()
+
+
+def run_load(base_url, users, duration, mix=None, seed=1, shed_statuses=None, user_class=VirtualUser):
+    """Run ``users`` virtual users for ``duration`` seconds and return the report."""
+    recorder = Recorder()
+    stop_at = time.monotonic() + duration
+
+    def loop(index):
+        user = user_class(base_url, recorder, random.Random(seed + index), mix or DEFAULT_MIX, shed_statuses)
+        while time.monotonic() < stop_at:
+            user.step()
+
+    threads = [threading.Thread(target=loop, args=(i,), daemon=True) for i in range(users)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder.report(time.perf_counter() - started)
+
+
+def print_report(report):
+    print(f"{'route':<22}{'reqs':>7}{'errors':>8}{'shed':>8}{'rps':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for route, row in report['routes'].items():
+        print(f"{route:<22}{row['requests']:>7}{row['errors']:>8}{row['shed_rate']:>8.1%}{row['rps']:>8.1f}"
+              f"{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}")
+    print(f"{'total':<22}{report['requests']:>7}{'':>16}{report['rps']:>8.1f}")
+
+
+def compare(report, baseline, tolerance, shed_tolerance):
+    """Return a list of regressions of ``report`` against ``baseline``.
+
+    ``shed_tolerance`` is how far a route's shed rate may rise above the
+    baseline's, as a fraction of its requests.
+    """
+    problems = []
+    for key in ('users', 'pdf_seconds'):
+        if report['config'][key] != baseline['config'][key]:
+            problems.append(f"--{key.replace('_', '-')} {report['config'][key]} differs from the baseline's "
+                            f"{baseline['config'][key]}")
+    if report['rps'] < baseline['rps'] * (1 - tolerance):
+        problems.append(f"throughput {report['rps']:.1f} rps < baseline {baseline['rps']:.1f} rps")
+    for route, base in baseline['routes'].items():
+        row = report['routes'].get(route)
+        if row is None:
+            problems.append(f'{route}: no requests')
+            continue
+        if row['errors']:
+            problems.append(f"{route}: {row['errors']} errors")
+        if row['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            problems.append(f"{route}: p95 {row['p95_ms']:.1f} ms > baseline {base['p95_ms']:.1f} ms")
+        if row['shed_rate'] > base['shed_rate'] + shed_tolerance:
+            problems.append(f"{route}: shed {row['shed_rate']:.1%} of requests > baseline {base['shed_rate']:.1%}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    # Four users keep the expensive routes within their concurrency budgets; hardly anything is shed
+    parser.add_argument('--users', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--pdf-seconds', type=float, default=0.2, help='fake render time per PDF')
+    parser.add_argument('--baseline', help='compare against this JSON baseline')
+    parser.add_argument('--save-baseline', help='write this run to a JSON baseline file')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed regression (fraction)')
+    parser.add_argument('--shed-tolerance', type=float, default=0.02,
+                        help='allowed rise in a route\'s shed rate (fraction of its requests)')
+    parser.add_argument('--output', help='also write the full report as JSON')
+    args = parser.parse_args()
+
+    # Virtual users click far faster than people, so per-client rate limits are off here;
+    # the per-route concurrency budgets stay on, and the requests they shed are counted apart
+    env = {'FAKE_PDF_SECONDS': str(args.pdf_seconds), 'PDF_RATE_PER_MINUTE': '0', 'EMAIL_RATE_PER_MINUTE': '0'}
+    with Server(env=env) as server:
+        report = run_load(server.url, args.users, args.duration, shed_statuses=SHED_STATUSES)
+        # Give the background email workers a moment to drain
+        time.sleep(2)
+        report['emails_delivered'] = server.sink.received
+    report['config'] = {'users': args.users, 'duration': args.duration, 'pdf_seconds': args.pdf_seconds}
+
+    print_report(report)
+    print(f"emails delivered to the sink: {report['emails_delivered']}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+        print(f'baseline written to {args.save_baseline}')
+    elif args.baseline:
+        with open(args.baseline) as f:
+            problems = compare(report, json.load(f), args.tolerance, args.shed_tolerance)
+        for problem in problems:
+            print(f'REGRESSION {problem}')
+        if problems:
+            sys.exit(1)
+        print('no regressions against the baseline')
+
+
+if __name__ == '__main__':
+    main()
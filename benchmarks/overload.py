@@ -0,0 +1,120 @@
+"""Check that the cheap routes and the health check stay responsive under a flood of expensive requests.
+
+Runs the app under gunicorn (see loadtest.py) twice, with admission
+control off and then on. Each time, --flood virtual users hammer
+/download_pdf (with slow fake renders and the PDF cache off) and
+/email_results, while --probes users fetch / and /healthz. Latency is
+reported per route, along with how many expensive requests were turned
+away with 429 or 503.
+
+The admission-controlled run must have no failed probes, a probe p99
+under --max-probe-p99-ms, and a Retry-After header on every 429 and 503;
+otherwise the script exits with status 1.
+
+Needs benchmarks/requirements.txt.
+
+Usage:
+    python benchmarks/overload.py [--flood 32] [--probes 4] [--duration 20] [--pdf-seconds 1] [--think-ms 100]
+"""
+import argparse
+import sys
+import threading
+import time
+
+from loadtest import SHED_STATUSES, Server, VirtualUser, print_report, run_load
+
+FLOOD_MIX = {'download_pdf': 3, 'email_results': 1}
+PROBE_MIX = {'index': 1, 'healthz': 1}
+PROBE_ROUTES = ('GET /', 'GET /healthz')
+
+
+class FloodUser(VirtualUser):
+    """A virtual user that also checks every 429/503 says when to retry."""
+
+    think_seconds = 0.1
+    missing_retry_after = 0
+    _lock = threading.Lock()
+
+    def step(self):
+        super().step()
+        # Pause like a client would; turned-away users would otherwise spin on fast rejections
+        time.sleep(self.think_seconds)
+
+    def _request(self, route, method, path, expected, **kwargs):
+        result = super()._request(route, method, path, expected, **kwargs)
+        response = self.last_response
+        if response is not None and response.status_code in (429, 503) and 'Retry-After' not in response.headers:
+            with FloodUser._lock:
+                FloodUser.missing_retry_after += 1
+        return result
+
+
+def run(args, admission):
+    env = {
+        'ADMISSION_CONTROL': 'true' if admission else 'false',
+        'FAKE_PDF_SECONDS': str(args.pdf_seconds),
+        # Every download renders; repeat downloads would otherwise be cheap cache hits
+        'PDF_CACHE_MEMORY_ITEMS': '0',
+        'PDF_CACHE_DISK_BYTES': '0',
+        # Every virtual user connects from 127.0.0.1; give each its own bucket
+        'RATE_LIMIT_KEY': 'session',
+    }
+    FloodUser.think_seconds = args.think_ms / 1000
+    FloodUser.missing_retry_after = 0
+    reports = {}
+    with Server(env=env) as server:
+        flood = threading.Thread(target=lambda: reports.update(flood=run_load(
+            server.url, args.flood, args.duration, FLOOD_MIX, shed_statuses=SHED_STATUSES, user_class=FloodUser)))
+        flood.start()
+        reports['probes'] = run_load(server.url, args.probes, args.duration, PROBE_MIX, seed=1000)
+        flood.join()
+    return reports
+
+
+def check(reports, max_p99_ms):
+    problems = []
+    probes = reports['probes']['routes']
+    for route in PROBE_ROUTES:
+        row = probes.get(route)
+        if row is None:
+            problems.append(f'{route}: no requests')
+            continue
+        if row['errors']:
+            problems.append(f"{route}: {row['errors']} failed")
+        if row['p99_ms'] > max_p99_ms:
+            problems.append(f"{route}: p99 {row['p99_ms']:.0f} ms > {max_p99_ms:.0f} ms")
+    shed = sum(row['shed'] for row in reports['flood']['routes'].values())
+    if not shed:
+        problems.append('the flood was never turned away; raise --flood or --pdf-seconds')
+    if FloodUser.missing_retry_after:
+        problems.append(f'{FloodUser.missing_retry_after} rejections without Retry-After')
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--flood', type=int, default=32, help='users requesting PDFs and emails')
+    parser.add_argument('--probes', type=int, default=4, help='users requesting / and /healthz')
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--pdf-seconds', type=float, default=1.0, help='fake render time per PDF')
+    parser.add_argument('--think-ms', type=float, default=100, help='pause between a flood user\'s requests')
+    parser.add_argument('--max-probe-p99-ms', type=float, default=500)
+    args = parser.parse_args()
+
+    for admission in (False, True):
+        print(f"admission control {'on' if admission else 'off'}:")
+        reports = run(args, admission)
+        print_report(reports['flood'])
+        print_report(reports['probes'])
+        print()
+
+    problems = check(reports, args.max_probe_p99_ms)
+    for problem in problems:
+        print(f'FAIL {problem}')
+    if problems:
+        sys.exit(1)
+    print('cheap routes stayed responsive under overload')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Local SMTP server that accepts and counts every message.
+
+Used by the load tests in place of Gmail. Can also be run on its own:
+
+    python benchmarks/smtp_sink.py [--port 8025]
+
+and the app pointed at it with
+``MAIL_SERVER=localhost MAIL_PORT=8025 MAIL_USE_TLS=false``.
+"""
+import argparse
+import asyncio
+import threading
+import time
+
+from aiosmtpd.controller import Controller
+
+
+class _CountingHandler:
+
+    def __init__(self, handshake_delay=0.0):
+        self.handshake_delay = handshake_delay
+        self.count = 0
+        self.bytes = 0
+        self.sessions = 0
+        self._lock = threading.Lock()
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        # Stands in for the TCP, TLS and AUTH round trips of a real provider
+        with self._lock:
+            self.sessions += 1
+        if self.handshake_delay:
+            await asyncio.sleep(self.handshake_delay)
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        with self._lock:
+            self.count += 1
+            self.bytes += len(envelope.content)
+        return '250 Message accepted'
+
+
+class SMTPSink:
+    """Runs an SMTP server on a background thread; use as a context manager.
+
+    ``handshake_delay`` adds that many seconds to every EHLO, i.e. to every
+    new connection.
+    """
+
+    def __init__(self, host='127.0.0.1', port=8025, handshake_delay=0.0):
+        self.host = host
+        self.port = port
+        self._handler = _CountingHandler(handshake_delay)
+        self._controller = Controller(self._handler, hostname=host, port=port)
+
+    @property
+    def received(self):
+        return self._handler.count
+
+    @property
+    def received_bytes(self):
+        return self._handler.bytes
+
+    @property
+    def sessions(self):
+        return self._handler.sessions
+
+    def start(self):
+        self._controller.start()
+        return self
+
+    def stop(self):
+        self._controller.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8025)
+    args = parser.parse_args()
+
+    with SMTPSink(args.host, args.port) as sink:
+        print(f'SMTP sink listening on {args.host}:{args.port}; Ctrl+C to stop')
+        try:
+            while True:
+                time.sleep(5)
+                print(f'{sink.received} messages received')
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Apply ``MAX_CONTENT_LENGTH`` to request bodies sent without a Content-Length.
+
+Werkzeug only compares ``MAX_CONTENT_LENGTH`` with the Content-Length
+header. A chunked body has none, and gunicorn marks its input as
+terminated, so Werkzeug would read it to the end whatever its size. Such
+bodies are copied here, at most one byte past the cap, and given a
+Content-Length in place of the Transfer-Encoding header; form parsing
+and the bulk API then refuse oversized ones with 413 as they do for any
+other body. The ASGI entry point caps its bodies the same way (see
+asgi.py).
+"""
+import tempfile
+
+# Bodies larger than this spill from memory to a temporary file
+SPOOL_BYTES = 1024 * 1024
+_READ_SIZE = 64 * 1024
+
+
+def buffer_body(stream, limit):
+    """Copy at most ``limit + 1`` bytes of ``stream``; return ``(file, length)``.
+
+    A length above ``limit`` means the body was too large and was cut short.
+    """
+    body = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+    length = 0
+    while length <= limit:
+        chunk = stream.read(min(_READ_SIZE, limit + 1 - length))
+        if not chunk:
+            break
+        body.write(chunk)
+        length += len(chunk)
+    body.seek(0)
+    return body, length
+
+
+class BodyLimit:
+    """WSGI middleware giving chunked request bodies a Content-Length."""
+
+    def __init__(self, wsgi_app, config):
+        self.wsgi_app = wsgi_app
+        self.config = config
+
+    def __call__(self, environ, start_response):
+        limit = self.config.get('MAX_CONTENT_LENGTH')
+        chunked = 'chunked' in environ.get('HTTP_TRANSFER_ENCODING', '').lower()
+        if limit is None or environ.get('CONTENT_LENGTH') or not chunked:
+            return self.wsgi_app(environ, start_response)
+        body, length = buffer_body(environ['wsgi.input'], limit)
+        environ['wsgi.input'] = body
+        # Werkzeug ignores Content-Length while Transfer-Encoding says chunked
+        del environ['HTTP_TRANSFER_ENCODING']
+        environ['CONTENT_LENGTH'] = str(length)
+        return self.wsgi_app(environ, start_response)
+
+
+def init_app(app):
+    """Wrap ``app.wsgi_app``; the cap is read from the config on every request."""
+    app.wsgi_app = BodyLimit(app.wsgi_app, app.config)
@@ -0,0 +1,148 @@
+"""Assessment answer options and their compact bitmask encoding.
+
+Each category has exactly six options, so a category's answers fit in a
+6-bit mask (bit ``i`` is the ``i``-th choice) and a whole assessment fits
+in 48 bits. Decoding returns keys in choice order, which is also the order
+the form submits them in.
+"""
+
+# Assessment options
+LOVE_ACTIVITIES = [
+    ('creative_expression', 'Creative Expression'),
+    ('physical_activity', 'Physical Activity'),
+    ('learning_discovery', 'Learning & Discovery'),
+    ('helping_others', 'Helping Others'),
+    ('nature_outdoors', 'Nature & Outdoors'),
+    ('tech_innovation', 'Technology & Innovation')
+]
+
+LOVE_TOPICS = [
+    ('arts_culture', 'Arts & Culture'),
+    ('social_connection', 'Social Connection'),
+    ('problem_solving', 'Problem Solving'),
+    ('music_sound', 'Music & Sound'),
+    ('writing_communication', 'Writing & Communication'),
+    ('personal_growth', 'Personal Growth')
+]
+
+SKILLS_NATURAL = [
+    ('leadership', 'Leadership'),
+    ('analysis', 'Analysis'),
+    ('communication', 'Communication'),
+    ('creativity', 'Creativity'),
+    ('technical', 'Technical Skills'),
+    ('organization', 'Organization')
+]
+
+SKILLS_COMPLIMENTS = [
+    ('problem_solving', 'Problem Solving'),
+    ('teaching', 'Teaching'),
+    ('empathy', 'Empathy'),
+    ('strategic_thinking', 'Strategic Thinking'),
+    ('adaptability', 'Adaptability'),
+    ('innovation', 'Innovation')
+]
+
+WORLD_PROBLEMS = [
+    ('environmental', 'Environmental Protection'),
+    ('education', 'Education Access'),
+    ('healthcare', 'Healthcare Innovation'),
+    ('social_justice', 'Social Justice'),
+    ('mental_health', 'Mental Health Support'),
+    ('tech_access', 'Technology Access')
+]
+
+WORLD_IMPACT = [
+    ('food_security', 'Food Security'),
+    ('economic_equality', 'Economic Equality'),
+    ('clean_energy', 'Clean Energy'),
+    ('community_building', 'Community Building'),
+    ('digital_privacy', 'Digital Privacy'),
+    ('sustainable_living', 'Sustainable Living')
+]
+
+NATURAL_ABILITIES = [
+    ('tech_development', 'Technology Development'),
+    ('healthcare_services', 'Healthcare Services'),
+    ('education_training', 'Education & Training'),
+    ('business_consulting', 'Business Consulting'),
+    ('creative_services', 'Creative Services'),
+    ('research_analysis', 'Research & Analysis')
+]
+
+INNATE_STRENGTHS = [
+    ('project_management', 'Project Management'),
+    ('social_services', 'Social Services'),
+    ('environmental_work', 'Environmental Work'),
+    ('content_creation', 'Content Creation'),
+    ('financial_services', 'Financial Services'),
+    ('entrepreneurship', 'Entrepreneurship')
+]
+
+# Categories in storage order; the packed encoding gives each one 6 bits
+CATEGORIES = [
+    ('love_activities', LOVE_ACTIVITIES),
+    ('love_topics', LOVE_TOPICS),
+    ('skills_natural', SKILLS_NATURAL),
+    ('skills_compliments', SKILLS_COMPLIMENTS),
+    ('world_problems', WORLD_PROBLEMS),
+    ('world_impact', WORLD_IMPACT),
+    ('natural_abilities', NATURAL_ABILITIES),
+    ('innate_strengths', INNATE_STRENGTHS)
+]
+
+CATEGORY_FIELDS = [field for field, _ in CATEGORIES]
+BITS_PER_CATEGORY = 6
+
+# Option key -> display label, per category
+LABELS = {field: dict(choices) for field, choices in CATEGORIES}
+
+_BITS = {
+    field: {key: 1 << i for i, (key, _) in enumerate(choices)}
+    for field, choices in CATEGORIES
+}
+_KEYS = {
+    field: [key for key, _ in choices]
+    for field, choices in CATEGORIES
+}
+
+def encode_selection(field, keys):
+    """Encode a list of option keys for one category as a bitmask."""
+    bits = _BITS[field]
+    mask = 0
+    for key in keys:
+        if key not in bits:
+            raise ValueError(f'Unknown option {key!r} for {field}')
+        mask |= bits[key]
+    return mask
+
+def decode_selection(field, mask):
+    """Decode a category bitmask back into its option keys."""
+    return [key for i, key in enumerate(_KEYS[field]) if mask >> i & 1]
+
+def encode_selections(selections):
+    """Encode a {field: [keys]} dict as {field: mask}."""
+    return {field: encode_selection(field, selections.get(field) or []) for field in CATEGORY_FIELDS}
+
+def decode_selections(masks):
+    """Decode a {field: mask} dict as {field: [keys]}."""
+    return {field: decode_selection(field, masks.get(field) or 0) for field in CATEGORY_FIELDS}
+
+def pack_masks(masks):
+    """Pack eight category masks (in CATEGORY_FIELDS order) into one 48-bit integer."""
+    packed = 0
+    for i, mask in enumerate(masks):
+        packed |= (mask & 0x3F) << (i * BITS_PER_CATEGORY)
+    return packed
+
+def unpack_masks(packed):
+    """Split a 48-bit packed integer back into eight category masks."""
+    return [packed >> (i * BITS_PER_CATEGORY) & 0x3F for i in range(len(CATEGORIES))]
+
+def parse_legacy_selection(field, text):
+    """Encode a legacy comma-joined column value, ignoring unknown keys."""
+    bits = _BITS[field]
+    mask = 0
+    for key in (text or '').split(','):
+        mask |= bits.get(key.strip(), 0)
+    return mask
@@ -0,0 +1,152 @@
+"""Connection pool sizing and read-only routing for the database.
+
+``engine_options`` sizes each worker process's connection pool from the
+threads that can hold a connection at once: gunicorn's request threads
+plus the background threads (email delivery, the group-commit writer).
+``max_connections`` caps the total over all workers so they cannot exhaust
+a managed PostgreSQL plan. Pooled connections are pinged before use, so
+connections the server or a proxy closed are replaced rather than failing
+a request. On PostgreSQL every statement gets a server-side
+``statement_timeout``, except inside ``without_statement_timeout`` (for
+migrations and maintenance commands, which may run for minutes).
+
+``reads`` is a session for read-only work: results lookups, the analytics
+counters and exports. With ``SQLALCHEMY_REPLICA_URI`` set it is bound to
+the replica; otherwise it hands out the app context's ``db.session``, so
+callers need not care. Replicas lag, so anything a request must read back right after
+writing it should go to ``db.session`` (see ``ResultStore.get``).
+"""
+import threading
+from contextlib import contextmanager
+
+from flask.globals import app_ctx
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+REPLICA_BIND = 'replica'
+
+
+def _app_ctx_id():
+    return id(app_ctx._get_current_object())
+
+
+# Set by init_app: a replica sessionmaker, or db.session itself when there is no replica
+_session_factory = None
+# Whether ``reads`` goes to a replica rather than the primary
+routed = False
+
+
+def _create_session():
+    return _session_factory()
+
+
+# Scoped to the app context like db.session
+reads = scoped_session(_create_session, scopefunc=_app_ctx_id)
+
+
+def pool_size(workers, threads, background_threads=0, max_connections=None):
+    """Connections to keep open per worker process.
+
+    Every request thread and background thread can hold one connection at
+    a time. With ``max_connections`` the size is capped at that total
+    divided between the workers (at least 1 each).
+    """
+    size = threads + background_threads
+    if max_connections:
+        size = min(size, max(max_connections // max(workers, 1), 1))
+    return size
+
+
+def engine_options(url, size, max_overflow=0, pool_timeout=10, pool_recycle=1800, statement_timeout_ms=None):
+    """``create_engine`` keyword arguments for ``url`` (SQLALCHEMY_ENGINE_OPTIONS)."""
+    url = make_url(url)
+    options = {'pool_pre_ping': True}
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        # In-memory SQLite uses a single-connection pool that takes no sizing
+        return options
+    options.update(
+        pool_size=size,
+        max_overflow=max_overflow,
+        pool_timeout=pool_timeout,
+        # Managed databases and proxies drop idle connections after a while
+        pool_recycle=pool_recycle
+    )
+    if statement_timeout_ms and url.get_backend_name() == 'postgresql':
+        options['connect_args'] = {'options': f'-c statement_timeout={int(statement_timeout_ms)}'}
+    return options
+
+
+# Depth of without_statement_timeout blocks on each thread
+_maintenance = threading.local()
+
+
+@contextmanager
+def without_statement_timeout():
+    """Lift ``statement_timeout`` for connections checked out on this thread inside the block.
+
+    Also usable as a decorator. Each connection gets the timeout back when
+    it returns to the pool.
+    """
+    depth = getattr(_maintenance, 'depth', 0)
+    _maintenance.depth = depth + 1
+    try:
+        yield
+    finally:
+        _maintenance.depth = depth
+
+
+def _set_timeout(dbapi_connection, statement):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(statement)
+    finally:
+        cursor.close()
+    # Outside a committed transaction, a later rollback would undo the SET
+    dbapi_connection.commit()
+
+
+def _lift_timeout(dbapi_connection, connection_record, connection_proxy):
+    if getattr(_maintenance, 'depth', 0):
+        _set_timeout(dbapi_connection, 'SET statement_timeout = 0')
+        connection_record.info['statement_timeout_lifted'] = True
+
+
+def _restore_timeout(dbapi_connection, connection_record):
+    # Checked in after the pool's reset-on-return rollback; back to the value set at connect
+    if dbapi_connection is not None and connection_record.info.pop('statement_timeout_lifted', False):
+        try:
+            _set_timeout(dbapi_connection, 'RESET statement_timeout')
+        except Exception as e:
+            # Never hand a request a connection without its timeout
+            connection_record.invalidate(e)
+
+
+def replica_configured(app):
+    return REPLICA_BIND in app.config.get('SQLALCHEMY_BINDS', {})
+
+
+def init_app(app, db):
+    """Point ``reads`` at the replica (if configured) or the primary; call after ``db.init_app``."""
+    global _session_factory, routed
+    routed = replica_configured(app)
+    with app.app_context():
+        if routed:
+            _session_factory = sessionmaker(bind=db.engines[REPLICA_BIND])
+        else:
+            # Share the request's primary session rather than take a second pooled connection
+            _session_factory = db.session
+        for engine in db.engines.values():
+            if engine.dialect.name == 'postgresql':
+                event.listen(engine, 'checkout', _lift_timeout)
+                event.listen(engine, 'checkin', _restore_timeout)
+
+    @app.teardown_appcontext
+    def remove_read_session(exc):
+        reads.remove()
+
+
+def dispose(db):
+    """Drop every pooled connection (the gunicorn master does this before forking)."""
+    for engine in db.engines.values():
+        engine.dispose()
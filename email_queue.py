@@ -0,0 +1,297 @@
+"""Background delivery of results emails.
+
+Jobs are persisted in the ``email_job`` table so they survive worker
+restarts. Each process runs a small pool of worker threads that claim due
+jobs from the table, render the PDF, send the message and retry failed
+deliveries with exponential backoff. In the ASGI mode, ``run_async``
+replaces the threads with tasks on the event loop.
+
+A job whose worker stops making progress is claimed again after
+``EMAIL_STALE_SECONDS``, but only if it never reached ``sending``. A job
+left in ``sending`` may already be in the recipient's inbox, so it is
+marked failed (outcome unknown) rather than sent twice; delivery is at
+most once. Log lines carry job ids, never addresses.
+"""
+import asyncio
+import json
+import logging
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_, update
+
+logger = logging.getLogger(__name__)
+
+# Job states
+QUEUED = 'queued'
+RENDERING = 'rendering'
+SENDING = 'sending'
+SENT = 'sent'
+FAILED = 'failed'
+
+IN_PROGRESS = (RENDERING, SENDING)
+
+
+class EmailQueue:
+    """Durable job queue with a per-process pool of delivery threads."""
+
+    def __init__(self, app, db, job_model, build_message, send):
+        self.app = app
+        self.db = db
+        self.Job = job_model
+        self.build_message = build_message
+        self.send = send
+        self.workers = app.config.get('EMAIL_WORKERS', 2)
+        self.max_attempts = app.config.get('EMAIL_MAX_ATTEMPTS', 5)
+        self.backoff_base = app.config.get('EMAIL_BACKOFF_SECONDS', 5)
+        self.backoff_max = app.config.get('EMAIL_BACKOFF_MAX_SECONDS', 600)
+        self.poll_interval = app.config.get('EMAIL_POLL_SECONDS', 2)
+        self.stale_after = app.config.get('EMAIL_STALE_SECONDS', 300)
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._loop = None
+        self._async_wakeup = None
+
+    def start(self):
+        """Start the worker threads for this process (idempotent)."""
+        if self._threads or self._loop is not None:
+            # Cheap check first; this runs on every request
+            return
+        with self._start_lock:
+            if self._threads or self._loop is not None:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(
+                    target=self._run, name=f'email-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        """Ask the worker threads to exit and wait for them."""
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self._stopping.clear()
+
+    def enqueue(self, email, results):
+        """Persist a delivery job and return its id."""
+        now = datetime.utcnow()
+        job = self.Job(
+            id=uuid.uuid4().hex,
+            email=email,
+            results=json.dumps(results),
+            status=QUEUED,
+            attempts=0,
+            next_attempt_at=now,
+            created_at=now,
+            updated_at=now
+        )
+        self.db.session.add(job)
+        self.db.session.commit()
+        self.start()
+        self._wake()
+        return job.id
+
+    def _wake(self):
+        self._wakeup.set()
+        if self._loop is not None:
+            # enqueue may run in a request thread; the event is only safe to set from its loop
+            self._loop.call_soon_threadsafe(self._async_wakeup.set)
+
+    def status(self, job_id):
+        """Return a JSON-serializable progress report, or None if unknown."""
+        job = self.db.session.get(self.Job, job_id)
+        if job is None:
+            return None
+        report = {
+            'job_id': job.id,
+            'status': job.status,
+            'attempts': job.attempts,
+            'max_attempts': self.max_attempts,
+            'created_at': job.created_at.isoformat(),
+            'updated_at': job.updated_at.isoformat()
+        }
+        if job.status == QUEUED and job.attempts:
+            report['next_attempt_at'] = job.next_attempt_at.isoformat()
+        if job.last_error and job.status != SENT:
+            report['last_error'] = job.last_error
+        return report
+
+    def _run(self):
+        while not self._stopping.is_set():
+            worked = False
+            # The app context scopes the db session to this iteration
+            with self.app.app_context():
+                try:
+                    worked = self.process_next()
+                except Exception:
+                    logger.exception('Email worker loop failed')
+                    self.db.session.rollback()
+            if not worked:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def _claim(self):
+        """Atomically claim the next due job; return it or None."""
+        Job = self.Job
+        while True:
+            now = datetime.utcnow()
+            stale = now - timedelta(seconds=self.stale_after)
+            candidate = Job.query.filter(or_(
+                (Job.status == QUEUED) & (Job.next_attempt_at <= now),
+                Job.status.in_(IN_PROGRESS) & (Job.updated_at < stale)
+            )).order_by(Job.next_attempt_at).first()
+            if candidate is None:
+                return None
+
+            if candidate.status == SENDING:
+                # The message may have gone out before the worker stopped; never send it twice
+                values = dict(status=FAILED, updated_at=now,
+                              last_error='Delivery outcome unknown: the worker stopped while sending')
+            else:
+                values = dict(status=RENDERING, attempts=Job.attempts + 1, updated_at=now)
+            # Compare-and-swap so two workers never claim the same job
+            result = self.db.session.execute(
+                update(Job)
+                .where(Job.id == candidate.id,
+                       Job.status == candidate.status,
+                       Job.updated_at == candidate.updated_at)
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            )
+            self.db.session.commit()
+            if result.rowcount != 1:
+                return None
+            if values['status'] == FAILED:
+                logger.warning('Email job %s stalled while sending; marked failed', candidate.id)
+                continue
+            return self.db.session.get(self.Job, candidate.id, populate_existing=True)
+
+    def _start_sending(self, job_id, attempt):
+        """Move a claimed job to SENDING; False if another worker has claimed it again since."""
+        result = self.db.session.execute(
+            update(self.Job)
+            .where(self.Job.id == job_id, self.Job.status == RENDERING, self.Job.attempts == attempt)
+            .values(status=SENDING, updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        self.db.session.commit()
+        if result.rowcount != 1:
+            logger.warning('Email job %s was claimed again by another worker; not sending it', job_id)
+            return False
+        return True
+
+    def _set(self, job, **values):
+        values.setdefault('updated_at', datetime.utcnow())
+        for key, value in values.items():
+            setattr(job, key, value)
+        self.db.session.commit()
+
+    def process_next(self):
+        """Deliver one due job. Returns True if a job was claimed."""
+        job = self._claim()
+        if job is None:
+            return False
+
+        attempt = job.attempts
+        try:
+            msg = self.build_message(job.email, json.loads(job.results))
+            if not self._start_sending(job.id, attempt):
+                return True
+            self.send(msg)
+        except Exception as e:
+            self._failed(job, e)
+            return True
+
+        self._set(job, status=SENT)
+        logger.info('Email job %s sent', job.id)
+        return True
+
+    def _failed(self, job, error):
+        self.db.session.rollback()
+        if job.attempts >= self.max_attempts:
+            logger.error('Email job %s failed permanently: %s', job.id, error)
+            self._set(job, status=FAILED, last_error=str(error))
+        else:
+            delay = min(self.backoff_base * 2 ** (job.attempts - 1), self.backoff_max)
+            logger.warning('Email job %s attempt %d failed, retrying in %ss: %s',
+                           job.id, job.attempts, delay, error)
+            self._set(job, status=QUEUED, last_error=str(error),
+                      next_attempt_at=datetime.utcnow() + timedelta(seconds=delay))
+
+    async def process_next_async(self, build_message, send):
+        """Like ``process_next``, with coroutine ``build_message`` and ``send``.
+
+        Database work runs in a thread; the caller must hold an app context.
+        """
+        job = await asyncio.to_thread(self._claim)
+        if job is None:
+            return False
+        await self._deliver_async(job, build_message, send)
+        return True
+
+    async def _deliver_async(self, job, build_message, send):
+        job_id, attempt, email, results = job.id, job.attempts, job.email, json.loads(job.results)
+        # End the read transaction so no pooled connection is held while rendering and sending
+        await asyncio.to_thread(self.db.session.rollback)
+        try:
+            msg = await build_message(email, results)
+            if not await asyncio.to_thread(self._start_sending, job_id, attempt):
+                return
+            await send(msg)
+        except Exception as e:
+            await asyncio.to_thread(self._failed, job, e)
+            return
+        await asyncio.to_thread(self._set, job, status=SENT)
+        logger.info('Email job %s sent', job_id)
+
+    async def run_async(self, build_message, send, concurrency=100):
+        """Deliver jobs on the running event loop until cancelled.
+
+        Each claimed job gets its own task, with up to ``concurrency``
+        deliveries in flight. Used instead of ``start``; no worker threads
+        are started in this process.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._async_wakeup = asyncio.Event()
+        slots = asyncio.Semaphore(concurrency)
+        tasks = set()
+
+        async def deliver(claimed):
+            try:
+                # One app context (and db session) per delivery
+                with self.app.app_context():
+                    job = await asyncio.to_thread(self._claim)
+                    claimed.set_result(job is not None)
+                    if job is not None:
+                        await self._deliver_async(job, build_message, send)
+            except Exception:
+                logger.exception('Async email delivery failed')
+                if not claimed.done():
+                    claimed.set_result(False)
+            finally:
+                slots.release()
+
+        try:
+            while True:
+                await slots.acquire()
+                # Cleared before claiming so an enqueue during the claim is not missed
+                self._async_wakeup.clear()
+                claimed = self._loop.create_future()
+                task = asyncio.create_task(deliver(claimed))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                if not await claimed:
+                    try:
+                        await asyncio.wait_for(self._async_wakeup.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            for task in list(tasks):
+                task.cancel()
+            self._loop = None
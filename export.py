@@ -0,0 +1,127 @@
+"""Streaming export of stored assessments as CSV or NDJSON.
+
+Used by ``GET /export`` and ``flask export-assessments`` to hand the
+stored assessments to offline analysis. Rows in the assessment table are
+read as plain column tuples with ``yield_per`` (a server-side cursor on
+PostgreSQL), never as ORM objects, and merged in timestamp order with the
+archived rows (see archive.py). They are encoded into chunks of roughly
+``CHUNK_BYTES`` that are optionally gzipped on the fly, so memory stays
+flat however many rows match. Each category's mask is decoded into an
+array of option keys with the matching display labels next to it. In
+CSV, arrays are joined with ``|``.
+"""
+import csv
+import io
+import json
+import zlib
+
+from sqlalchemy import func, select
+
+import archive
+from choices import CATEGORY_FIELDS, LABELS, decode_selection
+from db_routing import reads
+from models import Assessment
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+CHUNK_BYTES = 64 * 1024
+
+_COLUMNS = [Assessment.id, Assessment.timestamp] + [
+    getattr(Assessment, f'{field}_mask') for field in CATEGORY_FIELDS
+]
+
+CSV_HEADER = ['id', 'timestamp'] + [
+    name for field in CATEGORY_FIELDS for name in (field, f'{field}_labels')
+]
+
+def _decoded(field, mask):
+    keys = decode_selection(field, mask)
+    return keys, [LABELS[field][key] for key in keys]
+
+def _csv_cells(values):
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='').writerow(values)
+    return buffer.getvalue()
+
+# Every category has 64 possible masks, so each one's encoded form is built
+# once here and rows are assembled by string joins instead of json/csv calls
+_NDJSON = {
+    field: [
+        json.dumps({field: keys, f'{field}_labels': labels}, separators=(',', ':'))[1:-1]
+        for keys, labels in (_decoded(field, mask) for mask in range(64))
+    ]
+    for field in CATEGORY_FIELDS
+}
+_CSV = {
+    field: [
+        _csv_cells(['|'.join(keys), '|'.join(labels)])
+        for keys, labels in (_decoded(field, mask) for mask in range(64))
+    ]
+    for field in CATEGORY_FIELDS
+}
+
+def filter_timestamps(query, since=None, until=None):
+    """Restrict ``query`` to assessments taken in [since, until)."""
+    if since is not None:
+        query = query.where(Assessment.timestamp >= since)
+    if until is not None:
+        query = query.where(Assessment.timestamp < until)
+    return query
+
+def iter_rows(since=None, until=None, batch_size=1000):
+    """Yield ``(id, timestamp, *masks)`` for matching assessments, hot and archived, in timestamp order."""
+    archive.consistent_reads(reads)
+    # Ordered like ix_assessment_timestamp, so a range filter needs no sort
+    query = filter_timestamps(select(*_COLUMNS), since, until).order_by(Assessment.timestamp, Assessment.id)
+    hot = reads.execute(query.execution_options(yield_per=batch_size))
+    return archive.merge(hot, archive.iter_rows(since, until, reads))
+
+def count(since=None, until=None):
+    """Number of assessments, hot and archived, taken in [since, until)."""
+    archive.consistent_reads(reads)
+    hot = reads.execute(filter_timestamps(select(func.count(Assessment.id)), since, until)).scalar()
+    return hot + archive.count(since, until, reads)
+
+def _fields(row, encoded):
+    return ','.join(encoded[field][(mask or 0) & 0x3F] for field, mask in zip(CATEGORY_FIELDS, row[2:]))
+
+def _ndjson_lines(rows):
+    for row in rows:
+        timestamp = f'"{row[1].isoformat()}"' if row[1] else 'null'
+        yield f'{{"id":{row[0]},"timestamp":{timestamp},{_fields(row, _NDJSON)}}}\n'
+
+def _csv_lines(rows):
+    yield ','.join(CSV_HEADER) + '\r\n'
+    for row in rows:
+        timestamp = row[1].isoformat() if row[1] else ''
+        yield f'{row[0]},{timestamp},{_fields(row, _CSV)}\r\n'
+
+def encode(rows, fmt='ndjson', compress=False, chunk_bytes=CHUNK_BYTES):
+    """Encode ``rows`` from ``iter_rows`` as a stream of byte chunks."""
+    lines = _csv_lines(rows) if fmt == 'csv' else _ndjson_lines(rows)
+    # wbits=31 writes a gzip header and trailer
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    pending = []
+    size = 0
+    for line in lines:
+        pending.append(line)
+        size += len(line)
+        if size >= chunk_bytes:
+            data = ''.join(pending).encode('utf-8')
+            pending, size = [], 0
+            if compressor is not None:
+                data = compressor.compress(data)
+            if data:
+                yield data
+    data = ''.join(pending).encode('utf-8')
+    if compressor is not None:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+def export(since=None, until=None, fmt='ndjson', compress=False, batch_size=1000):
+    """Byte chunks of all assessments in [since, until); see ``encode``."""
+    return encode(iter_rows(since, until, batch_size), fmt, compress)
@@ -0,0 +1,168 @@
+"""Group commit for assessment submissions.
+
+Each form submission used to run its own INSERT and COMMIT, so every
+request paid for a full fsync and the gunicorn workers queued up on the
+SQLite write lock. With group commit, request threads hand their new
+assessment to a per-process writer thread. The writer inserts everything
+that arrived within a few milliseconds (or up to ``max_batch`` rows) in one
+multi-row INSERT and one transaction. Each request still blocks until the
+transaction holding its row has committed, and it gets its id back.
+
+The wait is bounded by ``timeout``. A row the writer has not picked up by
+then (the writer is stalled or has died) is withdrawn and saved by the
+request thread itself, and a dead writer is replaced. A row the writer
+has already picked up cannot be withdrawn; its unique token shows whether
+it was committed.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from sqlalchemy import insert, select
+
+import stats
+
+logger = logging.getLogger(__name__)
+
+
+class CommitTimeout(Exception):
+    """Raised when the writer holds a row but has not committed it within the timeout."""
+
+
+class GroupCommitter:
+    """Per-process write-behind buffer that commits assessments in batches."""
+
+    def __init__(self, app, db, model, max_batch=64, max_wait=0.005, timeout=10.0):
+        self.app = app
+        self.db = db
+        self.Model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.batches = 0
+        self.rows = 0
+
+    def start(self):
+        """Start the writer thread for this process (idempotent)."""
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                if self._thread is not None:
+                    logger.error('Group commit writer thread died; starting a new one')
+                self._thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+                self._thread.start()
+
+    def submit(self, assessment):
+        """Durably save a transient ``assessment`` and set its id.
+
+        The assessment must already carry its token and timestamp. Blocks
+        until the batch containing it has committed and re-raises the error
+        if saving it failed. After ``timeout`` seconds a row the writer has
+        not picked up is saved directly instead, and one it has already
+        committed is returned as usual. Only a row still in the writer's
+        open transaction raises ``CommitTimeout``; it may yet be saved.
+        """
+        future = Future()
+        self.start()
+        self._queue.put((assessment, future))
+        try:
+            assessment.id = future.result(timeout=self.timeout)
+            return assessment
+        except FutureTimeout:
+            pass
+
+        if future.cancel():
+            # Still queued, so the writer will skip it
+            logger.error('Group commit writer did not pick up a row within %.1fs; saving it directly', self.timeout)
+            self.start()
+            return self._save_directly(assessment)
+        if future.done():
+            # Finished between the timeout and the cancel
+            assessment.id = future.result()
+            return assessment
+        # In the writer's batch: only committed rows are visible to this session
+        row_id = self.db.session.execute(
+            select(self.Model.id).where(self.Model.token == assessment.token)).scalar()
+        if row_id is None:
+            raise CommitTimeout(f'Group commit did not finish within {self.timeout}s; the assessment may still be saved')
+        assessment.id = row_id
+        return assessment
+
+    def _save_directly(self, assessment):
+        self.db.session.add(assessment)
+        stats.record_assessment(assessment.masks)
+        self.db.session.commit()
+        return assessment
+
+    def _collect(self):
+        # Block for the first row, then gather more until the batch is full or the window closes
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                # Rows withdrawn by a timed-out submit are skipped; the rest can no longer be withdrawn
+                batch = [(assessment, future) for assessment, future in self._collect()
+                         if future.set_running_or_notify_cancel()]
+                if not batch:
+                    continue
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    logger.exception('Group commit writer failed')
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                finally:
+                    self.db.session.remove()
+
+    def _write(self, batch):
+        columns = [column.name for column in self.Model.__table__.columns if column.name != 'id']
+        rows = [{name: getattr(assessment, name) for name in columns} for assessment, _ in batch]
+        try:
+            result = self.db.session.execute(
+                insert(self.Model).returning(self.Model.id, self.Model.token), rows)
+            # Match ids back by the unique token so RETURNING order does not matter
+            ids = {token: row_id for row_id, token in result}
+            missing = [assessment.token for assessment, _ in batch if assessment.token not in ids]
+            if missing:
+                # Checked before committing: nothing may fail once the rows are saved
+                raise RuntimeError(f'INSERT returned no id for tokens {missing}')
+            stats.record_assessments(assessment.masks for assessment, _ in batch)
+            self.db.session.commit()
+        except Exception as e:
+            self.db.session.rollback()
+            if len(batch) > 1:
+                # Retry one by one so a single bad row does not fail its neighbours
+                for item in batch:
+                    self._write([item])
+                return
+            batch[0][1].set_exception(e)
+            return
+
+        self.batches += 1
+        self.rows += len(batch)
+        for assessment, future in batch:
+            future.set_result(ids[assessment.token])
+
+    def stats(self):
+        """Return batch counters for this process."""
+        return {
+            'batches': self.batches,
+            'rows': self.rows,
+            'pending': self._queue.qsize(),
+        }
@@ -1,5 +1,59 @@
-bind = "0.0.0.0:10000"
-workers = 2
-threads = 4
+import os
+import shutil
+import tempfile
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '10000')}"
+# app.py sizes each worker's database connection pool from the same variables
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
 worker_class = "gthread"
 timeout = 120
+# Import the app once in the master so workers fork ready to serve
+preload_app = True
+
+# Workers write Prometheus samples here so /metrics can sum them
+metrics_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "purpose_finder_metrics"))
+
+
+def on_starting(server):
+    # Samples from a previous run would otherwise be added to this one
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+    # Migrate once, before any worker serves a request
+    import migrations
+    import db_routing
+    from app import admission, app
+    from models import db
+    with app.app_context():
+        applied = migrations.upgrade()
+        if applied:
+            server.log.info("Applied schema migrations %s", applied)
+        # Workers must not share the master's pooled connections
+        db_routing.dispose(db)
+
+    # The expensive routes must leave a thread free for the cheap pages and /healthz;
+    # --threads on the command line can differ from GUNICORN_THREADS
+    gthread = server.cfg.worker_class_str == "gthread"
+    if gthread and admission.shared is not None and admission.max_threads >= server.cfg.threads:
+        limit = max(server.cfg.threads - 1, 1)
+        server.log.warning("ADMISSION_MAX_THREADS=%d leaves none of gunicorn's %d threads free; using %d",
+                           admission.max_threads, server.cfg.threads, limit)
+        admission.max_threads = admission.shared.limit = limit
+
+
+def post_fork(server, worker):
+    from app import setup_logging
+    setup_logging()
+
+
+def worker_exit(server, worker):
+    # Flush queued log records before the worker goes away
+    import log_pipeline
+    log_pipeline.shutdown()
+
+
+def child_exit(server, worker):
+    from metrics import mark_process_dead
+    mark_process_dead(worker.pid)
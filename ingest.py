@@ -0,0 +1,133 @@
+"""Bulk ingestion of completed assessments.
+
+Used by ``POST /api/assessments`` so partner programs can upload many
+assessments collected offline in one request. Items are validated against
+the choice lists directly (no WTForms), inserted in chunks with one
+transaction per chunk, and reported on one by one so a bad row never
+fails the rest of the batch.
+"""
+import json
+from datetime import datetime, timezone
+
+from choices import CATEGORY_FIELDS, encode_selection
+import stats
+from models import Assessment, db, new_result_token
+from statements import batch_statements
+
+ALLOWED_KEYS = frozenset(CATEGORY_FIELDS) | {'timestamp'}
+
+def parse_timestamp(value):
+    """Parse an ISO 8601 date/time as a naive UTC datetime; raises ValueError."""
+    timestamp = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+def validate_submission(item):
+    """Validate one submitted assessment.
+
+    Returns ``(values, errors)`` where ``values`` holds the column values
+    for a new Assessment (only meaningful when ``errors`` is empty).
+    """
+    if not isinstance(item, dict):
+        return None, ['Each assessment must be a JSON object.']
+
+    errors = []
+    unknown = set(item) - ALLOWED_KEYS
+    if unknown:
+        errors.append(f"Unknown fields: {', '.join(sorted(unknown))}")
+
+    values = {}
+    for field in CATEGORY_FIELDS:
+        keys = item.get(field)
+        if not keys:
+            errors.append(f'{field}: Please select at least one option.')
+        elif not isinstance(keys, list) or not all(isinstance(key, str) for key in keys):
+            errors.append(f'{field}: Must be a list of option keys.')
+        else:
+            try:
+                values[f'{field}_mask'] = encode_selection(field, keys)
+            except ValueError as e:
+                errors.append(f'{field}: {e}')
+
+    if 'timestamp' in item:
+        try:
+            values['timestamp'] = parse_timestamp(item['timestamp'])
+        except ValueError:
+            errors.append('timestamp: Must be an ISO 8601 date and time.')
+
+    return values, errors
+
+class ParseError:
+    """Placeholder for an item that could not be decoded."""
+
+    def __init__(self, message):
+        self.message = message
+
+def parse_ndjson(lines):
+    """Yield parsed items from NDJSON lines, or a ParseError per bad line."""
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', 'replace')
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield ParseError(f'Invalid JSON: {e}')
+
+def _insert_chunk(chunk, on_saved=None):
+    """Insert validated rows in one transaction; return per-row reports."""
+    assessments = [Assessment(token=new_result_token(), **values) for _, values in chunk]
+    try:
+        db.session.add_all(assessments)
+        db.session.flush()
+        # Capture what we report before commit expires the objects
+        saved = [(a.id, a.token, a.masks) for a in assessments]
+        stats.record_assessments(masks for _, _, masks in saved)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return [{'index': index, 'errors': [f'Could not save assessment: {e}']} for index, _ in chunk]
+
+    statements = batch_statements([masks for _, _, masks in saved])
+    reports = []
+    for (index, _), (assessment_id, token, masks), statement in zip(chunk, saved, statements):
+        if on_saved is not None:
+            on_saved(assessment_id, masks)
+        reports.append({
+            'index': index,
+            'id': assessment_id,
+            'token': token,
+            'purpose_statement': statement
+        })
+    return reports
+
+def ingest(items, chunk_size=500, max_items=10000, on_saved=None):
+    """Validate and insert ``items``; return ``(reports, inserted, failed)``.
+
+    ``on_saved(id, masks)`` is called for each assessment after its chunk commits.
+    """
+    reports = []
+    chunk = []
+    for index, item in enumerate(items):
+        if index >= max_items:
+            reports.append({'index': index, 'errors': [f'Batch limit of {max_items} assessments exceeded.']})
+            break
+        if isinstance(item, ParseError):
+            reports.append({'index': index, 'errors': [item.message]})
+            continue
+        values, errors = validate_submission(item)
+        if errors:
+            reports.append({'index': index, 'errors': errors})
+            continue
+        chunk.append((index, values))
+        if len(chunk) >= chunk_size:
+            reports.extend(_insert_chunk(chunk, on_saved))
+            chunk = []
+    if chunk:
+        reports.extend(_insert_chunk(chunk, on_saved))
+
+    reports.sort(key=lambda report: report['index'])
+    inserted = sum(1 for report in reports if 'id' in report)
+    return reports, inserted, len(reports) - inserted
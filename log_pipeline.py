@@ -0,0 +1,287 @@
+"""Non-blocking, structured logging.
+
+Request threads never write log files themselves. ``configure`` puts a
+``QueueHandler`` on the root logger that only appends records to a
+bounded in-memory queue. If the queue is full, the record is dropped and
+counted instead of waiting. One ``QueueListener`` thread per process
+formats the records as JSON lines and writes them to stderr and the log
+file.
+
+Each line carries the request id (taken from ``X-Request-ID`` or
+generated, and echoed in the response), and ``init_app`` adds one access
+record per request with its status, duration and the time spent in each
+instrumented stage (see ``metrics.observe``). DEBUG and INFO records can
+be sampled. The decision is made per request, so a sampled request keeps
+all of its lines. Warnings, errors, 5xx responses and slow requests are
+always kept.
+
+Several gunicorn workers append to the same file. ``SharedRotatingFileHandler``
+rotates it under an exclusive ``flock``, and the other workers notice the
+new file and reopen it, so rotation neither loses nor duplicates lines.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timezone
+
+from flask import g, has_request_context, request
+
+try:
+    import fcntl
+except ImportError:  # Windows; rotation is then not coordinated between processes
+    fcntl = None
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s'
+# Accepted from clients and proxies; anything else gets a fresh id
+_REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+# Attributes every LogRecord has; anything else was passed with extra=
+_RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'request_id'}
+
+access_logger = logging.getLogger('purpose_finder.access')
+
+_listener = None
+_lock = threading.Lock()
+
+
+def current_request_id():
+    """The id of the request being handled, or None outside a request."""
+    if has_request_context():
+        return g.get('request_id')
+    return None
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record, with any ``extra`` fields at the top level."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'pid': record.process,
+        }
+        if getattr(record, 'request_id', None):
+            entry['request_id'] = record.request_id
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str, separators=(',', ':'))
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a fraction of DEBUG and INFO records; WARNING and above always pass.
+
+    Within a request, the decision comes from a hash of the request id, so a
+    request's records are kept or dropped together. ``rates`` maps a logger
+    name or a level number to the fraction kept; logger names win.
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(record.name, self.rates.get(record.levelno, 1.0))
+        if rate >= 1:
+            return True
+        if rate <= 0:
+            return False
+        request_id = getattr(record, 'request_id', None)
+        if request_id:
+            return zlib.crc32(request_id.encode()) / 0x100000000 < rate
+        return random.random() < rate
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamp records with the current request id; runs on the thread that logged."""
+
+    def filter(self, record):
+        if not hasattr(record, 'request_id'):
+            record.request_id = current_request_id()
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of waiting when the queue is full."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Resolve the message and traceback now, while the arguments are still
+        # current, but keep the traceback separate for the JSON formatter
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            notice = logging.makeLogRecord({
+                'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                'msg': f'Log queue full; dropped {dropped} records', 'dropped': dropped,
+            })
+            try:
+                self.queue.put_nowait(notice)
+            except queue.Full:
+                self.dropped += dropped
+
+
+class SharedRotatingFileHandler(logging.handlers.WatchedFileHandler):
+    """Size-based rotation that is safe with several processes appending to one file.
+
+    Every process opens the file in append mode. A process that finds the file
+    over ``max_bytes`` takes an exclusive lock on ``<file>.lock``, checks again
+    and renames the backups. Every process reopens the file when it sees the
+    path now points to a different file (as ``WatchedFileHandler`` does).
+    """
+
+    def __init__(self, filename, max_bytes=10 * 1024 * 1024, backup_count=5, encoding='utf-8'):
+        super().__init__(filename, mode='a', encoding=encoding)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.lock_path = self.baseFilename + '.lock'
+
+    def emit(self, record):
+        try:
+            if self.max_bytes > 0 and self._size() >= self.max_bytes:
+                self._rotate()
+        except OSError:
+            self.handleError(record)
+        super().emit(record)
+
+    def _size(self):
+        try:
+            return os.stat(self.baseFilename).st_size
+        except FileNotFoundError:
+            return 0
+
+    def _rotate(self):
+        with open(self.lock_path, 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                # Another process may have rotated while this one waited for the lock
+                if self._size() < self.max_bytes:
+                    return
+                for i in range(self.backup_count - 1, 0, -1):
+                    source = f'{self.baseFilename}.{i}'
+                    if os.path.exists(source):
+                        os.replace(source, f'{self.baseFilename}.{i + 1}')
+                if self.backup_count > 0:
+                    os.replace(self.baseFilename, self.baseFilename + '.1')
+                else:
+                    os.remove(self.baseFilename)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+        self.reopenIfNeeded()
+
+
+def configure(level='INFO', log_file=None, max_bytes=10 * 1024 * 1024, backup_count=5,
+              sample_rates=None, queue_size=10000, console=True, fmt='json'):
+    """Route the root logger through a queue to one writer thread in this process.
+
+    ``fmt`` is 'json' or 'text' (one readable line per record, for local
+    development). Call once per process, after forking (gunicorn's
+    ``post_fork``); calling again replaces the previous setup.
+    """
+    global _listener
+    formatter = JSONFormatter() if fmt == 'json' else logging.Formatter(TEXT_FORMAT)
+    handlers = []
+    if console:
+        handlers.append(logging.StreamHandler())
+    if log_file:
+        os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+        handlers.append(SharedRotatingFileHandler(log_file, max_bytes=max_bytes, backup_count=backup_count))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    handler = NonBlockingQueueHandler(queue.Queue(queue_size))
+    # Filters run on the calling thread, before the record is queued
+    handler.addFilter(RequestIdFilter())
+    handler.addFilter(SamplingFilter(sample_rates or {}))
+
+    with _lock:
+        shutdown()
+        root = logging.getLogger()
+        for existing in root.handlers[:]:
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(level)
+        _listener = logging.handlers.QueueListener(handler.queue, *handlers, respect_handler_level=True)
+        _listener.start()
+    return handler
+
+
+def shutdown():
+    """Write out queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+# The writer thread is a daemon; flush what is still queued when the process exits
+atexit.register(shutdown)
+
+
+def init_app(app, slow_request_ms=1000):
+    """Assign request ids and log one access record per request."""
+
+    @app.before_request
+    def assign_request_id():
+        incoming = request.headers.get(REQUEST_ID_HEADER, '')
+        g.request_id = incoming if _REQUEST_ID_RE.match(incoming) else uuid.uuid4().hex
+        g.log_started = time.perf_counter()
+
+    @app.after_request
+    def log_request(response):
+        started = g.pop('log_started', None)
+        response.headers[REQUEST_ID_HEADER] = g.get('request_id', '')
+        if started is None:
+            return response
+        duration_ms = (time.perf_counter() - started) * 1000
+        slow = duration_ms >= slow_request_ms
+        level = logging.WARNING if response.status_code >= 500 or slow else logging.INFO
+        if access_logger.isEnabledFor(level):
+            access_logger.log(level, '%s %s %s', request.method, request.path, response.status_code, extra={
+                'method': request.method,
+                'path': request.path,
+                'endpoint': request.endpoint,
+                'status': response.status_code,
+                'duration_ms': round(duration_ms, 2),
+                'stages_ms': {stage: round(seconds * 1000, 2) for stage, seconds in g.get('stage_seconds', {}).items()},
+                'slow': slow,
+            })
+        return response
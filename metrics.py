@@ -0,0 +1,188 @@
+"""Prometheus instrumentation.
+
+Records per-endpoint request latency, the number of requests in flight and
+the time spent in the slow stages of a request (template rendering, PDF
+generation, SMTP and database commits), and cache hits and misses. Under gunicorn, set
+``PROMETHEUS_MULTIPROC_DIR`` (gunicorn_config.py does this) so every worker
+writes its samples to a shared directory and ``/metrics`` reports the sum
+over all workers instead of whichever worker answered the scrape.
+"""
+import os
+import threading
+import time
+from contextlib import ContextDecorator
+
+from flask import before_render_template, g, has_request_context, request, template_rendered
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+
+REQUEST_LATENCY = Histogram(
+    'purpose_finder_request_duration_seconds',
+    'Time spent handling a request',
+    ['endpoint', 'method', 'status']
+)
+STAGE_LATENCY = Histogram(
+    'purpose_finder_stage_duration_seconds',
+    'Time spent in one stage of handling a request or background job',
+    ['stage'],
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30)
+)
+IN_FLIGHT = Gauge(
+    'purpose_finder_requests_in_flight',
+    'Requests currently being handled',
+    multiprocess_mode='livesum'
+)
+CACHE_LOOKUPS = Counter(
+    'purpose_finder_cache_lookups_total',
+    'Cache lookups by cache, tier and result (hit or miss)',
+    ['cache', 'tier', 'result']
+)
+PDF_RENDERS = Counter(
+    'purpose_finder_pdf_renders_total',
+    'PDF renders by backend and result (rendered, or busy when no render slot freed up in time)',
+    ['backend', 'result']
+)
+PDF_RENDERS_WAITING = Gauge(
+    'purpose_finder_pdf_renders_waiting',
+    'PDF renders waiting for a render slot',
+    multiprocess_mode='livesum'
+)
+SMTP_SENT = Counter(
+    'purpose_finder_smtp_messages_sent_total',
+    'Messages sent over pooled SMTP connections'
+)
+SMTP_OPENED = Counter(
+    'purpose_finder_smtp_connections_opened_total',
+    'SMTP connections opened (each one a TLS handshake and login)'
+)
+SMTP_RECONNECTS = Counter(
+    'purpose_finder_smtp_reconnects_total',
+    'Pooled SMTP connections replaced because they were stale or dropped'
+)
+CACHE_EVICTIONS = Counter(
+    'purpose_finder_cache_evictions_total',
+    'Entries dropped from a cache tier to stay under its size cap',
+    ['cache', 'tier']
+)
+
+
+def observe(stage, seconds):
+    """Record ``seconds`` spent in ``stage``.
+
+    Inside a request the time also adds up in ``g.stage_seconds``, which the
+    access log reports (see log_pipeline.py).
+    """
+    STAGE_LATENCY.labels(stage=stage).observe(seconds)
+    if has_request_context():
+        stages = g.setdefault('stage_seconds', {})
+        stages[stage] = stages.get(stage, 0.0) + seconds
+
+
+class timed(ContextDecorator):
+    """Time a block or function as ``stage`` (usable as decorator or context manager)."""
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def _recreate_cm(self):
+        # A fresh timer per call, so concurrent calls of a decorated function don't share a start time
+        return timed(self.stage)
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.stage, time.perf_counter() - self.started)
+        return False
+
+
+class _StageStack(threading.local):
+    """Per-thread start times for timers driven by begin/end events."""
+
+    def __init__(self):
+        self.starts = []
+
+
+_templates = _StageStack()
+_commits = _StageStack()
+
+
+def _template_started(sender, template, context, **extra):
+    _templates.starts.append(time.perf_counter())
+
+
+def _template_finished(sender, template, context, **extra):
+    if _templates.starts:
+        observe('render_template', time.perf_counter() - _templates.starts.pop())
+
+
+def _commit_started(session):
+    _commits.starts.append(time.perf_counter())
+
+
+def _commit_finished(session):
+    if _commits.starts:
+        observe('db.commit', time.perf_counter() - _commits.starts.pop())
+
+
+def _commit_rolled_back(session, previous_transaction):
+    # A failed commit ends in a rollback instead of after_commit
+    _commit_finished(session)
+
+
+def registry():
+    """Return the registry to expose, merging all workers in multiprocess mode."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        merged = CollectorRegistry()
+        multiprocess.MultiProcessCollector(merged)
+        return merged
+    return REGISTRY
+
+
+def mark_process_dead(pid):
+    """Drop the live gauge samples of an exited worker (gunicorn child_exit hook)."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(pid)
+
+
+def init_app(app):
+    """Instrument ``app`` and register the ``/metrics`` endpoint."""
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+        IN_FLIGHT.inc()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            IN_FLIGHT.dec()
+            REQUEST_LATENCY.labels(
+                endpoint=request.endpoint or 'none',
+                method=request.method,
+                status=response.status_code
+            ).observe(time.perf_counter() - started)
+        return response
+
+    @app.teardown_request
+    def release_in_flight(exc):
+        # after_request is skipped when a view raises
+        if g.pop('metrics_started', None) is not None:
+            IN_FLIGHT.dec()
+
+    before_render_template.connect(_template_started, app)
+    template_rendered.connect(_template_finished, app)
+    # Covers the request handlers and the background workers alike
+    event.listen(Session, 'before_commit', _commit_started)
+    event.listen(Session, 'after_commit', _commit_finished)
+    event.listen(Session, 'after_soft_rollback', _commit_rolled_back)
+
+    @app.route('/metrics')
+    def metrics():
+        return generate_latest(registry()), 200, {'Content-Type': CONTENT_TYPE_LATEST}
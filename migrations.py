@@ -0,0 +1,110 @@
+"""Versioned, idempotent schema migrations.
+
+Each migration runs once per database and its number is recorded in the
+``schema_version`` table. Migrations run before the app serves requests,
+from ``flask migrate`` or the gunicorn ``on_starting`` hook, never on the
+request path. When the database is current, ``upgrade`` costs one SELECT.
+Every step is also safe to re-run, so a crash half way through just
+repeats the last step.
+
+To change the schema, append a new ``(version, description, function)``
+entry to ``MIGRATIONS``; never renumber or edit applied ones.
+"""
+import logging
+import time
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, insert, select, text
+
+import db_routing
+import stats
+from choices import CATEGORY_FIELDS
+from models import Assessment, db, migrate_legacy_selections, migrate_result_tokens
+
+logger = logging.getLogger(__name__)
+
+_metadata = MetaData()
+schema_version = Table(
+    'schema_version', _metadata,
+    Column('version', Integer, primary_key=True, autoincrement=False),
+    Column('description', String(200), nullable=False),
+    Column('applied_at', DateTime, nullable=False)
+)
+
+# Arbitrary key for the Postgres advisory lock held while migrating
+_LOCK_KEY = 7349112
+
+def create_tables():
+    # create_all only creates missing tables and indexes
+    db.create_all()
+
+def create_assessment_indexes():
+    # create_all skips indexes added to a table that already exists
+    for index in Assessment.__table__.indexes:
+        index.create(db.engine, checkfirst=True)
+
+def drop_mask_indexes():
+    # Nothing filters on a single category mask, so these only slowed down inserts
+    with db.engine.begin() as conn:
+        for field in CATEGORY_FIELDS:
+            conn.execute(text(f'DROP INDEX IF EXISTS ix_assessment_{field}_mask'))
+
+MIGRATIONS = [
+    (1, 'Create tables', create_tables),
+    (2, 'Add share tokens to older assessments', migrate_result_tokens),
+    (3, 'Convert legacy text selections to bitmasks', migrate_legacy_selections),
+    (4, 'Seed option statistics', stats.ensure_seeded),
+    (5, 'Index assessment timestamps', create_assessment_indexes),
+    (6, 'Create archive tables', create_tables),
+    (7, 'Drop unused category mask indexes', drop_mask_indexes),
+]
+
+LATEST = MIGRATIONS[-1][0]
+
+def current_version():
+    """Highest applied migration, or 0 for an empty or unversioned database."""
+    schema_version.create(db.engine, checkfirst=True)
+    with db.engine.connect() as conn:
+        return conn.execute(select(func.max(schema_version.c.version))).scalar() or 0
+
+def _lock(conn):
+    # Serialize concurrent upgrades; SQLite has a single writer anyway
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text('SELECT pg_advisory_lock(:key)'), {'key': _LOCK_KEY})
+
+def _unlock(conn):
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': _LOCK_KEY})
+
+@db_routing.without_statement_timeout()
+def upgrade():
+    """Apply pending migrations in order; return the versions applied.
+
+    Must be called inside an app context. Migrations run without the
+    PostgreSQL ``statement_timeout``, since backfilling a large table can
+    take minutes.
+    """
+    if current_version() >= LATEST:
+        return []
+
+    applied = []
+    with db.engine.connect() as lock_conn:
+        _lock(lock_conn)
+        try:
+            # Another process may have migrated while we waited for the lock
+            version = current_version()
+            for number, description, migrate in MIGRATIONS:
+                if number <= version:
+                    continue
+                started = time.perf_counter()
+                logger.info('Applying migration %d: %s', number, description)
+                migrate()
+                with db.engine.begin() as conn:
+                    conn.execute(insert(schema_version).values(
+                        version=number, description=description, applied_at=datetime.utcnow()))
+                logger.info('Migration %d done in %.2fs', number, time.perf_counter() - started)
+                applied.append(number)
+        finally:
+            _unlock(lock_conn)
+            lock_conn.commit()
+    return applied
@@ -0,0 +1,190 @@
+"""Database models for Purpose Finder."""
+from datetime import datetime
+import logging
+import secrets
+
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, inspect, text
+
+from choices import CATEGORY_FIELDS, decode_selections, encode_selections, pack_masks, parse_legacy_selection
+
+logger = logging.getLogger(__name__)
+
+db = SQLAlchemy()
+
+def new_result_token():
+    """Random, unguessable token used in shareable results URLs."""
+    return secrets.token_urlsafe(16)
+
+class Assessment(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    token = db.Column(db.String(32), unique=True, index=True, default=new_result_token)
+    # One 6-bit mask per category; see choices.encode_selection
+    love_activities_mask = db.Column(db.SmallInteger, nullable=False, default=0)
+    love_topics_mask = db.Column(db.SmallInteger, nullable=False, default=0)
+    skills_natural_mask = db.Column(db.SmallInteger, nullable=False, default=0)
+    skills_compliments_mask = db.Column(db.SmallInteger, nullable=False, default=0)
+    world_problems_mask = db.Column(db.SmallInteger, nullable=False, default=0)
+    world_impact_mask = db.Column(db.SmallInteger, nullable=False, default=0)
+    natural_abilities_mask = db.Column(db.SmallInteger, nullable=False, default=0)
+    innate_strengths_mask = db.Column(db.SmallInteger, nullable=False, default=0)
+
+    @classmethod
+    def from_selections(cls, selections, **kwargs):
+        """Build an Assessment from a {field: [option keys]} dict."""
+        masks = encode_selections(selections)
+        return cls(**{f'{field}_mask': mask for field, mask in masks.items()}, **kwargs)
+
+    @property
+    def masks(self):
+        """The eight category masks in CATEGORY_FIELDS order."""
+        return [getattr(self, f'{field}_mask') or 0 for field in CATEGORY_FIELDS]
+
+    @property
+    def packed(self):
+        """All answers as one 48-bit integer."""
+        return pack_masks(self.masks)
+
+    def selections(self):
+        """Decode the stored masks into a {field: [option keys]} dict."""
+        return decode_selections(dict(zip(CATEGORY_FIELDS, self.masks)))
+
+class OptionStat(db.Model):
+    """Materialized option counters.
+
+    Options are numbered 0-47 across all categories (see stats.option_index).
+    Row (i, i) counts assessments that picked option i, row (i, j) with
+    i < j counts assessments that picked both, and row (TOTAL, TOTAL)
+    counts all assessments.
+    """
+    a = db.Column(db.SmallInteger, primary_key=True, autoincrement=False)
+    b = db.Column(db.SmallInteger, primary_key=True, autoincrement=False)
+    count = db.Column(db.BigInteger, nullable=False, default=0)
+
+class ArchiveSegment(db.Model):
+    """A compressed, append-only batch of archived assessments (see archive.py).
+
+    ``data`` holds the rows column by column; the other columns describe
+    the batch so readers can skip segments outside a time or id range.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    row_count = db.Column(db.Integer, nullable=False)
+    min_id = db.Column(db.Integer, nullable=False)
+    max_id = db.Column(db.Integer, nullable=False)
+    min_timestamp = db.Column(db.DateTime, nullable=False, index=True)
+    max_timestamp = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    data = db.Column(db.LargeBinary, nullable=False)
+
+class ArchivedToken(db.Model):
+    """Where an archived assessment went, by share token, so results links keep working."""
+    token = db.Column(db.String(32), primary_key=True)
+    assessment_id = db.Column(db.Integer, nullable=False)
+    segment_id = db.Column(db.Integer, nullable=False, index=True)
+
+class EmailJob(db.Model):
+    id = db.Column(db.String(32), primary_key=True)
+    email = db.Column(db.String(254), nullable=False)
+    results = db.Column(db.Text, nullable=False)  # JSON-encoded safe_results
+    status = db.Column(db.String(16), nullable=False, index=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+def configure_sqlite(engine, synchronous='FULL', busy_timeout_ms=5000):
+    """Tune SQLite connections for concurrent writers; no-op on other databases.
+
+    WAL lets readers run alongside the single writer and turns each commit
+    into one sequential append. ``synchronous=FULL`` keeps every commit
+    durable; NORMAL is faster but may lose the last commits on power loss.
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute(f'PRAGMA synchronous={synchronous}')
+        cursor.execute(f'PRAGMA busy_timeout={int(busy_timeout_ms)}')
+        cursor.execute('PRAGMA temp_store=MEMORY')
+        cursor.execute('PRAGMA cache_size=-16000')
+        cursor.close()
+
+def migrate_legacy_selections(batch_size=1000):
+    """Convert comma-joined Text selection columns from older databases into masks.
+
+    Adds any missing mask columns, backfills them in batches, then drops
+    the legacy columns (or clears them where the database cannot drop
+    columns). Safe to run repeatedly.
+    """
+    inspector = inspect(db.engine)
+    if not inspector.has_table('assessment'):
+        return
+    columns = {column['name'] for column in inspector.get_columns('assessment')}
+    legacy = [field for field in CATEGORY_FIELDS if field in columns]
+    if not legacy:
+        return
+
+    logger.info('Migrating legacy assessment selections to bitmasks')
+    with db.engine.begin() as conn:
+        for field in CATEGORY_FIELDS:
+            if f'{field}_mask' not in columns:
+                conn.execute(text(
+                    f'ALTER TABLE assessment ADD COLUMN {field}_mask SMALLINT NOT NULL DEFAULT 0'))
+
+        # Backfill in id order so memory use stays flat on large tables
+        last_id = 0
+        while True:
+            rows = conn.execute(text(
+                f'SELECT id, {", ".join(legacy)} FROM assessment '
+                f'WHERE id > :last_id ORDER BY id LIMIT :limit'
+            ), {'last_id': last_id, 'limit': batch_size}).fetchall()
+            if not rows:
+                break
+            updates = []
+            for row in rows:
+                values = {'row_id': row[0]}
+                for field, value in zip(legacy, row[1:]):
+                    values[field] = parse_legacy_selection(field, value)
+                updates.append(values)
+            conn.execute(text(
+                'UPDATE assessment SET '
+                + ', '.join(f'{field}_mask = :{field}' for field in legacy)
+                + ' WHERE id = :row_id'
+            ), updates)
+            last_id = rows[-1][0]
+
+        for field in legacy:
+            try:
+                with conn.begin_nested():
+                    conn.execute(text(f'ALTER TABLE assessment DROP COLUMN {field}'))
+            except Exception:
+                # e.g. SQLite before 3.35; the column stays but is emptied
+                conn.execute(text(f'UPDATE assessment SET {field} = NULL'))
+
+def migrate_result_tokens(batch_size=1000):
+    """Add share tokens to assessments saved before results had URLs."""
+    inspector = inspect(db.engine)
+    if not inspector.has_table('assessment'):
+        return
+    columns = {column['name'] for column in inspector.get_columns('assessment')}
+
+    with db.engine.begin() as conn:
+        if 'token' not in columns:
+            logger.info('Adding share tokens to existing assessments')
+            conn.execute(text('ALTER TABLE assessment ADD COLUMN token VARCHAR(32)'))
+        while True:
+            ids = conn.execute(text(
+                'SELECT id FROM assessment WHERE token IS NULL LIMIT :limit'
+            ), {'limit': batch_size}).scalars().all()
+            if not ids:
+                break
+            conn.execute(text('UPDATE assessment SET token = :token WHERE id = :row_id'),
+                         [{'token': new_result_token(), 'row_id': row_id} for row_id in ids])
+        for index in Assessment.__table__.indexes:
+            if [column.name for column in index.columns] == ['token']:
+                index.create(conn, checkfirst=True)
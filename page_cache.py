@@ -0,0 +1,42 @@
+"""Per-process cache of the landing and assessment pages.
+
+Both pages are identical for every visitor except for the CSRF token in
+the form. Each page is rendered once per process with the request's real
+token and split around it; later requests just join the cached pieces
+with their own token, skipping Jinja and building the WTForms form.
+Requests with flashed messages are rendered normally, since the
+messages are part of the page.
+"""
+import threading
+
+from flask import session
+from flask_wtf.csrf import generate_csrf
+
+from metrics import CACHE_LOOKUPS
+
+class PageCache:
+    """Caches rendered pages with a per-request CSRF token spliced in."""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._pages = {}
+        self._lock = threading.Lock()
+
+    def render(self, name, render):
+        """Return page ``name``, calling ``render()`` to build it on a miss."""
+        if not self.enabled or '_flashes' in session:
+            return render()
+
+        # The same token the form would embed; this also stores it in the session
+        token = generate_csrf()
+        with self._lock:
+            parts = self._pages.get(name)
+        if parts is not None:
+            CACHE_LOOKUPS.labels(cache='page', tier='memory', result='hit').inc()
+            return token.join(parts)
+        CACHE_LOOKUPS.labels(cache='page', tier='memory', result='miss').inc()
+
+        html = render()
+        with self._lock:
+            self._pages[name] = html.split(token)
+        return html
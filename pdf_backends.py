@@ -0,0 +1,319 @@
+"""PDF backends for the results report.
+
+Every backend takes a normalized ``safe_results`` dict and returns PDF
+bytes. ``wkhtmltopdf`` renders ``pdf_template.html`` through pdfkit;
+``native`` draws the same fixed layout directly with a small in-process
+PDF writer, so it needs no external binary. ``load_backend`` also accepts
+a ``module:attribute`` path for custom backends.
+
+``render_async`` is used by the ASGI mode (see ``asgi.py``); backends that
+can do their work without blocking override it.
+"""
+import asyncio
+import importlib
+import zlib
+
+# Section heading followed by (results key, list label) pairs
+SECTIONS = [
+    ('What You Love', [
+        ('love_activities', 'Activities that bring you joy'),
+        ('love_topics', 'Topics that interest you'),
+    ]),
+    ("What You're Good At", [
+        ('skills_natural', 'Skills that come naturally'),
+        ('skills_compliments', 'Skills others compliment you on'),
+    ]),
+    ('What the World Needs', [
+        ('world_problems', 'Problems you want to solve'),
+        ('world_impact', 'Ways you want to make an impact'),
+    ]),
+    ('What You Can Be Paid For', [
+        ('natural_abilities', 'Your natural abilities'),
+        ('innate_strengths', 'Your innate strengths'),
+    ]),
+]
+
+EMOTIONS = [
+    ('passion_emotion', 'Passion'),
+    ('mission_emotion', 'Mission'),
+    ('profession_emotion', 'Profession'),
+    ('vocation_emotion', 'Vocation'),
+]
+
+
+class PDFBackend:
+    """Base class for PDF backends."""
+
+    name = None
+
+    def __init__(self, render_html=None):
+        self.render_html = render_html
+
+    def render(self, safe_results):
+        raise NotImplementedError
+
+    async def render_async(self, safe_results):
+        # Blocking backends run in a worker thread so the event loop stays free
+        return await asyncio.to_thread(self.render, safe_results)
+
+
+class WkhtmltopdfBackend(PDFBackend):
+    """Renders pdf_template.html with wkhtmltopdf via pdfkit."""
+
+    name = 'wkhtmltopdf'
+
+    def __init__(self, render_html=None, options=None):
+        super().__init__(render_html)
+        self.options = options or {}
+
+    @property
+    def _pdfkit(self):
+        # Imported on first render so app startup does not pay for it
+        import pdfkit
+        return pdfkit
+
+    def render(self, safe_results):
+        html = self.render_html(safe_results)
+        # output_path=False makes pdfkit return the PDF from stdout
+        return self._pdfkit.from_string(html, False, options=self.options)
+
+    async def render_async(self, safe_results):
+        # Same as pdfkit does, but the wkhtmltopdf process is awaited instead of blocking a thread
+        html = self.render_html(safe_results)
+        args = [self._pdfkit.configuration().wkhtmltopdf, '--quiet']
+        for key, value in self.options.items():
+            args.append('--' + key.lstrip('-'))
+            if value not in (None, ''):
+                args.append(str(value))
+        process = await asyncio.create_subprocess_exec(
+            *args, '-', '-',
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        pdf_data, stderr = await process.communicate(html.encode('utf-8'))
+        if process.returncode != 0 or not pdf_data:
+            raise IOError(f'wkhtmltopdf exited with code {process.returncode}: '
+                          f'{stderr.decode("utf-8", "replace").strip()}')
+        return pdf_data
+
+
+# Glyph widths (1/1000 em) for ASCII 32-126 from the standard Helvetica AFMs
+_HELVETICA_WIDTHS = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+]
+_HELVETICA_BOLD_WIDTHS = [
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611,
+    975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556,
+    333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+    611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584,
+]
+
+# Resource name -> (base font, widths); oblique shares regular metrics
+_FONTS = {
+    'F1': ('Helvetica', _HELVETICA_WIDTHS),
+    'F2': ('Helvetica-Bold', _HELVETICA_BOLD_WIDTHS),
+    'F3': ('Helvetica-Oblique', _HELVETICA_WIDTHS),
+}
+
+
+def _text_width(text, font, size):
+    widths = _FONTS[font][1]
+    total = 0
+    for ch in text:
+        code = ord(ch)
+        total += widths[code - 32] if 32 <= code <= 126 else 556
+    return total * size / 1000.0
+
+
+def _wrap(text, font, size, max_width):
+    """Greedy word wrap of a single paragraph."""
+    lines = []
+    current = ''
+    for word in text.split():
+        candidate = f'{current} {word}' if current else word
+        if current and _text_width(candidate, font, size) > max_width:
+            lines.append(current)
+            current = word
+        else:
+            current = candidate
+    if current:
+        lines.append(current)
+    return lines or ['']
+
+
+def _escape(text):
+    data = text.encode('cp1252', 'replace').decode('latin-1')
+    return data.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+class _Canvas:
+    """Accumulates drawing operators for the pages of one document."""
+
+    def __init__(self, width, height, margin):
+        self.width = width
+        self.height = height
+        self.margin = margin
+        self.pages = []
+        self.new_page()
+
+    def new_page(self):
+        self.ops = []
+        self.pages.append(self.ops)
+        # Baseline cursor, moving down the page as content is drawn
+        self.y = self.height - self.margin
+
+    def text(self, x, y, s, font='F1', size=11, color=(0.2, 0.2, 0.2)):
+        r, g, b = color
+        self.ops.append(
+            f'BT {r:.3f} {g:.3f} {b:.3f} rg /{font} {size} Tf '
+            f'{x:.2f} {y:.2f} Td ({_escape(s)}) Tj ET')
+
+    def centered(self, y, s, font='F1', size=11, color=(0.2, 0.2, 0.2)):
+        x = (self.width - _text_width(s, font, size)) / 2
+        self.text(x, y, s, font, size, color)
+
+    def rect(self, x, y, w, h, color):
+        r, g, b = color
+        self.ops.append(f'{r:.3f} {g:.3f} {b:.3f} rg {x:.2f} {y:.2f} {w:.2f} {h:.2f} re f')
+
+    def to_pdf(self):
+        objects = []
+
+        def add(body):
+            objects.append(body)
+            return len(objects)
+
+        catalog = add(None)
+        pages = add(None)
+        font_refs = {name: add(
+            f'<< /Type /Font /Subtype /Type1 /BaseFont /{base} /Encoding /WinAnsiEncoding >>'.encode('ascii'))
+            for name, (base, _) in _FONTS.items()}
+        fonts = ' '.join(f'/{name} {ref} 0 R' for name, ref in font_refs.items())
+
+        kids = []
+        for ops in self.pages:
+            stream = zlib.compress('\n'.join(ops).encode('latin-1'))
+            content = add(
+                f'<< /Length {len(stream)} /Filter /FlateDecode >>\nstream\n'.encode('ascii')
+                + stream + b'\nendstream')
+            kids.append(add(
+                f'<< /Type /Page /Parent {pages} 0 R /MediaBox [0 0 {self.width} {self.height}] '
+                f'/Resources << /Font << {fonts} >> >> /Contents {content} 0 R >>'.encode('ascii')))
+
+        objects[catalog - 1] = f'<< /Type /Catalog /Pages {pages} 0 R >>'.encode('ascii')
+        objects[pages - 1] = (
+            f'<< /Type /Pages /Kids [{" ".join(f"{k} 0 R" for k in kids)}] /Count {len(kids)} >>'
+        ).encode('ascii')
+
+        out = bytearray(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(len(out))
+            out += f'{number} 0 obj\n'.encode('ascii') + body + b'\nendobj\n'
+        xref = len(out)
+        out += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode('ascii')
+        for offset in offsets:
+            out += f'{offset:010d} 00000 n \n'.encode('ascii')
+        out += (f'trailer\n<< /Size {len(objects) + 1} /Root {catalog} 0 R >>\n'
+                f'startxref\n{xref}\n%%EOF\n').encode('ascii')
+        return bytes(out)
+
+
+class NativePDFBackend(PDFBackend):
+    """Draws the results layout directly, without a browser engine."""
+
+    name = 'native'
+
+    # A4 in points
+    page_width = 595
+    page_height = 842
+    margin = 56
+    padding = 14
+    heading = (0.173, 0.243, 0.314)  # #2c3e50
+    muted = (0.4, 0.4, 0.4)
+    section_fill = (0.973, 0.976, 0.98)  # #f8f9fa
+    statement_fill = (0.91, 0.957, 0.973)  # #e8f4f8
+
+    def render(self, safe_results):
+        canvas = _Canvas(self.page_width, self.page_height, self.margin)
+        inner = self.page_width - 2 * self.margin - 2 * self.padding
+
+        canvas.centered(canvas.y - 22, 'Your Ikigai Purpose Discovery Results', 'F2', 20, self.heading)
+        canvas.y -= 56
+
+        for heading, lists in SECTIONS:
+            lines = [('F2', 14, self.heading, heading, 20)]
+            for key, label in lists:
+                lines.append(('F2', 11, self.muted, label, 16))
+                for choice in str(safe_results.get(key, '')).split(', '):
+                    for i, line in enumerate(_wrap(choice, 'F1', 11, inner - 12)):
+                        lines.append(('F1', 11, None, ('- ' if i == 0 else '  ') + line, 15))
+            self._block(canvas, lines, self.section_fill)
+
+        lines = [('F2', 14, self.heading, 'Your Ikigai Intersections', 20)]
+        for key, label in EMOTIONS:
+            text = f"{label}: {safe_results.get(key) or 'Undefined'}"
+            lines.extend(('F1', 11, None, line, 15) for line in _wrap(text, 'F1', 11, inner))
+        self._block(canvas, lines, self.section_fill)
+
+        lines = []
+        statement = str(safe_results.get('purpose_statement', ''))
+        for paragraph in statement.split('\n'):
+            if paragraph.strip():
+                lines.extend(('F3', 11, None, line, 15) for line in _wrap(paragraph, 'F3', 11, inner))
+        self._block(canvas, lines, self.statement_fill)
+
+        canvas.centered(self.margin - 20, 'Generated by Ikigai Purpose Discovery Tool', 'F1', 9, self.muted)
+        return canvas.to_pdf()
+
+    def _block(self, canvas, lines, fill):
+        """Draw a shaded box of lines, breaking onto new pages as needed."""
+        while lines:
+            room = canvas.y - self.margin - 2 * self.padding
+            fit, height = 0, 0
+            for line in lines:
+                if height + line[4] > room and fit:
+                    break
+                fit += 1
+                height += line[4]
+            if fit < len(lines) and canvas.y < self.page_height - self.margin:
+                # Try the whole block on a fresh page before splitting it
+                total = sum(line[4] for line in lines)
+                if total <= self.page_height - 2 * self.margin - 2 * self.padding:
+                    canvas.new_page()
+                    continue
+
+            box_height = height + 2 * self.padding
+            canvas.rect(self.margin, canvas.y - box_height,
+                        self.page_width - 2 * self.margin, box_height, fill)
+            y = canvas.y - self.padding
+            for font, size, color, text, leading in lines[:fit]:
+                y -= leading
+                canvas.text(self.margin + self.padding, y + (leading - size) / 2, text,
+                            font, size, color or (0.2, 0.2, 0.2))
+            canvas.y -= box_height + 16
+            lines = lines[fit:]
+            if lines:
+                canvas.new_page()
+
+
+BACKENDS = {
+    WkhtmltopdfBackend.name: WkhtmltopdfBackend,
+    NativePDFBackend.name: NativePDFBackend,
+}
+
+
+def load_backend(name, **kwargs):
+    """Instantiate a backend by registered name or ``module:attribute`` path."""
+    if name in BACKENDS:
+        return BACKENDS[name](**kwargs)
+    if ':' not in name:
+        raise ValueError(f'Unknown PDF backend {name!r}; choose one of {sorted(BACKENDS)} '
+                         'or give a module:attribute path')
+    module_name, attr = name.split(':', 1)
+    return getattr(importlib.import_module(module_name), attr)(**kwargs)
@@ -0,0 +1,153 @@
+"""Content-addressed cache for rendered results PDFs.
+
+Results PDFs depend only on the normalized ``safe_results`` dict, and the
+answer space is small, so identical PDFs are requested over and over. The
+cache keeps recently used PDFs in an in-process LRU and spills them to a
+size-capped directory on disk that is shared by all gunicorn workers.
+Each process keeps a running total of the directory's size and only scans
+it at startup and when the total passes the cap.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from metrics import CACHE_EVICTIONS, CACHE_LOOKUPS
+
+# Evicting down to this fraction of the cap leaves room for many writes before the next scan
+_LOW_WATER = 0.9
+
+
+def cache_key(safe_results, namespace=''):
+    """Return a stable hash for a normalized results dict."""
+    payload = json.dumps(safe_results, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256((namespace + payload).encode('utf-8')).hexdigest()
+
+
+class PDFCache:
+    """Two-tier (memory + disk) LRU cache of rendered PDF bytes."""
+
+    def __init__(self, directory, memory_items=128, disk_max_bytes=256 * 1024 * 1024, namespace=''):
+        self.directory = directory
+        self.namespace = namespace
+        self.memory_items = memory_items
+        self.disk_max_bytes = disk_max_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._render_locks = {}
+        # Size of the directory at the last scan plus what this process wrote since
+        self._disk_bytes = 0
+        os.makedirs(directory, exist_ok=True)
+        self._evict_disk()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.pdf')
+
+    def _remember(self, key, data):
+        # Caller must hold self._lock
+        self._memory[key] = data
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+            CACHE_EVICTIONS.labels(cache='pdf', tier='memory').inc()
+
+    def get(self, key):
+        """Return cached PDF bytes for ``key`` or None."""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                CACHE_LOOKUPS.labels(cache='pdf', tier='memory', result='hit').inc()
+                return data
+
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            # Bump mtime so disk eviction is least-recently-used
+            os.utime(path, None)
+        except OSError:
+            return None
+
+        CACHE_LOOKUPS.labels(cache='pdf', tier='disk', result='hit').inc()
+        with self._lock:
+            self._remember(key, data)
+        return data
+
+    def put(self, key, data):
+        """Store PDF bytes in both tiers."""
+        with self._lock:
+            self._remember(key, data)
+
+        # Write atomically so other workers never read a partial file
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        with self._lock:
+            self._disk_bytes += len(data)
+            over = self._disk_bytes > self.disk_max_bytes
+        if over:
+            self._evict_disk()
+
+    def _evict_disk(self):
+        """Scan the directory and, if it is over the cap, delete the least recently used PDFs.
+
+        Other workers' writes only show up here, so the directory can run
+        over the cap by what they wrote since this process last scanned.
+        """
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.pdf'):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+        if total > self.disk_max_bytes:
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.disk_max_bytes * _LOW_WATER:
+                    break
+                try:
+                    os.unlink(path)
+                except OSError:
+                    continue
+                total -= size
+                CACHE_EVICTIONS.labels(cache='pdf', tier='disk').inc()
+        with self._lock:
+            self._disk_bytes = total
+
+    def get_or_render(self, safe_results, render):
+        """Return PDF bytes for ``safe_results``, calling ``render`` on a miss."""
+        key = cache_key(safe_results, self.namespace)
+        data = self.get(key)
+        if data is not None:
+            return data
+
+        # Only one thread per process renders a given key at a time
+        with self._lock:
+            render_lock = self._render_locks.setdefault(key, threading.Lock())
+        try:
+            with render_lock:
+                data = self.get(key)
+                if data is not None:
+                    return data
+                CACHE_LOOKUPS.labels(cache='pdf', tier='disk', result='miss').inc()
+                data = render(safe_results)
+                self.put(key, data)
+                return data
+        finally:
+            with self._lock:
+                self._render_locks.pop(key, None)
@@ -0,0 +1,98 @@
+"""Batch export of stored assessments as a ZIP of result PDFs.
+
+Rows are streamed from the database, rebuilt into results exactly like
+the results page does, and rendered by ``generate_pdf`` in a process pool.
+Only a bounded number of chunks is in flight at a time and finished PDFs
+are written straight into a streamed ZIP archive, so memory stays flat
+however many rows are exported.
+"""
+import multiprocessing
+import os
+import sys
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import export
+from choices import CATEGORY_FIELDS
+from models import Assessment
+from results_store import build_results
+
+def iter_results(since=None, until=None, batch_size=1000):
+    """Yield ``(assessment_id, timestamp, results)`` for matching rows, hot and archived."""
+    for row in export.iter_rows(since, until, batch_size):
+        # A transient Assessment gives build_results the same input as a page view
+        assessment = Assessment(
+            id=row[0], timestamp=row[1],
+            **{f'{field}_mask': mask for field, mask in zip(CATEGORY_FIELDS, row[2:])}
+        )
+        yield row[0], row[1], build_results(assessment)
+
+# The app module, imported in each worker process by _init_worker
+_app_module = None
+
+def _init_worker():
+    # Each worker process needs the app (and an app context) to render
+    global _app_module
+    import app as _app_module
+    _app_module.app.app_context().push()
+
+def _render_chunk(chunk):
+    return [(name, _app_module.generate_pdf(results)) for name, results in chunk]
+
+def _chunks(rows, size):
+    chunk = []
+    for assessment_id, timestamp, results in rows:
+        chunk.append((f'assessment-{assessment_id}-{timestamp:%Y%m%d}.pdf', results))
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def export_pdfs(output, since=None, until=None, workers=None, chunk_size=16, log=sys.stderr, log_every=2.0):
+    """Write a ZIP of result PDFs for assessments in [since, until) to ``output``.
+
+    ``output`` is a writable binary file object; it does not need to be
+    seekable. Returns the number of PDFs written.
+    """
+    workers = workers or os.cpu_count() or 1
+    total = export.count(since, until)
+    print(f'Exporting {total} assessments with {workers} workers', file=log)
+
+    started = last_report = time.perf_counter()
+    written = 0
+    written_bytes = 0
+    # Spawned workers don't inherit the parent's database connections
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker) as pool, \
+            zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_STORED) as archive:
+        pending = deque()
+        chunks = _chunks(iter_results(since, until), chunk_size)
+
+        def drain_one():
+            nonlocal written, written_bytes, last_report
+            for name, pdf_data in pending.popleft().result():
+                archive.writestr(name, pdf_data)
+                written += 1
+                written_bytes += len(pdf_data)
+            now = time.perf_counter()
+            if now - last_report >= log_every:
+                last_report = now
+                rate = written / (now - started)
+                print(f'  {written}/{total} PDFs, {rate:.1f} PDFs/s, '
+                      f'{written_bytes / (now - started) / 1e6:.2f} MB/s', file=log)
+
+        for chunk in chunks:
+            pending.append(pool.submit(_render_chunk, chunk))
+            # Bound the work in flight so memory does not grow with the row count
+            if len(pending) >= workers * 2:
+                drain_one()
+        while pending:
+            drain_one()
+
+    elapsed = time.perf_counter() - started
+    print(f'Exported {written} PDFs ({written_bytes / 1e6:.1f} MB) in {elapsed:.1f}s '
+          f'({written / elapsed if elapsed else 0:.1f} PDFs/s)', file=log)
+    return written
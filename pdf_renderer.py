@@ -0,0 +1,76 @@
+"""Bounded-concurrency PDF rendering.
+
+Renders go through a pluggable backend (see ``pdf_backends``) entirely in
+memory. A semaphore caps how many renders run at once in this process;
+excess callers wait in line up to a timeout and then get ``RenderBusy``.
+``render_async`` does the same for the ASGI mode with an asyncio semaphore,
+so waiting renders hold no threads.
+"""
+import asyncio
+import logging
+import threading
+import time
+
+from metrics import PDF_RENDERS, PDF_RENDERS_WAITING, observe
+
+logger = logging.getLogger(__name__)
+
+
+class RenderBusy(Exception):
+    """Raised when no render slot frees up within the queue timeout."""
+
+
+class PDFRenderer:
+    """Renders results to PDF bytes with a cap on concurrent renders."""
+
+    def __init__(self, backend, max_concurrent=2, queue_timeout=10, max_concurrent_async=None):
+        self.backend = backend
+        self.max_concurrent = max_concurrent
+        self.max_concurrent_async = max_concurrent_async or max_concurrent
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._async_slots = None
+
+    def render(self, safe_results):
+        """Render ``safe_results`` with the backend and return the PDF bytes."""
+        with PDF_RENDERS_WAITING.track_inprogress():
+            acquired = self._slots.acquire(timeout=self.queue_timeout)
+        if not acquired:
+            PDF_RENDERS.labels(backend=self.backend.name, result='busy').inc()
+            raise RenderBusy(f'No PDF render slot free after {self.queue_timeout}s')
+
+        try:
+            started = time.perf_counter()
+            pdf_data = self.backend.render(safe_results)
+            elapsed = time.perf_counter() - started
+        finally:
+            self._slots.release()
+        return self._rendered(pdf_data, elapsed)
+
+    async def render_async(self, safe_results):
+        """Awaitable ``render`` for use on an event loop."""
+        if self._async_slots is None:
+            # Created lazily so it binds to the loop that is running
+            self._async_slots = asyncio.Semaphore(self.max_concurrent_async)
+        try:
+            with PDF_RENDERS_WAITING.track_inprogress():
+                await asyncio.wait_for(self._async_slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            PDF_RENDERS.labels(backend=self.backend.name, result='busy').inc()
+            raise RenderBusy(f'No PDF render slot free after {self.queue_timeout}s')
+
+        try:
+            started = time.perf_counter()
+            pdf_data = await self.backend.render_async(safe_results)
+            elapsed = time.perf_counter() - started
+        finally:
+            self._async_slots.release()
+        return self._rendered(pdf_data, elapsed)
+
+    def _rendered(self, pdf_data, elapsed):
+        PDF_RENDERS.labels(backend=self.backend.name, result='rendered').inc()
+        # The backend call alone; generate_pdf also covers the wait for a slot
+        observe('pdf_render', elapsed)
+        logger.debug('Rendered PDF with %s (%d bytes) in %.3fs',
+                     self.backend.name, len(pdf_data), elapsed)
+        return pdf_data
@@ -0,0 +1,102 @@
+"""Server-side storage of assessment results.
+
+Results are rebuilt from the stored ``Assessment`` row (looked up by its
+random share token, in the archive too) instead of being carried around
+in the session cookie. Built results never change, so they are kept in a
+per-process LRU together with the ETag and Last-Modified values used to
+answer conditional GETs for ``/results/<token>``.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict, namedtuple
+
+import archive
+import db_routing
+from choices import LABELS
+from metrics import CACHE_LOOKUPS
+from models import Assessment, db
+from statements import generate_purpose_statement
+
+StoredResult = namedtuple('StoredResult', 'token results etag last_modified id masks')
+
+def build_results(assessment):
+    """Build the results dict shown to the user from a stored Assessment."""
+    selections = assessment.selections()
+    displays = {
+        field: [LABELS[field].get(x, '') for x in keys]
+        for field, keys in selections.items()
+    }
+
+    # Process results
+    results = dict(displays)
+    results.update({
+        'timestamp': assessment.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+        'passion_emotion': '',
+        'mission_emotion': '',
+        'profession_emotion': '',
+        'vocation_emotion': ''
+    })
+
+    # Generate purpose statement
+    results['purpose_statement'] = generate_purpose_statement(
+        displays['love_activities'],
+        displays['love_topics'],
+        displays['skills_natural'],
+        displays['skills_compliments'],
+        displays['world_problems'],
+        displays['world_impact'],
+        displays['natural_abilities'],
+        displays['innate_strengths']
+    )
+    return results
+
+class ResultStore:
+    """Looks up results by share token through an in-process LRU."""
+
+    def __init__(self, max_items=1024, version=''):
+        self.max_items = max_items
+        # Mixed into ETags so a change to the page invalidates client caches
+        self.version = version
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _entry(self, assessment):
+        results = build_results(assessment)
+        payload = json.dumps(results, sort_keys=True) + self.version
+        etag = hashlib.sha1(payload.encode('utf-8')).hexdigest()
+        return StoredResult(assessment.token, results, etag, assessment.timestamp.replace(microsecond=0),
+                            assessment.id, assessment.masks)
+
+    def remember(self, assessment):
+        """Cache the results of a freshly saved assessment and return them."""
+        entry = self._entry(assessment)
+        with self._lock:
+            self._cache[entry.token] = entry
+            self._cache.move_to_end(entry.token)
+            while len(self._cache) > self.max_items:
+                self._cache.popitem(last=False)
+        return entry
+
+    def get(self, token):
+        """Return the StoredResult for ``token`` or None if it is unknown."""
+        if not token:
+            return None
+        with self._lock:
+            entry = self._cache.get(token)
+            if entry is not None:
+                self._cache.move_to_end(token)
+        if entry is not None:
+            CACHE_LOOKUPS.labels(cache='results', tier='memory', result='hit').inc()
+            return entry
+        CACHE_LOOKUPS.labels(cache='results', tier='memory', result='miss').inc()
+
+        # The hot table, then the archive; with a replica, the primary too in case
+        # the assessment was just saved by another worker and is not replicated yet
+        sessions = [db_routing.reads, db.session] if db_routing.routed else [db_routing.reads]
+        for session in sessions:
+            assessment = (session.query(Assessment).filter_by(token=token).first()
+                          or archive.find(token=token, session=session))
+            if assessment is not None:
+                return self.remember(assessment)
+        return None
@@ -0,0 +1,388 @@
+"""In-memory nearest-neighbour search over stored assessments.
+
+Every assessment is one 48-bit vector with a bit per answer option (see
+``choices.pack_masks``). The index stores the vectors bit-sliced: one
+packed bitmap per option, with bit ``r`` of option ``j``'s bitmap set
+when row ``r`` picked option ``j``. That is 6 bytes a row. A query's
+intersection with every row is then a vectorized popcount across the
+bitmaps of the options it picked (or, for queries with more than half
+the bits set, of the options it did not pick). It runs as a bit-sliced
+counter over 64-row words and takes a couple dozen array operations.
+With each row's bit count stored alongside, Jaccard similarity and
+Hamming distance depend only on (intersection, bit count). So a
+histogram over those pairs finds the score cut-off for the top k
+without sorting a million floats.
+
+The index starts from a snapshot file when one exists and then catches
+up on rows with higher ids, so workers do not rescan the table at
+startup. Rows saved by this process are added as they are saved. Rows
+saved by other workers are picked up by the same catch-up, at most
+``refresh_interval`` seconds later. Archived rows (see archive.py) are
+read from their segments when the index is first loaded. Rows archived
+later are already in the index.
+
+NumPy is imported by the functions that use it, like archive.py, so this
+module costs nothing until an index is built.
+"""
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import Counter, namedtuple
+from itertools import chain
+
+from sqlalchemy import BigInteger, cast, select
+
+import archive
+from choices import BITS_PER_CATEGORY, CATEGORY_FIELDS, LABELS, decode_selection, pack_masks, unpack_masks
+from models import Assessment, db
+
+logger = logging.getLogger(__name__)
+
+METRICS = ('jaccard', 'hamming')
+
+Neighbor = namedtuple('Neighbor', 'id score masks')
+
+# Categories whose options read as directions to explore rather than traits
+PATH_FIELDS = ('natural_abilities', 'innate_strengths')
+
+_MAX_BITS = len(CATEGORY_FIELDS) * BITS_PER_CATEGORY
+# Rows are keyed by intersection * _STRIDE + bit count
+_STRIDE = _MAX_BITS + 1
+# The top-k cut-off is first estimated from every _SAMPLE_STRIDE-th row
+_SAMPLE_STRIDE = 16
+# Bitmaps are viewed as bytes for unpacking, so fix their byte order
+_WORD = '<u8'
+
+# The packed vector, computed by the database so only two columns cross into Python
+_PACKED = sum(
+    cast(getattr(Assessment, f'{field}_mask'), BigInteger) * (1 << (i * BITS_PER_CATEGORY))
+    for i, field in enumerate(CATEGORY_FIELDS)
+)
+
+def _bits(packed):
+    """Split packed vectors into a (48, n) array of 0/1 bytes."""
+    import numpy as np
+    packed = np.asarray(packed, dtype=np.int64)
+    shifts = np.arange(_MAX_BITS, dtype=np.int64)
+    return ((packed[None, :] >> shifts[:, None]) & 1).astype(np.uint8)
+
+def _unpack_rows(bitmaps, positions):
+    """The packed vectors of the rows at ``positions``."""
+    import numpy as np
+    positions = np.asarray(positions, dtype=np.int64)
+    words = bitmaps[:, positions // 64] >> (positions % 64).astype(np.uint64)
+    shifts = np.arange(_MAX_BITS, dtype=np.int64)
+    return ((words & 1).astype(np.int64) << shifts[:, None]).sum(axis=0)
+
+def _score_tables(query_bits, metric):
+    """Scores per intersection * _STRIDE + row bit count, and keys that sort them best first."""
+    import numpy as np
+    inter, bits = np.divmod(np.arange(_STRIDE * _STRIDE), _STRIDE)
+    if metric == 'hamming':
+        scores = (bits + query_bits - 2 * inter).astype(np.float64)
+        return scores, scores
+    union = bits + query_bits - inter
+    scores = np.divide(inter, union, out=np.zeros(len(union)), where=union > 0)
+    return scores, -scores
+
+def _intersections(bitmaps, row_bits, size, query):
+    """Bits each of the first ``size`` rows shares with the packed ``query``."""
+    import numpy as np
+    picked = [j for j in range(_MAX_BITS) if query >> j & 1]
+    complement = len(picked) > _MAX_BITS // 2
+    if complement:
+        # Fewer bitmaps to add up; subtract from the row's bit count afterwards
+        picked = [j for j in range(_MAX_BITS) if not query >> j & 1]
+    words = bitmaps.shape[1]
+    # counter[i] holds bit i of every row's running count
+    counter = []
+    spare = np.empty(words, _WORD)
+    for j in picked:
+        carry = bitmaps[j].copy()
+        for level in counter:
+            np.bitwise_and(level, carry, out=spare)
+            np.bitwise_xor(level, carry, out=level)
+            carry, spare = spare, carry
+        if carry.any():
+            counter.append(carry)
+            spare = np.empty(words, _WORD)
+    counts = np.zeros(words * 64, np.uint8)
+    for i, level in enumerate(counter):
+        digits = np.unpackbits(level.view(np.uint8), bitorder='little')
+        digits <<= i
+        counts |= digits
+    counts = counts[:size]
+    if complement:
+        np.subtract(row_bits, counts, out=counts)
+    return counts
+
+def _cutoff(cells, keys, wanted):
+    """The worst cell among the best ``wanted`` of ``cells``."""
+    import numpy as np
+    histogram = np.bincount(cells, minlength=_STRIDE * _STRIDE)
+    occupied = np.flatnonzero(histogram)
+    occupied = occupied[np.argsort(keys[occupied], kind='stable')]
+    reached = np.searchsorted(np.cumsum(histogram[occupied]), wanted)
+    return occupied[min(reached, len(occupied) - 1)]
+
+def _within(inter, row_bits, query_bits, cell, metric):
+    """Rows scoring at least as well as ``cell`` (an intersection * _STRIDE + bit count key)."""
+    import numpy as np
+    best_inter, best_bits = divmod(int(cell), _STRIDE)
+    lhs = inter.astype(np.uint16)
+    rhs = row_bits.astype(np.uint16)
+    rhs += query_bits
+    if metric == 'hamming':
+        # bits + q - 2 * inter <= distance
+        lhs *= 2
+        lhs += best_bits + query_bits - 2 * best_inter
+    else:
+        # inter / (bits + q - inter) >= i / u, cross-multiplied
+        lhs *= best_bits + query_bits
+        rhs *= best_inter
+    return np.flatnonzero(lhs >= rhs)
+
+class SimilarityIndex:
+    """Top-k Jaccard/Hamming search over every stored assessment."""
+
+    def __init__(self, snapshot_path=None, refresh_interval=1.0, snapshot_every=10000, batch_size=10000):
+        import numpy as np
+        self.snapshot_path = snapshot_path
+        self.refresh_interval = refresh_interval
+        self.snapshot_every = snapshot_every
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._ids = np.empty(0, dtype=np.int64)
+        self._bitmaps = np.empty((_MAX_BITS, 0), dtype=_WORD)
+        self._row_bits = np.empty(0, dtype=np.uint8)
+        self._size = 0
+        # Highest id read from the database, and ids above it added by add()
+        self.last_id = 0
+        self._added = set()
+        self._loaded = False
+        self._refreshed_at = 0.0
+        self._unsaved = 0
+
+    def __len__(self):
+        return self._size
+
+    def _reserve(self, end):
+        import numpy as np
+        if end <= len(self._ids):
+            return
+        # Grow geometrically, in whole words; queries keep using the arrays they already hold
+        capacity = -(-max(1024, 2 * len(self._ids), end) // 64) * 64
+        ids = np.empty(capacity, np.int64)
+        ids[:self._size] = self._ids[:self._size]
+        row_bits = np.empty(capacity, np.uint8)
+        row_bits[:self._size] = self._row_bits[:self._size]
+        bitmaps = np.zeros((_MAX_BITS, capacity // 64), _WORD)
+        bitmaps[:, :self._bitmaps.shape[1]] = self._bitmaps
+        self._ids, self._row_bits, self._bitmaps = ids, row_bits, bitmaps
+
+    def _append(self, ids, packed):
+        import numpy as np
+        count = len(ids)
+        if not count:
+            return
+        start, end = self._size, self._size + count
+        self._reserve(end)
+        bits = _bits(packed)
+        # Line the new rows up with the bit positions they take in the bitmaps
+        offset = start % 64
+        padded = np.zeros((_MAX_BITS, -(-(offset + count) // 64) * 64), np.uint8)
+        padded[:, offset:offset + count] = bits
+        block = np.packbits(padded, axis=1, bitorder='little').view(_WORD)
+        self._bitmaps[:, start // 64:start // 64 + block.shape[1]] |= block
+        self._ids[start:end] = ids
+        self._row_bits[start:end] = bits.sum(axis=0)
+        self._size = end
+        self._unsaved += count
+
+    def add(self, assessment_id, masks):
+        """Add a freshly saved assessment so it is found right away."""
+        with self._lock:
+            if not self._loaded or assessment_id <= self.last_id or assessment_id in self._added:
+                # Not loaded yet (the load reads it from the database) or already present
+                return
+            self._append([assessment_id], [pack_masks(masks)])
+            self._added.add(assessment_id)
+
+    def _catch_up(self):
+        import numpy as np
+        query = select(Assessment.id, _PACKED).where(Assessment.id > self.last_id).order_by(Assessment.id)
+        result = db.session.execute(query.execution_options(yield_per=self.batch_size))
+        for chunk in result.partitions():
+            # np.array() on Row objects is slow; they do not look like sequences to it
+            rows = np.fromiter(chain.from_iterable(chunk), np.int64, count=2 * len(chunk)).reshape(-1, 2)
+            ids = rows[:, 0]
+            if self._added:
+                keep = ~np.isin(ids, list(self._added))
+                rows, ids = rows[keep], ids[keep]
+            self._append(ids, rows[:, 1])
+            self.last_id = int(chunk[-1][0])
+        self._added = {assessment_id for assessment_id in self._added if assessment_id > self.last_id}
+
+    def _load_archived(self, after_id):
+        import numpy as np
+        # Rows archived since the snapshot (all of them without one) are no longer in the table.
+        # Rows archived while _catch_up ran were read there already, so skip ids already present.
+        present = np.sort(self._ids[:self._size])
+        for ids, packed in archive.vectors(after_id, session=db.session):
+            if len(present):
+                positions = np.minimum(np.searchsorted(present, ids), len(present) - 1)
+                fresh = present[positions] != ids
+                ids, packed = ids[fresh], packed[fresh]
+            self._append(ids, packed)
+
+    def refresh(self, force=False):
+        """Load on first use, then pick up rows saved by other processes."""
+        now = time.monotonic()
+        if not force and self._loaded and now - self._refreshed_at < self.refresh_interval:
+            return
+        with self._lock:
+            if not self._loaded:
+                self._load_snapshot()
+                snapshot_id = self.last_id
+                self._catch_up()
+                self._load_archived(snapshot_id)
+                self._loaded = True
+            else:
+                self._catch_up()
+            self._refreshed_at = now
+            save = self.snapshot_path and self._unsaved >= self.snapshot_every
+        if save:
+            self.save_snapshot()
+
+    def _load_snapshot(self):
+        import numpy as np
+        if not self.snapshot_path:
+            return
+        try:
+            with np.load(self.snapshot_path) as data:
+                ids, bitmaps, row_bits = data['ids'], data['bitmaps'].astype(_WORD), data['row_bits']
+                last_id, added = int(data['last_id']), data['added']
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning('Ignoring unreadable similarity snapshot %s: %s', self.snapshot_path, e)
+            return
+        if not self._matches_database(ids, bitmaps):
+            logger.warning('Similarity snapshot %s does not match the database; rebuilding', self.snapshot_path)
+            return
+        self._ids, self._bitmaps, self._row_bits, self._size = ids, bitmaps, row_bits, len(ids)
+        self.last_id = last_id
+        self._added = set(added.tolist())
+        logger.info('Loaded %d profiles from similarity snapshot', len(ids))
+
+    def _matches_database(self, ids, bitmaps):
+        import numpy as np
+        # The newest snapshotted row must still exist with the same answers
+        if not len(ids):
+            return True
+        position = int(np.argmax(ids))
+        newest = int(ids[position])
+        row = db.session.execute(select(_PACKED).where(Assessment.id == newest)).first()
+        if row is not None:
+            packed = row[0]
+        else:
+            archived = archive.find(assessment_id=newest, session=db.session)
+            packed = archived.packed if archived is not None else None
+        return packed is not None and packed == int(_unpack_rows(bitmaps, [position])[0])
+
+    def save_snapshot(self):
+        """Atomically write the index to ``snapshot_path``."""
+        import numpy as np
+        with self._lock:
+            size = self._size
+            ids, row_bits = self._ids[:size], self._row_bits[:size]
+            # Copied, since add() may still set bits in the last word
+            bitmaps = self._bitmaps[:, :-(-size // 64)].copy()
+            last_id, added = self.last_id, sorted(self._added)
+            self._unsaved = 0
+        directory = os.path.dirname(os.path.abspath(self.snapshot_path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, ids=ids, bitmaps=bitmaps, row_bits=row_bits,
+                         last_id=np.int64(last_id), added=np.asarray(added, np.int64))
+            # Several workers may save at once; each replace is atomic
+            os.replace(tmp_path, self.snapshot_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        logger.info('Saved %d profiles to similarity snapshot %s', size, self.snapshot_path)
+
+    def query(self, masks, k=10, metric='jaccard', exclude_id=None):
+        """The ``k`` stored assessments most similar to ``masks``, best first.
+
+        ``score`` is the Jaccard similarity (higher is closer) or the
+        Hamming distance in bits (lower is closer).
+        """
+        import numpy as np
+        if metric not in METRICS:
+            raise ValueError(f'metric must be one of {METRICS}')
+        self.refresh()
+        with self._lock:
+            size = self._size
+            ids, row_bits = self._ids[:size], self._row_bits[:size]
+            bitmaps = self._bitmaps[:, :-(-size // 64)]
+        if not size or k <= 0:
+            return []
+
+        query = pack_masks(masks)
+        query_bits = bin(query).count('1')
+        inter = _intersections(bitmaps, row_bits, size, query)
+        cells = inter.astype(np.uint16)
+        cells *= _STRIDE
+        cells += row_bits
+        scores, keys = _score_tables(query_bits, metric)
+
+        # Candidates are every row scoring at least as well as a cut-off. Once there are
+        # k + 1 of them (one may be the excluded id) they are sure to hold the top k
+        wanted = min(k + 1, size)
+        candidates = ()
+        if size >= 64 * _SAMPLE_STRIDE:
+            # Each sampled row stands for about _SAMPLE_STRIDE; the margin makes the full pass rare
+            sampled = _cutoff(cells[::_SAMPLE_STRIDE], keys, wanted // _SAMPLE_STRIDE + 4)
+            candidates = _within(inter, row_bits, query_bits, sampled, metric)
+        if len(candidates) < wanted:
+            candidates = _within(inter, row_bits, query_bits, _cutoff(cells, keys, wanted), metric)
+        candidate_keys = keys[cells[candidates]]
+        # Best score first, then the most recent
+        candidates = candidates[np.lexsort((-ids[candidates], candidate_keys))]
+        if exclude_id is not None:
+            candidates = candidates[ids[candidates] != exclude_id]
+        candidates = candidates[:k]
+
+        return [
+            Neighbor(int(ids[position]), float(scores[cells[position]]), unpack_masks(int(packed)))
+            for position, packed in zip(candidates, _unpack_rows(bitmaps, candidates))
+        ]
+
+    def people_like_you(self, assessment_id, masks, k=10, limit=3):
+        """Summarize what the ``k`` most similar other profiles chose.
+
+        Returns None when there is nobody to compare with, else a dict with
+        the neighbour ``count``, their average Jaccard ``similarity`` and up
+        to ``limit`` ``paths``: options from PATH_FIELDS this profile did not
+        pick, with how many neighbours picked each.
+        """
+        neighbors = self.query(masks, k=k, exclude_id=assessment_id)
+        if not neighbors:
+            return None
+        own = dict(zip(CATEGORY_FIELDS, masks))
+        counts = Counter()
+        for neighbor in neighbors:
+            for field, mask in zip(CATEGORY_FIELDS, neighbor.masks):
+                if field in PATH_FIELDS:
+                    counts.update((field, key) for key in decode_selection(field, mask & ~own[field]))
+        return {
+            'count': len(neighbors),
+            'similarity': sum(neighbor.score for neighbor in neighbors) / len(neighbors),
+            'paths': [{'label': LABELS[field][key], 'count': count}
+                      for (field, key), count in counts.most_common(limit)]
+        }
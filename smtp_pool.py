@@ -0,0 +1,119 @@
+"""Pooled, persistent SMTP connections.
+
+Flask-Mail's ``Mail.send`` opens a connection, runs STARTTLS and AUTH,
+sends one message and quits. ``SMTPPool`` keeps up to ``size`` open
+Flask-Mail connections per process instead and hands the most recently
+used one to each sender, so back-to-back messages (like the email
+worker's queue) go over one authenticated connection. A connection idle
+longer than ``check_after`` is probed with NOOP before reuse, one idle
+longer than ``max_idle`` is replaced outright, and a send that hits a
+dropped connection is retried once on a fresh one. Flask-Mail itself
+recycles a connection after ``MAIL_MAX_EMAILS`` messages.
+"""
+import logging
+import smtplib
+import threading
+import time
+
+from metrics import SMTP_OPENED, SMTP_RECONNECTS, SMTP_SENT
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """Raised when no SMTP connection frees up within the timeout."""
+
+
+class SMTPPool:
+    """Reuses authenticated Flask-Mail connections across messages."""
+
+    def __init__(self, mail, size=2, max_idle=60, check_after=5, timeout=30):
+        self.mail = mail
+        self.size = size
+        self.max_idle = max_idle
+        self.check_after = check_after
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(size)
+        # (connection, last used) pairs; the most recently used is reused first
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _open(self):
+        connection = self.mail.connect()
+        connection.__enter__()
+        SMTP_OPENED.inc()
+        return connection
+
+    def _close(self, connection):
+        host = connection.host
+        if host is None:
+            return
+        try:
+            host.quit()
+        except (smtplib.SMTPException, OSError):
+            host.close()
+
+    def _alive(self, connection):
+        if connection.host is None:
+            return True
+        try:
+            return connection.host.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _checkout(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout(f'No SMTP connection free after {self.timeout}s')
+        try:
+            while True:
+                with self._lock:
+                    if not self._idle:
+                        break
+                    connection, last_used = self._idle.pop()
+                idle = time.monotonic() - last_used
+                if idle > self.max_idle:
+                    # The server has most likely closed it already
+                    self._close(connection)
+                elif idle > self.check_after and not self._alive(connection):
+                    logger.info('Replacing stale SMTP connection')
+                    self._close(connection)
+                    SMTP_RECONNECTS.inc()
+                else:
+                    return connection
+            return self._open()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _checkin(self, connection):
+        with self._lock:
+            self._idle.append((connection, time.monotonic()))
+        self._slots.release()
+
+    def send(self, msg):
+        """Send a Flask-Mail message over a pooled connection."""
+        connection = self._checkout()
+        try:
+            try:
+                connection.send(msg)
+            except (smtplib.SMTPServerDisconnected, ConnectionError) as e:
+                # Dropped between the health check and the send; the message was not accepted
+                logger.info('SMTP connection dropped (%s), reconnecting', e)
+                self._close(connection)
+                SMTP_RECONNECTS.inc()
+                connection = self._open()
+                connection.send(msg)
+        except BaseException:
+            # After an error the session state is unknown; start the next send afresh
+            self._close(connection)
+            self._slots.release()
+            raise
+        SMTP_SENT.inc()
+        self._checkin(connection)
+
+    def close(self):
+        """Close every idle connection."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            self._close(connection)
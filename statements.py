@@ -0,0 +1,113 @@
+"""Purpose statement generation.
+
+A statement depends only on the first two picks in four categories, so
+the set of possible statements is finite: they are composed once and
+memoized. ``batch_statements`` produces statements for many stored
+assessments in one call, e.g. to regenerate them after a wording change.
+"""
+from functools import lru_cache
+
+from choices import BITS_PER_CATEGORY, CATEGORIES, CATEGORY_FIELDS
+
+# Categories the statement draws on, and the wording used when one is empty
+STATEMENT_FIELDS = ('love_activities', 'skills_natural', 'world_problems', 'natural_abilities')
+DEFAULTS = {
+    'love_activities': 'your interests',
+    'skills_natural': 'your abilities',
+    'world_problems': 'global challenges',
+    'natural_abilities': 'your work'
+}
+
+# Display labels by bit position, per category
+_LABELS_BY_BIT = {field: [label for _, label in choices] for field, choices in CATEGORIES}
+_COLUMNS = [CATEGORY_FIELDS.index(field) for field in STATEMENT_FIELDS]
+
+def generate_purpose_statement(
+    love_activities,
+    love_topics,
+    skills_natural,
+    skills_compliments,
+    world_problems,
+    world_impact,
+    natural_abilities,
+    innate_strengths
+):
+    """Generate a personalized purpose statement based on assessment choices."""
+    picks = [love_activities, skills_natural, world_problems, natural_abilities]
+    # Ensure all inputs are lists and not None
+    return compose_statement(*(
+        tuple(values[:2]) if isinstance(values, list) and values else (DEFAULTS[field],)
+        for field, values in zip(STATEMENT_FIELDS, picks)
+    ))
+
+@lru_cache(maxsize=4096)
+def compose_statement(love_activities, skills_natural, world_problems, natural_abilities):
+    """Compose the statement from up to two display labels per category."""
+    # Create personalized statement components
+    passion = f"Your passion lies in {' and '.join(love_activities[:2])}"
+    mission = f"You have natural talents in {' and '.join(skills_natural[:2])}"
+    vision = f"You're driven to address {' and '.join(world_problems[:2])}"
+    profession = f"You can create value through {' and '.join(natural_abilities[:2])}"
+    
+    # Combine into final statement
+    purpose_statement = f"""Your Ikigai reveals a unique and meaningful path: {passion}. 
+    {mission}, while {vision.lower()}. 
+    {profession}, bringing together your talents and the world's needs.
+    
+    This powerful combination suggests you could thrive in roles that combine your love for {love_activities[0].lower()} 
+    with your natural {skills_natural[0].lower()}, 
+    while addressing {world_problems[0].lower()} 
+    through {natural_abilities[0].lower()}.
+    
+    Consider exploring career paths or projects that allow you to:
+    1. Use your passion for {love_activities[0].lower()} to inspire and engage others
+    2. Apply your {skills_natural[0].lower()} to solve real-world challenges
+    3. Make a difference in {world_problems[0].lower()}
+    4. Create value through {natural_abilities[0].lower()}"""
+    
+    return purpose_statement
+
+def _first_two_labels(field, mask):
+    labels = _LABELS_BY_BIT[field]
+    picked = tuple(labels[bit] for bit in range(BITS_PER_CATEGORY) if mask >> bit & 1)[:2]
+    return picked or (DEFAULTS[field],)
+
+def statement_for_masks(masks):
+    """Statement for one assessment given its eight masks in CATEGORY_FIELDS order."""
+    return compose_statement(*(
+        _first_two_labels(field, masks[column])
+        for field, column in zip(STATEMENT_FIELDS, _COLUMNS)
+    ))
+
+def batch_statements(masks):
+    """Statements for many assessments at once.
+
+    ``masks`` is an (n, 8) array-like of category masks in CATEGORY_FIELDS
+    order (e.g. decoded from stored rows). Rows are reduced to the picks
+    the statement actually uses so each distinct statement is composed once.
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        return [statement_for_masks(row) for row in masks]
+
+    arr = np.asarray(masks, dtype=np.int64).reshape(-1, len(CATEGORY_FIELDS))
+    if not len(arr):
+        return []
+    cols = arr[:, _COLUMNS]
+    # Keep only the two lowest set bits of each mask: the first two picks
+    low = cols & -cols
+    rest = cols ^ low
+    reduced = low | (rest & -rest)
+    keys = reduced[:, 0]
+    for i in range(1, len(_COLUMNS)):
+        keys = keys | reduced[:, i] << (i * BITS_PER_CATEGORY)
+
+    unique, inverse = np.unique(keys, return_inverse=True)
+    composed = np.empty(len(unique), dtype=object)
+    for i, key in enumerate(unique.tolist()):
+        row = [0] * len(CATEGORY_FIELDS)
+        for j, column in enumerate(_COLUMNS):
+            row[column] = key >> (j * BITS_PER_CATEGORY) & 0x3F
+        composed[i] = statement_for_masks(row)
+    return composed[inverse.reshape(-1)].tolist()
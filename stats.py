@@ -0,0 +1,147 @@
+"""Incrementally maintained option frequencies and co-occurrence counts.
+
+Counters live in the ``option_stat`` table and are bumped in the same
+transaction that inserts an assessment, so reading them costs the same
+whatever the size of the assessment table. Archiving moves rows without
+changing the counts. ``rebuild`` recomputes them from scratch with one
+small GROUP BY per pair of categories, plus the same counts over the
+archive segments.
+"""
+from itertools import combinations_with_replacement
+
+from sqlalchemy import delete, func, insert, text, tuple_, update
+from sqlalchemy.exc import IntegrityError
+
+import archive
+from choices import BITS_PER_CATEGORY, CATEGORIES, CATEGORY_FIELDS
+from db_routing import reads
+from models import Assessment, OptionStat, db
+
+OPTION_COUNT = len(CATEGORIES) * BITS_PER_CATEGORY
+# Cell holding the number of assessments
+TOTAL = OPTION_COUNT
+
+def option_index(category, bit):
+    """Global option number for a category position and bit."""
+    return category * BITS_PER_CATEGORY + bit
+
+def _options(masks):
+    """Global option numbers selected in eight category masks."""
+    return [option_index(c, bit)
+            for c, mask in enumerate(masks)
+            for bit in range(BITS_PER_CATEGORY) if mask >> bit & 1]
+
+def _all_cells():
+    cells = [(i, j) for i in range(OPTION_COUNT) for j in range(i, OPTION_COUNT)]
+    cells.append((TOTAL, TOTAL))
+    return cells
+
+def ensure_seeded():
+    """Build the counters if the table is empty (new or migrated database)."""
+    if db.session.query(OptionStat.a).first() is not None:
+        return
+    try:
+        rebuild()
+    except IntegrityError:
+        # Another worker seeded the table first
+        db.session.rollback()
+
+def record_assessments(mask_rows):
+    """Add assessments to the counters in the current transaction.
+
+    ``mask_rows`` is an iterable of eight-mask sequences; the caller commits.
+    """
+    increments = {}
+    rows = 0
+    for masks in mask_rows:
+        rows += 1
+        options = _options(masks)
+        for i, a in enumerate(options):
+            for b in options[i:]:
+                increments[(a, b)] = increments.get((a, b), 0) + 1
+    if not rows:
+        return
+    increments[(TOTAL, TOTAL)] = rows
+
+    # One UPDATE per distinct increment keeps the statement count small
+    by_amount = {}
+    for cell, amount in increments.items():
+        by_amount.setdefault(amount, []).append(cell)
+    for amount, cells in by_amount.items():
+        db.session.execute(
+            update(OptionStat)
+            .where(tuple_(OptionStat.a, OptionStat.b).in_(cells))
+            .values(count=OptionStat.count + amount)
+            .execution_options(synchronize_session=False)
+        )
+
+def record_assessment(masks):
+    """Add one assessment's eight masks to the counters (caller commits)."""
+    record_assessments([masks])
+
+def _add_groups(counts, c1, c2, groups):
+    """Add ``(mask1, mask2, count)`` groups for categories c1 and c2 to ``counts``."""
+    for mask1, mask2, count in groups:
+        if c1 == c2:
+            options = [b for b in range(BITS_PER_CATEGORY) if mask1 >> b & 1]
+            for i, x in enumerate(options):
+                for y in options[i:]:
+                    counts[(option_index(c1, x), option_index(c1, y))] += count
+        else:
+            for x in range(BITS_PER_CATEGORY):
+                if not mask1 >> x & 1:
+                    continue
+                for y in range(BITS_PER_CATEGORY):
+                    if mask2 >> y & 1:
+                        counts[(option_index(c1, x), option_index(c2, y))] += count
+
+def rebuild():
+    """Recompute every counter from the assessment table and the archive."""
+    counts = dict.fromkeys(_all_cells(), 0)
+    columns = [getattr(Assessment, f'{field}_mask') for field in CATEGORY_FIELDS]
+    pairs = list(combinations_with_replacement(range(len(columns)), 2))
+
+    if db.engine.dialect.name == 'postgresql':
+        # Hold off concurrent inserts (and archive runs) so the counters match the table exactly
+        db.session.execute(text('LOCK TABLE assessment IN SHARE MODE'))
+
+    archived, archived_groups = archive.pair_counts(pairs, session=db.session)
+    counts[(TOTAL, TOTAL)] = db.session.query(func.count(Assessment.id)).scalar() + archived
+    for c1, c2 in pairs:
+        if c1 == c2:
+            groups = ((mask, mask, n) for mask, n in
+                      db.session.query(columns[c1], func.count()).group_by(columns[c1]))
+        else:
+            groups = db.session.query(columns[c1], columns[c2], func.count()).group_by(columns[c1], columns[c2])
+        _add_groups(counts, c1, c2, groups)
+        _add_groups(counts, c1, c2, archived_groups[c1, c2])
+
+    db.session.execute(delete(OptionStat))
+    db.session.execute(insert(OptionStat), [{'a': a, 'b': b, 'count': n} for (a, b), n in counts.items()])
+    db.session.commit()
+    return counts[(TOTAL, TOTAL)]
+
+def snapshot():
+    """Return the counters as a JSON-serializable dict."""
+    matrix = [[0] * OPTION_COUNT for _ in range(OPTION_COUNT)]
+    total = 0
+    for a, b, count in reads.query(OptionStat.a, OptionStat.b, OptionStat.count):
+        if a == TOTAL:
+            total = count
+        else:
+            matrix[a][b] = matrix[b][a] = count
+
+    options = []
+    frequencies = {}
+    for c, (field, choices) in enumerate(CATEGORIES):
+        frequencies[field] = {}
+        for bit, (key, label) in enumerate(choices):
+            count = matrix[option_index(c, bit)][option_index(c, bit)]
+            options.append(f'{field}:{key}')
+            frequencies[field][key] = {'label': label, 'count': count}
+
+    return {
+        'total': total,
+        'frequencies': frequencies,
+        'co_occurrence': {'options': options, 'matrix': matrix}
+    }